@@ -0,0 +1,76 @@
+import os
+import threading
+
+import cv2
+
+# Thread roles; each pipeline thread calls apply() with its role when it starts
+ROLES = ('capture', 'hands', 'faces', 'coordinates', 'cursor', 'ui')
+
+# Intra-op pools that read their size from the environment when they start
+THREAD_ENV_VARS = ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS', 'NUMEXPR_NUM_THREADS',
+                   'VECLIB_MAXIMUM_THREADS')
+
+_plan = {}
+_failures = set()
+
+
+def configure(roles):
+    """roles: {role: {'cores': [..], 'nice': n}}. Threads started afterwards are placed accordingly."""
+    _plan.clear()
+    _plan.update(roles or {})
+
+
+def limit_threads(opencv_threads=None, inference_threads=None):
+    # Environment variables only reach pools created after this point, e.g. in spawned rig workers
+    if opencv_threads is not None:
+        cv2.setNumThreads(opencv_threads)
+    if inference_threads is not None:
+        for name in THREAD_ENV_VARS:
+            os.environ[name] = str(inference_threads)
+
+
+def apply(role):
+    """Pins the calling thread to its role's cores and sets its nice value; a no-op without a plan."""
+    settings = _plan.get(role)
+    if not settings:
+        return
+    # On Linux both calls take a thread id and affect only that thread
+    tid = threading.get_native_id()
+    cores = settings.get('cores')
+    if cores and hasattr(os, 'sched_setaffinity'):
+        try:
+            os.sched_setaffinity(tid, cores)
+        except OSError as e:
+            report(role, f'cannot pin to cores {cores}: {e}')
+    nice = settings.get('nice')
+    if nice is not None and hasattr(os, 'setpriority'):
+        try:
+            os.setpriority(os.PRIO_PROCESS, tid, nice)
+        except OSError as e:
+            # Negative values need CAP_SYS_NICE
+            report(role, f'cannot set nice {nice}: {e}')
+
+
+def report(role, message):
+    if (role, message) not in _failures:
+        _failures.add((role, message))
+        print(f'Affinity ({role}): {message}')
+
+
+def validate(config, cpu_count=None):
+    errors = []
+    cpu_count = cpu_count or os.cpu_count()
+    for role, settings in config.get('roles', {}).items():
+        if role not in ROLES:
+            errors.append(f'affinity.roles.{role} is not a known role, expected one of {list(ROLES)}')
+            continue
+        if not isinstance(settings, dict) or settings.keys() - {'cores', 'nice'}:
+            errors.append(f'affinity.roles.{role} takes cores and nice')
+            continue
+        cores = settings.get('cores', [])
+        if not isinstance(cores, list) or not all(isinstance(c, int) and 0 <= c < cpu_count for c in cores):
+            errors.append(f'affinity.roles.{role}.cores must be core numbers below {cpu_count}')
+        nice = settings.get('nice', 0)
+        if not isinstance(nice, int) or not -20 <= nice <= 19:
+            errors.append(f'affinity.roles.{role}.nice must be between -20 and 19')
+    return errors
@@ -0,0 +1,179 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import affinity
+import detectors
+
+QUEUE_SIZE = 2
+
+_CLOSED = object()
+
+
+class AsyncPipeline:
+    """asyncio facade over the camera -> detector -> 3D -> cursor stages.
+
+    Cameras and Coordinates must be created with threaded=False; the pipeline drives them.
+    Blocking capture and inference run on executors so the event loop never blocks."""
+
+    def __init__(self, left_camera, right_camera, coordinates, cursor=None, queue_size=QUEUE_SIZE,
+                 inference_size=None, hand_backend=detectors.SolutionsHands, face_backend=detectors.SolutionsFaces):
+        self.left_camera = left_camera
+        self.right_camera = right_camera
+        self.coordinates = coordinates
+        self.cursor = cursor
+        self.queue_size = queue_size
+        self.inference_size = inference_size
+        self.backends = {'hands': hand_backend, 'faces': face_backend}
+
+        # MediaPipe graphs are not reentrant: one single-thread executor per model instance
+        self.capture_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='capture',
+                                                   initializer=affinity.apply, initargs=('capture',))
+        self.model_executors = {name: ThreadPoolExecutor(max_workers=1, thread_name_prefix=name,
+                                                         initializer=affinity.apply, initargs=(name.split('_')[1],))
+                                for name in ('left_hands', 'left_faces', 'right_hands', 'right_faces')}
+        self.compute_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='coordinates',
+                                                   initializer=affinity.apply, initargs=('coordinates',))
+        self.models = {}
+
+        self.subscribers = {'frames': [], 'detections': [], 'points': [], 'cursor': []}
+        self.tasks = []
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.stop()
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        models = await asyncio.gather(*(
+            loop.run_in_executor(executor, self.backends[name.split('_')[1]])
+            for name, executor in self.model_executors.items()))
+        self.models = dict(zip(self.model_executors, models))
+
+        frames = asyncio.Queue(maxsize=self.queue_size)
+        detections = asyncio.Queue(maxsize=self.queue_size)
+        points = asyncio.Queue(maxsize=self.queue_size)
+        self.tasks = [
+            asyncio.create_task(self.capture_stage(frames)),
+            asyncio.create_task(self.detect_stage(frames, detections)),
+            asyncio.create_task(self.coordinates_stage(detections, points)),
+            asyncio.create_task(self.cursor_stage(points)),
+        ]
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self.model_executors[name], model.close)
+                               for name, model in self.models.items()))
+        self.models = {}
+        # Joining executor and camera threads blocks, so do it off the loop
+        executors = [self.capture_executor, self.compute_executor, *self.model_executors.values()]
+        await asyncio.gather(*(asyncio.to_thread(executor.shutdown, wait=True) for executor in executors))
+        await asyncio.gather(asyncio.to_thread(self.left_camera.stop), asyncio.to_thread(self.right_camera.stop))
+
+        for queues in self.subscribers.values():
+            for q in queues:
+                publish_latest(q, _CLOSED)
+
+    def publish(self, topic, item):
+        # Observers never slow the pipeline; a slow observer loses its oldest items
+        for q in self.subscribers[topic]:
+            publish_latest(q, item)
+
+    async def subscribe(self, topic, maxsize):
+        q = asyncio.Queue(maxsize=maxsize)
+        self.subscribers[topic].append(q)
+        try:
+            while True:
+                item = await q.get()
+                if item is _CLOSED:
+                    return
+                yield item
+        finally:
+            self.subscribers[topic].remove(q)
+
+    def frames(self, maxsize=QUEUE_SIZE):
+        return self.subscribe('frames', maxsize)
+
+    def detections(self, maxsize=QUEUE_SIZE):
+        return self.subscribe('detections', maxsize)
+
+    def points(self, maxsize=QUEUE_SIZE):
+        return self.subscribe('points', maxsize)
+
+    def cursor_events(self, maxsize=64):
+        return self.subscribe('cursor', maxsize)
+
+    async def capture_stage(self, frames):
+        loop = asyncio.get_running_loop()
+        while True:
+            (left_ok, left), (right_ok, right) = await asyncio.gather(
+                loop.run_in_executor(self.capture_executor, self.left_camera.capture),
+                loop.run_in_executor(self.capture_executor, self.right_camera.capture))
+            if not (left_ok and right_ok):
+                continue
+            frame = {'timestamp': time.monotonic(), 'left': left, 'right': right}
+            self.publish('frames', frame)
+            await frames.put(frame)
+
+    async def detect_stage(self, frames, detections):
+        loop = asyncio.get_running_loop()
+
+        def run(name, image):
+            return loop.run_in_executor(self.model_executors[name], self.models[name].detect, image,
+                                        self.inference_size)
+
+        while True:
+            frame = await frames.get()
+            left_hands, left_faces, right_hands, right_faces = await asyncio.gather(
+                run('left_hands', frame['left']), run('left_faces', frame['left']),
+                run('right_hands', frame['right']), run('right_faces', frame['right']))
+            detection = {'timestamp': frame['timestamp'],
+                         'left': detectors.Detections(left_hands, left_faces, frame['left'], frame['left']),
+                         'right': detectors.Detections(right_hands, right_faces, frame['right'], frame['right'])}
+            self.publish('detections', detection)
+            await detections.put(detection)
+
+    async def coordinates_stage(self, detections, points):
+        loop = asyncio.get_running_loop()
+        while True:
+            detection = await detections.get()
+            hand_coords_3d, face_coords_3d = await loop.run_in_executor(
+                self.compute_executor, self.coordinates.compute, detection['left'], detection['right'])
+            point = {'timestamp': detection['timestamp'], 'hands': hand_coords_3d, 'faces': face_coords_3d}
+            self.publish('points', point)
+            await points.put(point)
+
+    async def cursor_stage(self, points):
+        if self.cursor is None:
+            while True:
+                await points.get()
+
+        loop = asyncio.get_running_loop()
+        gestures = self.cursor.subscribe_events('async gestures')
+        previous = {}
+        while True:
+            point = await points.get()
+            await loop.run_in_executor(self.compute_executor, self.cursor.step, point['timestamp'])
+            while (event := gestures.get_nowait()) is not None:
+                self.publish('cursor', {'timestamp': event.timestamp, 'mouse': event.slot, 'gesture': event})
+            for mouse_id, mouse in self.cursor.get_mice().items():
+                state = (mouse.position, mouse.pressed)
+                if previous.get(mouse_id) == state:
+                    continue
+                previous[mouse_id] = state
+                self.publish('cursor', {'timestamp': point['timestamp'], 'mouse': mouse_id,
+                                        'position': mouse.position, 'pressed': mouse.pressed})
+
+
+def publish_latest(q, item):
+    if q.full():
+        q.get_nowait()
+    q.put_nowait(item)
@@ -0,0 +1,307 @@
+import inspect
+import os
+import time
+from functools import partial
+
+import cv2
+import numpy as np
+
+try:
+    import onnxruntime
+except ImportError:
+    onnxruntime = None
+
+try:
+    import mediapipe as mp
+    from mediapipe.tasks.python import BaseOptions, vision
+except ImportError:
+    vision = None
+
+import hand_batch
+import profiling
+from detectors import (HandBackend, FaceBackend, SolutionsHands, SolutionsFaces, HandArrays, FaceArrays,
+                       NO_HANDS, NO_FACES, HAND_LANDMARKS, LEFT_HAND, RIGHT_HAND, REDETECT_FRAMES, prepare)
+
+PALM_SIZE = 192  # square input of the palm detection model
+PALM_ANCHORS = ((8, 2), (16, 6))  # (stride, anchors per cell) of palm_detection_lite / _full
+PALM_KEYPOINTS = 7
+PALM_SCALE = 2.6  # hand crop side relative to the palm box, as in MediaPipe's palm-to-hand rect
+PALM_SHIFT = 0.5  # crop centre shift from the palm towards the fingers, in palm box heights
+NMS_THRESHOLD = 0.3
+
+
+def tasks_timestamp(previous):
+    # VIDEO mode needs strictly increasing millisecond timestamps
+    return max(int(time.monotonic() * 1000), previous + 1)
+
+
+class TasksHands(HandBackend):
+    """MediaPipe Tasks HandLandmarker in video mode; model is a hand_landmarker.task bundle."""
+
+    def __init__(self, model, num_hands=4, min_detection_confidence=0.3, min_presence_confidence=0.5,
+                 min_tracking_confidence=0.5):
+        if vision is None:
+            raise RuntimeError('MediaPipe Tasks is not available, upgrade with: pip install -U mediapipe')
+        options = vision.HandLandmarkerOptions(
+            base_options=BaseOptions(model_asset_path=model),
+            running_mode=vision.RunningMode.VIDEO,
+            num_hands=num_hands,
+            min_hand_detection_confidence=min_detection_confidence,
+            min_hand_presence_confidence=min_presence_confidence,
+            min_tracking_confidence=min_tracking_confidence)
+        self.landmarker = vision.HandLandmarker.create_from_options(options)
+        self.timestamp = 0
+
+    def detect(self, image, size=None, frame=-1):
+        with profiling.span('hands prepare', frame):
+            image = mp.Image(image_format=mp.ImageFormat.SRGB, data=prepare(image, size))
+        with profiling.span('hands process', frame):
+            self.timestamp = tasks_timestamp(self.timestamp)
+            result = self.landmarker.detect_for_video(image, self.timestamp)
+        if not result.hand_landmarks:
+            return NO_HANDS
+        landmarks = np.array([[(lm.x, lm.y, lm.z) for lm in hand] for hand in result.hand_landmarks],
+                             dtype=np.float32)
+        classes = [h[0] for h in result.handedness]
+        handedness = np.array([RIGHT_HAND if c.category_name == 'Right' else LEFT_HAND for c in classes],
+                              dtype=np.int8)
+        scores = np.array([c.score for c in classes], dtype=np.float32)
+        return HandArrays(landmarks, handedness, scores)
+
+    def close(self):
+        self.landmarker.close()
+
+
+class TasksFaces(FaceBackend):
+    """MediaPipe Tasks FaceDetector in video mode; model is e.g. blaze_face_short_range.tflite."""
+
+    def __init__(self, model, min_detection_confidence=0.5):
+        if vision is None:
+            raise RuntimeError('MediaPipe Tasks is not available, upgrade with: pip install -U mediapipe')
+        options = vision.FaceDetectorOptions(
+            base_options=BaseOptions(model_asset_path=model),
+            running_mode=vision.RunningMode.VIDEO,
+            min_detection_confidence=min_detection_confidence)
+        self.detector = vision.FaceDetector.create_from_options(options)
+        self.timestamp = 0
+
+    def detect(self, image, size=None, frame=-1):
+        with profiling.span('faces prepare', frame):
+            rgb = prepare(image, size)
+            image = mp.Image(image_format=mp.ImageFormat.SRGB, data=rgb)
+        with profiling.span('faces process', frame):
+            self.timestamp = tasks_timestamp(self.timestamp)
+            result = self.detector.detect_for_video(image, self.timestamp)
+        if not result.detections:
+            return NO_FACES
+        h, w = rgb.shape[:2]
+        keypoints = np.array([[(kp.x, kp.y) for kp in d.keypoints] for d in result.detections], dtype=np.float32)
+        # Tasks boxes are in pixels
+        boxes = np.array([(b.origin_x / w, b.origin_y / h, b.width / w, b.height / h)
+                          for b in (d.bounding_box for d in result.detections)], dtype=np.float32)
+        scores = np.array([d.categories[0].score for d in result.detections], dtype=np.float32)
+        return FaceArrays(keypoints, boxes, scores)
+
+    def close(self):
+        self.detector.close()
+
+
+def session(model, intra_op_threads, inter_op_threads):
+    if onnxruntime is None:
+        raise RuntimeError('onnxruntime is not installed, install it with: pip install onnxruntime')
+    options = onnxruntime.SessionOptions()
+    options.intra_op_num_threads = intra_op_threads
+    options.inter_op_num_threads = inter_op_threads
+    options.execution_mode = onnxruntime.ExecutionMode.ORT_SEQUENTIAL
+    options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+    return onnxruntime.InferenceSession(model, sess_options=options, providers=['CPUExecutionProvider'])
+
+
+def output_positions(model, size, count, path):
+    """Positions of the first count outputs whose last dimension is size.
+
+    Output names differ between exports of the same model, so outputs are told apart by shape."""
+    positions = [i for i, o in enumerate(model.get_outputs()) if o.shape[-1] == size]
+    if len(positions) < count:
+        raise RuntimeError(f'{path} does not have {count} output(s) of size {size}')
+    return positions[:count]
+
+
+def run_nhwc(model, images):
+    """Runs float NHWC images through a session whose input is NHWC or NCHW, with any batch size.
+    Returns the outputs in model order."""
+    source = model.get_inputs()[0]
+    if source.shape[1] == 3:
+        images = images.transpose(0, 3, 1, 2)
+    images = np.ascontiguousarray(images, dtype=np.float32)
+    names = [o.name for o in model.get_outputs()]
+    # Exports with a fixed batch of one run image by image
+    if source.shape[0] == 1 and len(images) > 1:
+        results = [model.run(names, {source.name: images[i:i + 1]}) for i in range(len(images))]
+        return [np.concatenate(outputs) for outputs in zip(*results)]
+    return model.run(names, {source.name: images})
+
+
+def palm_anchors():
+    centres = []
+    for stride, count in PALM_ANCHORS:
+        cells = PALM_SIZE // stride
+        y, x = np.mgrid[0:cells, 0:cells]
+        grid = np.stack([(x + 0.5) / cells, (y + 0.5) / cells], axis=-1).reshape(-1, 1, 2)
+        centres.append(np.repeat(grid, count, axis=1).reshape(-1, 2))
+    return np.concatenate(centres).astype(np.float32)
+
+
+class OnnxHands(HandBackend):
+    """ONNX Runtime palm detector plus hand landmark model, e.g. quantised exports of MediaPipe's
+    palm_detection_lite and hand_landmark_lite.
+
+    Like MediaPipe's tracking mode, hands found in the previous frame are cropped from their
+    landmarks and the palm detector only runs when a hand is lost or every redetect_frames frames.
+    All crops of a frame go through the landmark model in one batch."""
+
+    def __init__(self, palm_model, landmark_model, intra_op_threads=1, inter_op_threads=1, max_hands=4,
+                 min_detection_confidence=0.5, min_presence_confidence=0.5, redetect_frames=REDETECT_FRAMES):
+        self.palm = session(palm_model, intra_op_threads, inter_op_threads)
+        self.landmarks = session(landmark_model, intra_op_threads, inter_op_threads)
+        # Palm: box and keypoint regressors, scores. Landmarks: landmarks, presence, handedness, world landmarks.
+        self.palm_outputs = (output_positions(self.palm, 4 + 2 * PALM_KEYPOINTS, 1, palm_model) +
+                             output_positions(self.palm, 1, 1, palm_model))
+        self.landmark_outputs = (output_positions(self.landmarks, HAND_LANDMARKS * 3, 1, landmark_model) +
+                                 output_positions(self.landmarks, 1, 2, landmark_model))
+        self.anchors = palm_anchors()
+        self.max_hands = max_hands
+        self.min_detection_confidence = min_detection_confidence
+        self.min_presence_confidence = min_presence_confidence
+        self.redetect_frames = redetect_frames
+        self.previous = NO_HANDS
+        self.tracked = 0
+
+    def detect(self, image, size=None, frame=-1):
+        with profiling.span('hands prepare', frame):
+            rgb = prepare(image, size)
+        h, w = rgb.shape[:2]
+        with profiling.span('hands process', frame):
+            if len(self.previous.landmarks) and self.tracked < self.redetect_frames:
+                hands = self.track(rgb, hand_batch.rois_from_landmarks(self.previous.landmarks, w, h))
+                self.tracked += 1
+                if len(hands.landmarks) < len(self.previous.landmarks):
+                    hands = self.track(rgb, self.detect_palms(rgb))
+                    self.tracked = 0
+            else:
+                hands = self.track(rgb, self.detect_palms(rgb))
+                self.tracked = 0
+        self.previous = hands
+        return hands
+
+    def detect_palms(self, rgb):
+        # Letterboxed to a square so the model sees undistorted palms
+        h, w = rgb.shape[:2]
+        side = max(h, w)
+        square = np.zeros((side, side, 3), np.uint8)
+        square[:h, :w] = rgb
+        resized = cv2.resize(square, (PALM_SIZE, PALM_SIZE), interpolation=cv2.INTER_AREA)
+        outputs = run_nhwc(self.palm, resized[None] / np.float32(255))
+        regressors, scores = (outputs[i] for i in self.palm_outputs)
+        regressors = regressors.reshape(-1, 4 + 2 * PALM_KEYPOINTS)
+        scores = 1 / (1 + np.exp(-np.clip(scores.reshape(-1), -100, 100)))
+        keep = np.flatnonzero(scores >= self.min_detection_confidence)
+        if not len(keep):
+            return np.zeros((0, 3), np.float32)
+
+        # Normalised to the square: centre, size and keypoints relative to each anchor
+        centres = self.anchors[keep] + regressors[keep, :2] / PALM_SIZE
+        sizes = regressors[keep, 2:4] / PALM_SIZE
+        keypoints = self.anchors[keep, None] + regressors[keep, 4:].reshape(-1, PALM_KEYPOINTS, 2) / PALM_SIZE
+        boxes = np.column_stack([centres - sizes / 2, sizes]) * side
+        chosen = np.asarray(cv2.dnn.NMSBoxes(boxes.tolist(), scores[keep].tolist(),
+                                             self.min_detection_confidence, NMS_THRESHOLD), dtype=np.intp)
+        chosen = chosen.reshape(-1)[:self.max_hands]
+
+        # Axis-aligned crop shifted from the wrist (keypoint 0) towards the middle finger (keypoint 2)
+        direction = keypoints[chosen, 2] - keypoints[chosen, 0]
+        direction /= np.maximum(np.linalg.norm(direction, axis=1, keepdims=True), 1e-6)
+        box_sizes = sizes[chosen] * side
+        centre = centres[chosen] * side + direction * box_sizes[:, 1:] * PALM_SHIFT
+        crop_side = box_sizes.max(axis=1) * PALM_SCALE
+        return np.column_stack([centre, crop_side]).astype(np.float32)
+
+    def track(self, rgb, rois):
+        if not len(rois):
+            return NO_HANDS
+        h, w = rgb.shape[:2]
+        crops = hand_batch.crop(rgb, rois)
+        outputs = run_nhwc(self.landmarks, crops / np.float32(255))
+        landmarks, presence, handedness = (outputs[i] for i in self.landmark_outputs)
+        landmarks = landmarks.reshape(len(rois), HAND_LANDMARKS, 3)
+        presence = presence.reshape(-1)
+        handedness = handedness.reshape(-1)
+        found = presence >= self.min_presence_confidence
+        if not found.any():
+            return NO_HANDS
+        right = handedness[found]
+        return HandArrays(hand_batch.to_image(landmarks[found], rois[found], w, h),
+                          np.where(right > 0.5, RIGHT_HAND, LEFT_HAND).astype(np.int8),
+                          np.maximum(right, 1 - right).astype(np.float32))
+
+
+class YuNetFaces(FaceBackend):
+    """OpenCV DNN face detector (YuNet, e.g. face_detection_yunet_2023mar.onnx).
+
+    YuNet gives five keypoints; the mouth corners are averaged into the mouth centre and the two
+    ear keypoints MediaPipe reports are placed on the box edges at eye height."""
+
+    def __init__(self, model, score_threshold=0.6, nms_threshold=0.3, top_k=50):
+        self.detector = cv2.FaceDetectorYN.create(model, '', (320, 320), score_threshold, nms_threshold, top_k)
+        self.input_size = None
+
+    def detect(self, image, size=None, frame=-1):
+        with profiling.span('faces prepare', frame):
+            if size is not None and (image.shape[1], image.shape[0]) != tuple(size):
+                image = cv2.resize(image, tuple(size), interpolation=cv2.INTER_AREA)
+        h, w = image.shape[:2]
+        with profiling.span('faces process', frame):
+            if self.input_size != (w, h):
+                self.detector.setInputSize((w, h))
+                self.input_size = (w, h)
+            _, faces = self.detector.detect(image)
+        if faces is None or not len(faces):
+            return NO_FACES
+        boxes = faces[:, :4]
+        points = faces[:, 4:14].reshape(-1, 5, 2)
+        eye_y = points[:, :2, 1].mean(axis=1)
+        keypoints = np.stack([points[:, 0], points[:, 1], points[:, 2], points[:, 3:5].mean(axis=1),
+                              np.column_stack([boxes[:, 0], eye_y]),
+                              np.column_stack([boxes[:, 0] + boxes[:, 2], eye_y])], axis=1)
+        scale = np.array([w, h], np.float32)
+        return FaceArrays((keypoints / scale).astype(np.float32),
+                          (boxes / np.tile(scale, 2)).astype(np.float32), faces[:, 14].astype(np.float32))
+
+
+HAND_BACKENDS = {'solutions': SolutionsHands, 'tasks': TasksHands, 'onnx': OnnxHands}
+FACE_BACKENDS = {'solutions': SolutionsFaces, 'tasks': TasksFaces, 'yunet': YuNetFaces}
+
+
+def factory(settings, registry):
+    """{'type': name, **options} -> zero-argument callable creating the backend."""
+    options = dict(settings)
+    return partial(registry[options.pop('type')], **options)
+
+
+def validate(name, settings, registry):
+    """Errors for a backend config section: unknown type, unknown options, or missing model files."""
+    if not isinstance(settings, dict) or settings.get('type') not in registry:
+        return [f'{name}.type must be one of {list(registry)}']
+    errors = []
+    parameters = inspect.signature(registry[settings['type']]).parameters
+    for key, value in settings.items():
+        if key == 'type':
+            continue
+        if key not in parameters:
+            errors.append(f'{name}.{key} is not an option of the {settings["type"]} backend')
+        elif key.endswith('model') and not (isinstance(value, str) and os.path.exists(value)):
+            errors.append(f'{name}.{key}: {value} does not exist')
+    for key, parameter in parameters.items():
+        if parameter.default is inspect.Parameter.empty and key not in settings:
+            errors.append(f'{name}.{key} is needed by the {settings["type"]} backend')
+    return errors
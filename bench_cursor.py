@@ -0,0 +1,120 @@
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+import pipeline
+import synthetic
+
+# Usage: python bench_cursor.py [frames] [history file]
+# Sweeps people and hands per person over a synthetic scene and times one cursor tick:
+# Coordinates.getOnScrenPixels (screen mapping) plus Cursor.step (association and gestures).
+# 'mapped' is the mean number of hands that reached the screen mapping, and 'us/hand' the tick per mapped hand.
+# Every run is appended to the history file and its per-hand tick compared with the latest earlier run.
+
+PEOPLE = (1, 2, 4, 8, 12, 16, 20)
+HANDS_PER_PERSON = (1, 2)
+FRAMES = 200
+WARMUP_FRAMES = 10  # track confirmation and first-call allocations are not timed
+HISTORY_FILE = 'bench_history.jsonl'
+# Everyone stands on a grid at one depth. Coordinates pairs the two views by sorted wrist x, and mixed
+# depths swap that order; even on the grid hands at different reach still swap now and then, so not
+# every hand reaches the mapping and the per-hand cost is what runs are compared on.
+GRID_DEPTH = 2.8
+REGRESSION = 1.25  # a per-hand tick this many times slower than the previous run is flagged
+
+
+def commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_case(config, people, hands_per_person, frames):
+    scene = synthetic.scene_from_config(config, people=people, hands_per_person=hands_per_person,
+                                        depth=(GRID_DEPTH, GRID_DEPTH), grid=True)
+    coords = synthetic.coordinates_from_config(config, scene)
+    # One mouse per hand, so association runs at full size
+    cursor = synthetic.cursor_from_config(config, coords, mice=people * hands_per_person)
+
+    # Detections are generated up front so only the pipeline stages are timed
+    inputs = [scene.frame(index) for index in range(frames + WARMUP_FRAMES)]
+    triangulation, screen, step, hands = [], [], [], []
+    for frame in inputs:
+        start = time.perf_counter()
+        coords.compute(frame.left, frame.right)
+        triangulated = time.perf_counter()
+        pixels = coords.getOnScrenPixels()
+        mapped = time.perf_counter()
+        cursor.step(frame.timestamp)
+        stepped = time.perf_counter()
+        if frame.index >= WARMUP_FRAMES:
+            triangulation.append((triangulated - start) * 1000)
+            screen.append((mapped - triangulated) * 1000)
+            step.append((stepped - mapped) * 1000)
+            hands.append(len(pixels))
+
+    tick = np.add(screen, step)
+    return {'people': people, 'hands_per_person': hands_per_person, 'frames': frames,
+            'screen_hands': float(np.mean(hands)),
+            'hand_us': float(tick.sum() * 1000 / max(np.sum(hands), 1)),
+            'triangulation_ms': float(np.mean(triangulation)),
+            'screen_ms': float(np.mean(screen)), 'cursor_ms': float(np.mean(step)),
+            'tick_ms': float(tick.mean()), 'tick_p95_ms': float(np.percentile(tick, 95))}
+
+
+def load_history(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def compare(result, previous):
+    for old in previous['results']:
+        if (old['people'], old['hands_per_person']) == (result['people'], result['hands_per_person']):
+            if 'hand_us' not in old:
+                return ''
+            ratio = result['hand_us'] / max(old['hand_us'], 1e-9)
+            flag = '  REGRESSION' if ratio > REGRESSION else ''
+            return f"{ratio:5.2f}x vs {previous.get('commit') or 'previous'}{flag}"
+    return ''
+
+
+def main():
+    frames = int(sys.argv[1]) if len(sys.argv) > 1 else FRAMES
+    history_file = sys.argv[2] if len(sys.argv) > 2 else HISTORY_FILE
+    config = pipeline.load_config()
+    history = load_history(history_file)
+    previous = history[-1] if history else None
+
+    print(f"{'people':>6} {'hands':>5} {'mapped':>6} {'3D ms':>7} {'screen ms':>9} {'cursor ms':>9} "
+          f"{'tick ms':>8} {'p95 ms':>7} {'us/hand':>7}")
+    results = []
+    for people in PEOPLE:
+        for hands_per_person in HANDS_PER_PERSON:
+            result = run_case(config, people, hands_per_person, frames)
+            results.append(result)
+            line = (f"{people:>6} {people * hands_per_person:>5} {result['screen_hands']:>6.1f} "
+                    f"{result['triangulation_ms']:>7.3f} {result['screen_ms']:>9.3f} {result['cursor_ms']:>9.3f} "
+                    f"{result['tick_ms']:>8.3f} {result['tick_p95_ms']:>7.3f} {result['hand_us']:>7.1f}")
+            if previous is not None:
+                line += '  ' + compare(result, previous)
+            print(line)
+
+    entry = {'time': datetime.datetime.now().isoformat(timespec='seconds'), 'commit': commit(),
+             'python': platform.python_version(), 'machine': platform.machine(), 'results': results}
+    with open(history_file, 'a') as f:
+        f.write(json.dumps(entry) + '\n')
+    print(f'Appended to {history_file} ({len(history) + 1} runs)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+import json
+import sys
+import time
+
+import cv2
+import numpy as np
+
+import backends
+import pipeline
+
+# Usage: python bench_detectors.py RECORDING [KIND:SETTINGS ...]
+#   RECORDING  a video file or image sequence pattern (e.g. frames/%04d.png) that OpenCV can read
+#   KIND       hands or faces; SETTINGS is a backend section as JSON, e.g.
+#              'hands:{"type": "onnx", "palm_model": "palm.onnx", "landmark_model": "hand.onnx"}'
+# Without backends, the solutions backends are compared with the ones in config.json.
+# The first backend of each kind is the reference the others are compared against.
+
+MAX_FRAMES = 300
+WARMUP_FRAMES = 5  # model loading and first-call allocation are not timed
+
+
+def load_frames(path, limit=MAX_FRAMES):
+    capture = cv2.VideoCapture(path)
+    frames = []
+    while len(frames) < limit:
+        ok, frame = capture.read()
+        if not ok:
+            break
+        frames.append(frame)
+    capture.release()
+    return frames
+
+
+def parse(argument):
+    kind, _, settings = argument.partition(':')
+    settings = json.loads(settings) if settings.startswith('{') else {'type': settings}
+    return kind, settings
+
+
+def run_backend(kind, settings, frames, size):
+    registry = backends.HAND_BACKENDS if kind == 'hands' else backends.FACE_BACKENDS
+    times = []
+    results = []
+    with backends.factory(settings, registry)() as backend:
+        for index, frame in enumerate(frames):
+            start = time.perf_counter()
+            found = backend.detect(frame, size, index)
+            if index >= min(WARMUP_FRAMES, len(frames) - 1):
+                times.append((time.perf_counter() - start) * 1000)
+            results.append(found)
+    return np.array(times), results
+
+
+def points(kind, result):
+    # (N, K, 2) normalised points to compare between backends
+    return result.landmarks[:, :, :2] if kind == 'hands' else result.keypoints
+
+
+def agreement(kind, reference, results, width, height):
+    """Mean pixel distance of matched detections, and the fraction of reference detections matched."""
+    distances = []
+    matched = 0
+    total = 0
+    for ref, res in zip(reference, results):
+        ref_points = points(kind, ref) * (width, height)
+        res_points = points(kind, res) * (width, height)
+        total += len(ref_points)
+        if not len(ref_points) or not len(res_points):
+            continue
+        # Greedy nearest match on the mean point of each detection
+        cost = np.linalg.norm(ref_points.mean(axis=1)[:, None] - res_points.mean(axis=1)[None], axis=2)
+        while np.isfinite(cost).any():
+            i, j = np.unravel_index(np.argmin(cost), cost.shape)
+            distances.append(np.linalg.norm(ref_points[i] - res_points[j], axis=1).mean())
+            matched += 1
+            cost[i, :] = np.inf
+            cost[:, j] = np.inf
+    return (float(np.mean(distances)) if distances else float('nan')), matched / max(total, 1)
+
+
+def main():
+    if len(sys.argv) < 2:
+        print('Usage: python bench_detectors.py RECORDING [KIND:SETTINGS ...]')
+        sys.exit(1)
+    frames = load_frames(sys.argv[1])
+    if not frames:
+        print(f'No frames could be read from {sys.argv[1]}')
+        sys.exit(1)
+    height, width = frames[0].shape[:2]
+
+    candidates = [parse(argument) for argument in sys.argv[2:]]
+    config = pipeline.load_config()
+    if not candidates:
+        candidates = [('hands', {'type': 'solutions'}), ('hands', config['detector']['hands']),
+                      ('faces', {'type': 'solutions'}), ('faces', config['detector']['faces'])]
+    inference = config['inference']
+    size = None if inference['width'] is None else (inference['width'], inference['height'])
+    errors = [e for kind, settings in candidates
+              for e in backends.validate(kind, settings, backends.HAND_BACKENDS if kind == 'hands'
+                                         else backends.FACE_BACKENDS)]
+    if errors:
+        print('Invalid backends:\n  ' + '\n  '.join(errors))
+        sys.exit(1)
+
+    print(f'{len(frames)} frames of {width}x{height}, inference at '
+          f'{"frame size" if size is None else "%dx%d" % size}')
+    references = {}
+    for kind, settings in candidates:
+        times, results = run_backend(kind, settings, frames, size)
+        reference = references.setdefault(kind, results)
+        error, recall = agreement(kind, reference, results, width, height)
+        found = sum(len(points(kind, r)) for r in results) / len(results)
+        print(f'{kind:<5} {json.dumps(settings)}')
+        print(f'      {np.mean(times):.2f} ms mean  {np.percentile(times, 50):.2f} p50  '
+              f'{np.percentile(times, 95):.2f} p95  {1000 / np.mean(times):.1f} FPS  '
+              f'{found:.2f} per frame  {error:.2f} px from reference  {recall * 100:.0f}% matched')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+import hashlib
+import os
+from threading import Lock
+from typing import NamedTuple
+
+import cv2
+import numpy as np
+
+CACHE_DIR = '.calibration_cache'
+
+
+class Calibration(NamedTuple):
+    camera_matrix: np.ndarray
+    dist: np.ndarray
+    new_camera_matrix: np.ndarray
+    roi: np.ndarray
+    mapx: np.ndarray
+    mapy: np.ndarray
+
+
+# Parsed results are shared within the process too, e.g. between Camera and Coordinates
+_loaded = {}
+_lock = Lock()
+
+
+def file_hash(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()[:16]
+
+
+def parse_coefficients(calibration_file):
+    cv_file = cv2.FileStorage(calibration_file, cv2.FILE_STORAGE_READ)
+    camera_matrix = cv_file.getNode("K").mat()
+    dist_matrix = cv_file.getNode("D").mat()
+    cv_file.release()
+    return camera_matrix, dist_matrix
+
+
+def cache_path(calibration_file, key, cache_dir):
+    name = os.path.splitext(os.path.basename(calibration_file))[0]
+    return os.path.join(cache_dir, f'{name}-{key}.npz')
+
+
+def read_cache(path):
+    try:
+        with np.load(path) as data:
+            return {name: data[name] for name in data.files}
+    except (OSError, ValueError):
+        return None
+
+
+def write_cache(path, arrays):
+    # Written under a temporary name first so a concurrent reader never sees half a file
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(tmp, path)
+    except OSError as e:
+        print(f'Could not write calibration cache {path}: {e}')
+
+
+def cached(calibration_file, key, compute, cache_dir):
+    path = cache_path(calibration_file, key, cache_dir)
+    with _lock:
+        if path in _loaded:
+            return _loaded[path]
+    arrays = read_cache(path)
+    if arrays is None:
+        arrays = compute()
+        write_cache(path, arrays)
+    with _lock:
+        _loaded[path] = arrays
+    return arrays
+
+
+def load_coefficients(calibration_file, cache_dir=CACHE_DIR):
+    """Camera matrix and distortion coefficients, parsed once per calibration file content."""
+    def compute():
+        camera_matrix, dist = parse_coefficients(calibration_file)
+        return {'camera_matrix': camera_matrix, 'dist': dist}
+
+    arrays = cached(calibration_file, file_hash(calibration_file), compute, cache_dir)
+    return [arrays['camera_matrix'], arrays['dist']]
+
+
+def load_calibration(calibration_file, width, height, alpha=1, cache_dir=CACHE_DIR):
+    """Coefficients plus the undistortion remap tables, keyed by file hash, image size and alpha."""
+    def compute():
+        camera_matrix, dist = load_coefficients(calibration_file, cache_dir)
+        new_camera_matrix, roi = cv2.getOptimalNewCameraMatrix(
+            camera_matrix, dist, (width, height), alpha, (width, height))
+        mapx, mapy = cv2.initUndistortRectifyMap(
+            camera_matrix, dist, None, new_camera_matrix, (width, height), cv2.CV_32FC1)
+        return {'camera_matrix': camera_matrix, 'dist': dist, 'new_camera_matrix': new_camera_matrix,
+                'roi': np.array(roi), 'mapx': mapx, 'mapy': mapy}
+
+    key = f'{file_hash(calibration_file)}-{width}x{height}-a{alpha}'
+    arrays = cached(calibration_file, key, compute, cache_dir)
+    return Calibration(**arrays)
@@ -0,0 +1,107 @@
+import collections
+import time
+from threading import Condition
+from typing import Generic, Optional, TypeVar
+
+T = TypeVar('T')
+
+LATEST = 'latest'
+BLOCK = 'block'
+DROP_OLDEST = 'drop_oldest'
+POLICIES = (LATEST, BLOCK, DROP_OLDEST)
+
+
+class Channel(Generic[T]):
+    """Bounded single-consumer channel between two pipeline stages.
+
+    latest: a put replaces everything still queued. block: a put waits for room.
+    drop_oldest: a put on a full channel evicts the oldest item."""
+
+    def __init__(self, name, capacity=1, policy=LATEST):
+        if policy not in POLICIES:
+            raise ValueError(f'Unknown channel policy {policy!r}, expected one of {POLICIES}')
+        if capacity < 1:
+            raise ValueError(f'Channel capacity must be at least 1, got {capacity}')
+        self.name = name
+        self.capacity = capacity
+        self.policy = policy
+
+        self.items = collections.deque()
+        self.condition = Condition()
+        self.closed = False
+
+        self.produced = 0
+        self.consumed = 0
+        self.dropped = 0
+        self.total_lag = 0.0
+        self.max_lag = 0.0
+
+    def put(self, item: T, timeout=None) -> bool:
+        with self.condition:
+            if self.closed:
+                return False
+            if self.policy == LATEST:
+                self.dropped += len(self.items)
+                self.items.clear()
+            elif len(self.items) >= self.capacity:
+                if self.policy == DROP_OLDEST:
+                    self.items.popleft()
+                    self.dropped += 1
+                elif not self.condition.wait_for(
+                        lambda: len(self.items) < self.capacity or self.closed, timeout):
+                    self.dropped += 1
+                    return False
+                elif self.closed:
+                    return False
+
+            self.items.append((time.monotonic(), item))
+            self.produced += 1
+            self.condition.notify_all()
+            return True
+
+    def get(self, timeout=None) -> Optional[T]:
+        """Next item, or None on timeout or once closed and drained."""
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.items or self.closed, timeout):
+                return None
+            if not self.items:
+                return None
+            timestamp, item = self.items.popleft()
+            self.consumed += 1
+            lag = time.monotonic() - timestamp
+            self.total_lag += lag
+            self.max_lag = max(self.max_lag, lag)
+            self.condition.notify_all()
+            return item
+
+    def get_nowait(self) -> Optional[T]:
+        return self.get(timeout=0)
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def stats(self):
+        with self.condition:
+            return {
+                'name': self.name,
+                'policy': self.policy,
+                'capacity': self.capacity,
+                'depth': len(self.items),
+                'produced': self.produced,
+                'consumed': self.consumed,
+                'dropped': self.dropped,
+                'mean_lag_ms': 1000 * self.total_lag / self.consumed if self.consumed else 0.0,
+                'max_lag_ms': 1000 * self.max_lag,
+            }
+
+
+def format_stats(channels):
+    lines = []
+    for channel in channels:
+        s = channel.stats()
+        lines.append(f"{s['name']:<24} {s['policy']:<12} depth {s['depth']}/{s['capacity']} "
+                     f"produced {s['produced']} consumed {s['consumed']} dropped {s['dropped']} "
+                     f"lag {s['mean_lag_ms']:.1f}/{s['max_lag_ms']:.1f} ms")
+    return '\n'.join(lines)
@@ -1,43 +1,80 @@
 import math
+from typing import NamedTuple
+import numpy as np
 from utils import Point2D, Point3D
-from utils import Calculate
+from utils import Calculate, MIN_DEPTH, MAX_DEPTH
+from tracking import MultiTracker
+from screens import Screen, ScreenLayout
+from channels import Channel, LATEST
+from snapshots import Publisher, Snapshot, frozen
+from handfit import fit_hands, WRIST, THUMB_TIP, INDEX_TIP, MIDDLE_TIP
+import affinity
+import calibration
 import detectors
+import profiling
 import stream
-from threading import Thread
+from threading import Thread, Lock
 import cv2
 import time
 
 FPS_MS = 0.033
 
-WRIST = 0
-HAND_INDEX = 4
-HAND_THUMB = 8
 RIGHT_EYE = 0
 LEFT_EYE = 1
 
 BASELINE_DISTANCE=0.30
 
-HAND_FILTER = [WRIST, HAND_INDEX, HAND_THUMB]
 FACE_FILTER = [RIGHT_EYE, LEFT_EYE]
 
 MAX_FACE_DIST = 1.2
 
-MONITOR_WIDTH = 1920
+# Landmarks whose disparity the optional StereoRefiner improves
+REFINE_LANDMARKS = [THUMB_TIP, INDEX_TIP, MIDDLE_TIP]
+REFINE_PRIORITY = [0, 0, 1]  # pinch tips, like eye midpoints, are refined before middle tips when over budget
+
+# A hand pair needs its wrist and at least this many landmarks to triangulate plausibly
+MIN_VALID_LANDMARKS = 11
+
+
+class Points3D(NamedTuple):
+    hands: object
+    faces: object
+
 
 class Coordinates:
     def __init__(self, left_detector, right_detector, image_width, image_height, calibration_file,
-                 camera_x_offset, camera_y_offset, camera_z_offset,
-                 physical_width, physical_height, pixel_width, pixel_height):
+                 camera_x_offset=0.0, camera_y_offset=0.0, camera_z_offset=0.0,
+                 physical_width=None, physical_height=None, pixel_width=None, pixel_height=None, screens=None,
+                 threaded=True, refiner=None, min_depth=MIN_DEPTH, max_depth=MAX_DEPTH, disparity_sign=0):
         self.left_detector = left_detector
         self.right_detector = right_detector
         self.image_width = image_width
         self.image_height = image_height
+        self.image_size = np.array([image_width, image_height], dtype=np.float32)
 
         self.left_results = None
         self.right_results = None
 
-        self.hand_coords_3d = None
-        self.face_coords_3d = None
+        # Each new stereo pair is a generation; 3D points and screen pixels are computed lazily,
+        # at most once per generation, when a consumer asks for them
+        self.inputs = Publisher()
+        self.coords_3d = Snapshot(0, time.monotonic(), Points3D(frozen({}), frozen({})))
+        self.pixels = Snapshot(0, time.monotonic(), [])
+        self.compute_lock = Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+        self.hand_tracker = MultiTracker()
+        self.face_tracker = MultiTracker()
+        # Confirmed hand tracks as of the latest generation, read by the detector threads for ROIs.
+        # Tracks only advance when 3D points are computed, so ROI users set track_every_generation
+        # to have the update thread compute every generation even when no consumer pulls it.
+        self.hand_tracks = ()
+        self.track_every_generation = False
+        self.refiner = refiner
+        # Pairs dropped by the validated triangulation in the latest generation, and in total
+        self.rejections = {'landmarks': 0, 'hands': 0, 'faces': 0}
+        self.rejections_total = dict(self.rejections)
 
         self.camera_x_offset = camera_x_offset
         self.camera_y_offset = camera_y_offset
@@ -47,8 +84,16 @@ class Coordinates:
         self.pixel_width = pixel_width
         self.pixel_height = pixel_height
 
+        # Without an explicit layout, the single screen is described by the offsets and inch size.
+        # Rig workers that only produce 3D points have no screen at all.
+        if screens is None and physical_width is not None:
+            screens = [Screen.from_camera_offset(camera_x_offset, camera_y_offset, camera_z_offset,
+                                                 physical_width, physical_height, pixel_width, pixel_height)]
+        if screens is not None and not isinstance(screens, ScreenLayout):
+            screens = ScreenLayout(screens)
+        self.screens = screens
 
-        camera_matrix_left, _ = self.load_coefficients(calibration_file)
+        camera_matrix_left, _ = calibration.load_coefficients(calibration_file)
         fx = camera_matrix_left[0, 0]
         fy = camera_matrix_left[1, 1]
         cx = camera_matrix_left[0, 2]
@@ -59,169 +104,278 @@ class Coordinates:
             focal_length_y=fy,
             baseline_distance=BASELINE_DISTANCE,
             c_x=cx,
-            c_y=cy
+            c_y=cy,
+            min_depth=min_depth,
+            max_depth=max_depth,
+            disparity_sign=disparity_sign
         )
 
-        self.running = True
-        Thread(target=self.update, args=(), daemon=True).start()
+        self.channels = []
 
-    def load_coefficients(self, calibration_file):
-        cv_file = cv2.FileStorage(calibration_file, cv2.FILE_STORAGE_READ)
-        camera_matrix = cv_file.getNode("K").mat()
-        dist_matrix = cv_file.getNode("D").mat()
-        cv_file.release()
-        return [camera_matrix, dist_matrix]
+        self.running = True
+        self.thread = None
+        if threaded:
+            self.left_channel = left_detector.subscribe('left detections')
+            self.right_channel = right_detector.subscribe('right detections')
+            self.thread = Thread(target=self.update, args=(), daemon=True)
+            self.thread.start()
 
     def update(self):
+        affinity.apply('coordinates')
         while self.running:
-            time.sleep(FPS_MS)
-            self.left_results = self.left_detector.get_results().copy()
-            self.right_results = self.right_detector.get_results().copy()
-            self.process_stereo_detections()
+            left_snapshot = self.left_channel.get(timeout=FPS_MS)
+            right_snapshot = self.right_channel.get_nowait()
+            if left_snapshot is None and right_snapshot is None:
+                continue
+            # Pair each new detection with the latest one from the other camera
+            if left_snapshot is not None:
+                self.left_results = left_snapshot.data
+            if right_snapshot is not None:
+                self.right_results = right_snapshot.data
+            if self.left_results is None or self.right_results is None:
+                continue
+            with profiling.span('stereo pairing', self.inputs.read().version + 1):
+                self.inputs.publish((self.left_results, self.right_results))
+                self.publish()
+            if self.track_every_generation:
+                self.snapshot_3d()
             #print(self.get3DCoordinates())
 
+    def compute(self, left_results, right_results):
+        self.left_results = left_results
+        self.right_results = right_results
+        self.inputs.publish((left_results, right_results))
+        self.publish()
+        return self.get3DCoordinates()
+
+    def subscribe(self, name, capacity=1, policy=LATEST):
+        channel = Channel(name, capacity, policy)
+        self.channels.append(channel)
+        return channel
+
+    def publish(self):
+        # Consumers get the input generation and pull the (lazily computed) results they need
+        snapshot = self.inputs.read()
+        for channel in self.channels:
+            channel.put(snapshot)
+
+    def stop(self):
+        self.running = False
+        for channel in self.channels:
+            channel.close()
+        if self.thread is not None:
+            self.thread.join(timeout=1.0)
+
     def sort_hands(self, hands):
-        if not hands:
-            return []
-        return sorted(hands, key=lambda hand: hand.landmark[WRIST].x)
+        order = np.argsort(hands.landmarks[:, WRIST, 0], kind='stable')
+        return detectors.HandArrays(*(field[order] for field in hands))
 
     def sort_face(self, faces):
-        if not faces:
-            return []
-        return sorted(faces, key=lambda face: face.location_data.relative_keypoints[LEFT_EYE].x)
-
-    def calculate_hand_3d_coordinates(self, hand_left, hand_right):
-        coords_3d = {}
-        landmark_names = {
-            0: 'wrist',
-            4: 'thumb_tip',
-            8: 'index_tip'
-        }
-
-        for idx in HAND_FILTER:
-            left_lm = hand_left.landmark[idx]
-            right_lm = hand_right.landmark[idx]
-
-            p_left = Point2D(left_lm.x * self.image_width, left_lm.y * self.image_height)
-            p_right = Point2D(right_lm.x * self.image_width, right_lm.y * self.image_height)
-
-            point_3d = self.calc.getCoordinatesFrom(p_left, p_right)
-            coords_3d[landmark_names[idx]] = point_3d
-        return coords_3d
+        order = np.argsort(faces.keypoints[:, LEFT_EYE, 0], kind='stable')
+        return detectors.FaceArrays(*(field[order] for field in faces))
+
+    def hand_pixels(self, hands):
+        return hands.landmarks[..., :2] * self.image_size
+
+    def calculate_hand_3d_coordinates(self, left, right, scores):
+        # All 21 landmarks of every paired hand are triangulated in one batch
+        points, valid = self.calc.triangulate(left, right)
+        self.rejections['landmarks'] = int((~valid).sum())
+
+        # Mismatched pairs are dropped here, before fitting, tracking and screen mapping
+        keep = valid[:, WRIST] & (valid.sum(axis=1) >= MIN_VALID_LANDMARKS)
+        points, left, right, scores = points[keep], left[keep], right[keep], scores[keep]
+
+        thumb, index, middle, confidence = fit_hands(points, left, right, scores)
+        tips = np.isfinite(thumb).all(axis=1) & np.isfinite(index).all(axis=1)
+        self.rejections['hands'] = int(len(keep) - tips.sum())
+        points, thumb, index, middle = points[tips], thumb[tips], index[tips], middle[tips]
+        confidence = confidence[tips]
+        return [{'wrist': Point3D(*wrist), 'thumb_tip': Point3D(*t), 'index_tip': Point3D(*i),
+                 'middle_tip': Point3D(*m), 'confidence': c}
+                for wrist, t, i, m, c in zip(points[:, WRIST].tolist(), thumb.tolist(), index.tolist(),
+                                             middle.tolist(), confidence.tolist())]
 
     def extract_eye_positions(self, faces):
-        if not faces:
-            return None, None
-        keypoints = faces.location_data.relative_keypoints
-
-        if len(keypoints) >= 2:
-            right_eye = Point2D(
-                keypoints[0].x * self.image_width,
-                keypoints[0].y * self.image_height
-            )
-            left_eye = Point2D(
-                keypoints[1].x * self.image_width,
-                keypoints[1].y * self.image_height
-            )
-            return left_eye, right_eye
-
-        return None, None
-
-    def calculate_eye_midpoint_3d(self, face_left, face_right):
-        if not face_left or not face_right:
-            return None
-
-        left_eye_L, right_eye_L = self.extract_eye_positions(face_left)
-        left_eye_R, right_eye_R = self.extract_eye_positions(face_right)
-
-        if not all([left_eye_L, right_eye_L, left_eye_R, right_eye_R]):
-            return None
-
-        midpoint_left = Point2D(
-            (left_eye_L.x + right_eye_L.x) / 2,
-            (left_eye_L.y + right_eye_L.y) / 2
-        )
-        midpoint_right = Point2D(
-            (left_eye_R.x + right_eye_R.x) / 2,
-            (left_eye_R.y + right_eye_R.y) / 2
-        )
-
-        return self.calc.getCoordinatesFrom(p1=midpoint_left, p2=midpoint_right)
-
-    def process_stereo_detections(self):
+        # (N, 6, 2) keypoints -> (N, 2) eye midpoints in pixels
+        return faces.keypoints[:, FACE_FILTER, :].mean(axis=1) * self.image_size
+
+    def calculate_eye_midpoint_3d(self, left, right):
+        points, valid = self.calc.triangulate(left, right)
+        self.rejections['faces'] = int((~valid).sum())
+        return [Point3D(*p) for p in points[valid].tolist()]
+
+    def refine_stereo(self, left_results, right_results, left_hands, right_hands, left_eyes, right_eyes):
+        # Fingertips are matched in the frames the hands came from, eye midpoints in the face frames;
+        # both share the refiner's per-frame budget
+        if self.refiner is None:
+            return right_hands, right_eyes
+        views = []
+        refine_hands = len(left_hands) and left_results.frame is not None and right_results.frame is not None
+        if refine_hands:
+            views.append((left_results.frame, right_results.frame,
+                          left_hands[:, REFINE_LANDMARKS].reshape(-1, 2),
+                          right_hands[:, REFINE_LANDMARKS].reshape(-1, 2),
+                          np.tile(REFINE_PRIORITY, len(left_hands))))
+        refine_eyes = len(left_eyes) and left_results.face_frame is not None and right_results.face_frame is not None
+        if refine_eyes:
+            views.append((left_results.face_frame, right_results.face_frame, left_eyes, right_eyes,
+                          np.zeros(len(left_eyes), dtype=int)))
+        if not views:
+            return right_hands, right_eyes
+        refined = self.refiner.refine(views)
+        if refine_hands:
+            right_hands = right_hands.copy()
+            right_hands[:, REFINE_LANDMARKS] = refined[0].reshape(len(left_hands), len(REFINE_LANDMARKS), 2)
+        if refine_eyes:
+            right_eyes = refined[-1]
+        return right_hands, right_eyes
+
+    def process_stereo_detections(self, left_results, right_results):
 
         hand_coords_3d = {}
         face_coords_3d = {}
-        left_hands = self.sort_hands(self.left_results['hands'])
-        left_faces = self.sort_face(self.left_results['faces'])
-        right_hands = self.sort_hands(self.right_results['hands'])
-        right_faces = self.sort_face(self.right_results['faces'])
-
-        if left_hands and right_hands:
-            length = min(len(left_hands), len(right_hands))
-            for idx in range(length):
-                hand_3d = self.calculate_hand_3d_coordinates(left_hands[idx], right_hands[idx])
-                hand_coords_3d[f'Hand {idx}'] = hand_3d
-
-        if left_faces and right_faces:
-            length = min(len(left_faces), len(right_faces))
-            for idx in range(length):
-                face_3d = self.calculate_eye_midpoint_3d(left_faces[idx], right_faces[idx])
-                face_coords_3d[f'Face {idx}'] = face_3d
-
-
-        self.hand_coords_3d = hand_coords_3d
-        self.face_coords_3d = face_coords_3d
+        left_hands = self.sort_hands(left_results.hands)
+        left_faces = self.sort_face(left_results.faces)
+        right_hands = self.sort_hands(right_results.hands)
+        right_faces = self.sort_face(right_results.faces)
+
+        length = min(len(left_hands.landmarks), len(right_hands.landmarks))
+        left_hands = detectors.HandArrays(*(field[:length] for field in left_hands))
+        right_hands = detectors.HandArrays(*(field[:length] for field in right_hands))
+
+        length = min(len(left_faces.keypoints), len(right_faces.keypoints))
+        left_faces = detectors.FaceArrays(*(field[:length] for field in left_faces))
+        right_faces = detectors.FaceArrays(*(field[:length] for field in right_faces))
+
+        left_hand_pixels = self.hand_pixels(left_hands)
+        left_eyes = self.extract_eye_positions(left_faces)
+        right_hand_pixels, right_eyes = self.refine_stereo(
+            left_results, right_results, left_hand_pixels, self.hand_pixels(right_hands),
+            left_eyes, self.extract_eye_positions(right_faces))
+
+        hands = self.calculate_hand_3d_coordinates(left_hand_pixels, right_hand_pixels,
+                                                   np.minimum(left_hands.scores, right_hands.scores))
+        faces = self.calculate_eye_midpoint_3d(left_eyes, right_eyes)
+        for key, count in self.rejections.items():
+            self.rejections_total[key] += count
+
+        # Track ids stay stable across frames and short occlusions, unlike the sort order
+        timestamp = time.monotonic()
+        hand_ids = self.hand_tracker.update(
+            [(h['wrist'].x, h['wrist'].y, h['wrist'].z) for h in hands], timestamp)
+        face_ids = self.face_tracker.update(
+            [(f.x, f.y, f.z) for f in faces], timestamp)
+        self.hand_tracks = self.hand_tracker.snapshot()
+
+        for track_id, hand_3d in zip(hand_ids, hands):
+            if track_id is not None:
+                hand_coords_3d[f'Hand {track_id}'] = frozen(hand_3d)
+        for track_id, face_3d in zip(face_ids, faces):
+            if track_id is not None:
+                face_coords_3d[f'Face {track_id}'] = face_3d
+
+
+        return Points3D(frozen(hand_coords_3d), frozen(face_coords_3d))
+
+    def snapshot_3d(self):
+        generation = self.inputs.read().version
+        cached = self.coords_3d
+        if cached.version == generation:
+            self.cache_hits += 1
+            return cached
+        with self.compute_lock:
+            inputs = self.inputs.read()
+            if self.coords_3d.version != inputs.version:
+                self.cache_misses += 1
+                # One reference swap publishes hands and faces of the same generation together
+                with profiling.span('triangulation', inputs.version):
+                    points = self.process_stereo_detections(*inputs.data)
+                self.coords_3d = Snapshot(inputs.version, time.monotonic(), points)
+            return self.coords_3d
 
     def get3DCoordinates(self):
-        return self.hand_coords_3d, self.face_coords_3d
-
-    def getNearestFace(self, hand_point, face_coords_3d):
-        shortest_distance = float('inf')
-        best_face = None
-        for _, face in face_coords_3d.items():
-            dist = hand_point.distance_to(face)
-            if dist < shortest_distance and dist < MAX_FACE_DIST:
-                shortest_distance = dist
-                best_face = face
-        return best_face
-
-
-    def getOnScrenPixels(self):
-        points = []
-        hand_coords_3d, face_coords_3d = self.get3DCoordinates()
-        if not hand_coords_3d or not face_coords_3d:
-            return points
-
-        screen_width_m = self.physical_width * 0.0254
-        screen_height_m = self.physical_height * 0.0254
-        for _, hand in hand_coords_3d.items():
-
-            hand_point = self.calc.getMiddlePoint(hand['thumb_tip'], hand['index_tip'])
-            face_point = self.getNearestFace(hand_point, face_coords_3d)
-            pinch_dist = self.calc.getEuclideanDistance(hand['thumb_tip'], hand['index_tip'])
-            if not face_point:
+        return self.snapshot_3d().data
+
+    def getTrackROIs(self, radius=0.15):
+        # Image-space boxes around each tracked hand's predicted position, covering both views
+        rois = {}
+        timestamp = time.monotonic()
+        for track_id, position, velocity, track_time in self.hand_tracks:
+            position = position + velocity * (timestamp - track_time)
+            if position[2] <= 0:
                 continue
-            print(f'hand {hand_point} face: {face_point}')
-
-
-            hand_screen = Point3D(
-                hand_point.x - self.camera_x_offset,
-                hand_point.y - self.camera_y_offset,
-                hand_point.z - self.camera_z_offset
-            )
-            face_screen = Point3D(
-                face_point.x - self.camera_x_offset,
-                face_point.y - self.camera_y_offset,
-                face_point.z - self.camera_z_offset
+            center, disparity = self.calc.getImagePointFrom(Point3D(*position))
+            half_x = radius * self.calc.focal_length_x / position[2] + disparity / 2
+            half_y = radius * self.calc.focal_length_y / position[2]
+            rois[f'Hand {track_id}'] = (
+                max(0, int(center.x - half_x)), max(0, int(center.y - half_y)),
+                min(self.image_width, int(center.x + half_x)), min(self.image_height, int(center.y + half_y))
             )
+        return rois
 
-            intersection = self.calc.getXYIntersection(face_screen, hand_screen)
-
-            pixel_x = (intersection.x / screen_width_m) * self.pixel_width
-            pixel_y = (intersection.y / screen_height_m) * self.pixel_height
+    def getNearestFace(self, hand_point, face_coords_3d):
+        return nearest_face(hand_point, face_coords_3d)
 
-            print(Point2D(pixel_x, pixel_y))
-            points.append({'position': Point2D(pixel_x, pixel_y), 'pinch_distance': pinch_dist})
+    def getOnScrenPixels(self):
+        cached = self.pixels
+        if cached.version == self.inputs.read().version:
+            self.cache_hits += 1
+            return cached.data
+        coords = self.snapshot_3d()
+        with self.compute_lock:
+            if self.pixels.version != coords.version:
+                self.cache_misses += 1
+                with profiling.span('screen mapping', coords.version):
+                    pixels = screen_points(self.screens, *coords.data)
+                self.pixels = Snapshot(coords.version, time.monotonic(), pixels)
+            return self.pixels.data
+
+
+def nearest_face(hand_point, face_coords_3d):
+    shortest_distance = float('inf')
+    best_face = None
+    for _, face in face_coords_3d.items():
+        dist = hand_point.distance_to(face)
+        if dist < shortest_distance and dist < MAX_FACE_DIST:
+            shortest_distance = dist
+            best_face = face
+    return best_face
+
+
+def screen_points(screens, hand_coords_3d, face_coords_3d):
+    points = []
+    # Rig workers and remote consumers without a screen layout only produce 3D points
+    if screens is None or not hand_coords_3d or not face_coords_3d:
+        return points
 
+    labels = []
+    pinch_distances = []
+    scroll_distances = []
+    hand_points = []
+    face_points = []
+    for label, hand in hand_coords_3d.items():
+        hand_point = (hand['thumb_tip'] + hand['index_tip']) / 2
+        face_point = nearest_face(hand_point, face_coords_3d)
+        if not face_point:
+            continue
+        labels.append(label)
+        pinch_distances.append(hand['thumb_tip'].distance_to(hand['index_tip']))
+        scroll_distances.append(hand['thumb_tip'].distance_to(hand['middle_tip']) if 'middle_tip' in hand else None)
+        hand_points.append((hand_point.x, hand_point.y, hand_point.z))
+        face_points.append((face_point.x, face_point.y, face_point.z))
+
+    if not labels:
         return points
+
+    # Every eye->hand ray against every screen plane in one pass
+    screen_ids, pixels = screens.intersect(np.array(face_points), np.array(hand_points))
+    for label, pinch_dist, scroll_dist, screen_id, (pixel_x, pixel_y) in zip(
+            labels, pinch_distances, scroll_distances, screen_ids, pixels):
+        if screen_id < 0:
+            continue
+        points.append({'id': label, 'screen_id': int(screen_id), 'position': Point2D(pixel_x, pixel_y),
+                       'pinch_distance': pinch_dist, 'scroll_distance': scroll_dist,
+                       'confidence': hand_coords_3d[label].get('confidence', 1.0)})
+
+    return points
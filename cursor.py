@@ -1,14 +1,30 @@
 import coordinates
 import time
+from typing import NamedTuple
 import numpy as np
 from scipy.optimize import linear_sum_assignment
 
 from coordinates import Coordinates
+from snapshots import Publisher, frozen
+from channels import Channel, DROP_OLDEST
+from gestures import GestureEngine
+import affinity
+import profiling
+
+FRAME_TIME = 0.033  # converts the legacy unpress_frames count into a release time
+
+
+class MouseState(NamedTuple):
+    position: object
+    pressed: bool
+    pinch_distance: object
+    track: object
+    screen_id: int = 0
 
 
 class Cursor:
     def __init__(self, coordinate, mice_count, max_x_dist, max_y_dist, timeout,
-                 press_threshold, unpress_threshold, unpress_frames):
+                 press_threshold, unpress_threshold, unpress_frames, release_time=None):
 
         self.mice_count = mice_count
         self.max_x_dist = max_x_dist
@@ -17,101 +33,177 @@ class Cursor:
         self.press_threshold = press_threshold
         self.unpress_threshold = unpress_threshold
         self.unpress_frames = unpress_frames
+        if release_time is None:
+            release_time = unpress_frames * FRAME_TIME
 
         self.coordinate = coordinate
+        self.gestures = GestureEngine(mice_count, press_threshold, unpress_threshold, release_time)
+        self.event_channels = []
+        self.outputs = []
+        self.tick_events = []
+        # Latest tick time; the gesture engine must never see time go backwards
+        self.clock = -np.inf
 
         self.mice = {i: {'position': None, 'pressed': False, 'time': None,
-                         'unpress_counter': 0, 'pinch_distance': None}
+                         'pinch_distance': None, 'scroll_distance': None, 'track': None, 'screen_id': 0}
                      for i in range(mice_count)}
+        # Only the cursor thread touches self.mice; readers get immutable snapshots
+        self.state = Publisher()
+        self.publish_mice()
 
         self.running = True
 
     def update(self):
+        affinity.apply('cursor')
+        points = self.coordinate.subscribe('cursor points')
         while self.running:
-            time.sleep(0.01)
-            self.free_mice()
-
-            coords = self.coordinate.getOnScrenPixels()
-            if not coords:
+            # Only re-associate when a new 3D frame arrived; timeouts still expire idle mice
+            snapshot = points.get(timeout=0.01)
+            if snapshot is None:
+                self.free_mice()
+                self.update_pressed(self.tick_time(time.monotonic()))
+                self.publish_mice()
                 continue
+            with profiling.span('cursor step', snapshot.version):
+                self.step(snapshot.timestamp)
 
-            free_mice = [label for label, data in self.mice.items()
-                         if data['position'] is None]
-
-            active_mice = [label for label, data in self.mice.items()
-                           if data['position'] is not None]
-
-            assigned_hands = set()
-
-            # Active mice move to nearest hand within range
-            for mouse_label in active_mice:
-                mouse_pos = self.mice[mouse_label]['position']
-                closest_hand_idx = None
-                closest_distance = float('inf')
-
-                for hand_idx, hand_data in enumerate(coords):
-                    hand_pos = hand_data['position']
-                    distance = mouse_pos.distance_to(hand_pos)
-
-                    x_diff = abs(mouse_pos.x - hand_pos.x)
-                    y_diff = abs(mouse_pos.y - hand_pos.y)
-
-                    # Only consider hands within threshold
-                    if x_diff <= self.max_x_dist and y_diff <= self.max_y_dist:
-                        if distance < closest_distance:
-                            closest_distance = distance
-                            closest_hand_idx = hand_idx
-
-                # Update position only if hand found within range
-                if closest_hand_idx is not None:
-                    self.mice[mouse_label]['position'] = coords[closest_hand_idx]['position']
-                    self.mice[mouse_label]['pinch_distance'] = coords[closest_hand_idx]['pinch_distance']
-                    self.mice[mouse_label]['time'] = time.time()
-                    assigned_hands.add(closest_hand_idx)
-                # If no hand in range, mouse stays still (no action)
-
-            # Step 2: Free mice teleport to nearest unused hand
-            for mouse_label in free_mice:
-                closest_hand_idx = None
-                closest_distance = float('inf')
-
-                # Find nearest hand that hasn't been assigned to an active mouse
-                for hand_idx, hand_data in enumerate(coords):
-                    if hand_idx in assigned_hands:
-                        continue
-                    closest_hand_idx = hand_idx
-                    break
-
-                # Assign to unused hand if available
-                if closest_hand_idx is not None:
-                    self.mice[mouse_label]['position'] = coords[closest_hand_idx]['position']
-                    self.mice[mouse_label]['pinch_distance'] = coords[closest_hand_idx]['pinch_distance']
-                    self.mice[mouse_label]['time'] = time.time()
-                    assigned_hands.add(closest_hand_idx)
-                # If no hands left, free mouse doesn't move
-
-            self.update_pressed()
-
-    def update_pressed(self):
-        for label, data in self.mice.items():
-            if data['pinch_distance'] is None:
-                continue
+    def step(self, timestamp=None):
+        if timestamp is None:
+            timestamp = time.monotonic()
+        # Snapshot times can be older than an idle tick that already ran
+        timestamp = self.tick_time(timestamp)
+        self.free_mice()
+
+        coords = self.coordinate.getOnScrenPixels()
+        if not coords:
+            self.update_pressed(timestamp)
+            self.publish_mice()
+            return
 
-            pinch_dist = data['pinch_distance']
+        previous_tracks = {label: data['track'] for label, data in self.mice.items()}
 
-            if pinch_dist < self.press_threshold:
-                data['pressed'] = True
-                data['unpress_counter'] = 0
+        free_mice = [label for label, data in self.mice.items()
+                     if data['position'] is None]
 
-            elif pinch_dist >= self.unpress_threshold:
-                data['unpress_counter'] += 1
+        active_mice = [label for label, data in self.mice.items()
+                       if data['position'] is not None]
 
-                if data['unpress_counter'] >= self.unpress_frames:
-                    data['pressed'] = False
-                    data['unpress_counter'] = 0
+        assigned_hands = set()
+        hand_by_track = {hand_data.get('id'): hand_idx for hand_idx, hand_data in enumerate(coords)}
 
-            else:
-                data['unpress_counter'] = 0
+        # Active mice follow their bound 3D track without re-association
+        for mouse_label in list(active_mice):
+            hand_idx = hand_by_track.get(self.mice[mouse_label]['track'])
+            if hand_idx is None or hand_idx in assigned_hands:
+                continue
+            self.assign_hand(mouse_label, coords[hand_idx])
+            assigned_hands.add(hand_idx)
+            active_mice.remove(mouse_label)
+
+        # Remaining active mice move to nearest hand within range
+        for mouse_label in active_mice:
+            mouse_pos = self.mice[mouse_label]['position']
+            closest_hand_idx = None
+            closest_distance = float('inf')
+
+            for hand_idx, hand_data in enumerate(coords):
+                if hand_idx in assigned_hands:
+                    continue
+                hand_pos = hand_data['position']
+                distance = mouse_pos.distance_to(hand_pos)
+
+                x_diff = abs(mouse_pos.x - hand_pos.x)
+                y_diff = abs(mouse_pos.y - hand_pos.y)
+
+                # Only consider hands within threshold
+                if x_diff <= self.max_x_dist and y_diff <= self.max_y_dist:
+                    if distance < closest_distance:
+                        closest_distance = distance
+                        closest_hand_idx = hand_idx
+
+            # Update position only if hand found within range
+            if closest_hand_idx is not None:
+                self.assign_hand(mouse_label, coords[closest_hand_idx])
+                assigned_hands.add(closest_hand_idx)
+            # If no hand in range, mouse stays still (no action)
+
+        # Step 2: Free mice teleport to nearest unused hand
+        for mouse_label in free_mice:
+            closest_hand_idx = None
+            closest_distance = float('inf')
+
+            # Find nearest hand that hasn't been assigned to an active mouse
+            for hand_idx, hand_data in enumerate(coords):
+                if hand_idx in assigned_hands:
+                    continue
+                closest_hand_idx = hand_idx
+                break
+
+            # Assign to unused hand if available
+            if closest_hand_idx is not None:
+                self.assign_hand(mouse_label, coords[closest_hand_idx])
+                assigned_hands.add(closest_hand_idx)
+            # If no hands left, free mouse doesn't move
+
+        # A mouse handed over to another hand must not inherit the old hand's press
+        handed_over = [previous_tracks[label] is not None and data['track'] != previous_tracks[label]
+                       for label, data in self.mice.items()]
+        self.emit(self.gestures.reset(handed_over, timestamp))
+
+        self.update_pressed(timestamp)
+        self.publish_mice()
+
+    def tick_time(self, timestamp):
+        self.clock = max(self.clock, timestamp)
+        return self.clock
+
+    def publish_mice(self):
+        snapshot = self.state.publish(frozen({
+            label: MouseState(data['position'], data['pressed'], data['pinch_distance'], data['track'],
+                              data['screen_id'])
+            for label, data in self.mice.items()}))
+        # Outputs see every pointer update and gesture of this tick in one batch
+        events, self.tick_events = self.tick_events, []
+        for output in self.outputs:
+            with profiling.span('pointer output', snapshot.version):
+                output.apply(snapshot.data, events)
+
+    def add_output(self, output):
+        self.outputs.append(output)
+
+    def assign_hand(self, mouse_label, hand_data):
+        self.mice[mouse_label]['position'] = hand_data['position']
+        self.mice[mouse_label]['pinch_distance'] = hand_data['pinch_distance']
+        self.mice[mouse_label]['scroll_distance'] = hand_data.get('scroll_distance')
+        self.mice[mouse_label]['track'] = hand_data.get('id')
+        self.mice[mouse_label]['screen_id'] = hand_data.get('screen_id', 0)
+        self.mice[mouse_label]['time'] = time.time()
+
+    def update_pressed(self, timestamp):
+        labels = list(self.mice)
+        active = [self.mice[label]['position'] is not None for label in labels]
+        pinch = [np.nan if self.mice[label]['pinch_distance'] is None else self.mice[label]['pinch_distance']
+                 for label in labels]
+        scroll = [np.nan if self.mice[label]['scroll_distance'] is None else self.mice[label]['scroll_distance']
+                  for label in labels]
+        positions = [(np.nan, np.nan) if self.mice[label]['position'] is None
+                     else (self.mice[label]['position'].x, self.mice[label]['position'].y) for label in labels]
+
+        with profiling.span('gestures'):
+            self.emit(self.gestures.update(timestamp, active, pinch, positions, scroll))
+        for label, pressed in zip(labels, self.gestures.pressed):
+            self.mice[label]['pressed'] = bool(pressed)
+
+    def subscribe_events(self, name, capacity=64, policy=DROP_OLDEST):
+        channel = Channel(name, capacity, policy)
+        self.event_channels.append(channel)
+        return channel
+
+    def emit(self, events):
+        self.tick_events.extend(events)
+        for event in events:
+            for channel in self.event_channels:
+                channel.put(event)
 
     def free_mice(self):
         for label, data in self.mice.items():
@@ -120,10 +212,21 @@ class Cursor:
             if time.time() - data['time'] > self.timeout:
                 data['position'] = None
                 data['pressed'] = False
+                data['track'] = None
                 data['time'] = time.time()
 
+    def stop(self):
+        self.running = False
+        for channel in self.event_channels:
+            channel.close()
+        for output in self.outputs:
+            output.close()
+
+    def get_mice(self):
+        return self.state.read().data
+
     def get_mice_data(self):
-        return {label: data['position'] for label, data in self.mice.items()}
+        return {label: mouse.position for label, mouse in self.get_mice().items()}
 
 
 
@@ -1,77 +1,334 @@
 import time
+from functools import partial
+from typing import NamedTuple
 
 import cv2
-import mediapipe as mp
+import numpy as np
+try:
+    import mediapipe as mp
+except ImportError:
+    mp = None
+import affinity
+import motion
+import profiling
 import stream
-from threading import Thread
-mp_drawing = mp.solutions.drawing_utils
-mp_drawing_styles = mp.solutions.drawing_styles
-mp_hands = mp.solutions.hands
-mp_face_detection = mp.solutions.face_detection
+from threading import Thread, Event
+from channels import Channel, LATEST
+from snapshots import Publisher
+
+# The array types and other backends work without MediaPipe, e.g. with synthetic detections
+mp_hands = mp.solutions.hands if mp is not None else None
+mp_face_detection = mp.solutions.face_detection if mp is not None else None
+
+
+HAND_LANDMARKS = 21
+FACE_KEYPOINTS = 6
+HAND_CONNECTIONS = ((0, 1), (1, 2), (2, 3), (3, 4), (0, 5), (5, 6), (6, 7), (7, 8), (5, 9), (9, 10), (10, 11),
+                    (11, 12), (9, 13), (13, 14), (14, 15), (15, 16), (13, 17), (0, 17), (17, 18), (18, 19), (19, 20))
+LEFT_HAND = 0
+RIGHT_HAND = 1
+REDETECT_FRAMES = 30  # batched mode: the full palm detector still runs this often to pick up new hands
+
+
+class HandArrays(NamedTuple):
+    landmarks: np.ndarray  # (H, 21, 3) float32, x/y normalised to the image
+    handedness: np.ndarray  # (H,) int8, LEFT_HAND or RIGHT_HAND
+    scores: np.ndarray  # (H,) float32
+
+
+class FaceArrays(NamedTuple):
+    keypoints: np.ndarray  # (F, 6, 2) float32, normalised to the image
+    boxes: np.ndarray  # (F, 4) float32 xmin, ymin, width, height, normalised
+    scores: np.ndarray  # (F,) float32
+
+
+NO_HANDS = HandArrays(np.zeros((0, HAND_LANDMARKS, 3), np.float32), np.zeros(0, np.int8), np.zeros(0, np.float32))
+NO_FACES = FaceArrays(np.zeros((0, FACE_KEYPOINTS, 2), np.float32), np.zeros((0, 4), np.float32),
+                      np.zeros(0, np.float32))
+
+
+class Detections(NamedTuple):
+    hands: HandArrays
+    faces: FaceArrays
+    frame: object = None  # BGR image the hands were detected in, for stereo refinement
+    face_frame: object = None  # BGR image the faces were detected in; the face loop runs on its own frames
+
+
+def hands_to_arrays(results):
+    # The only place that walks MediaPipe protobufs; everything downstream uses arrays
+    if not results.multi_hand_landmarks:
+        return NO_HANDS
+    landmarks = np.array([[(lm.x, lm.y, lm.z) for lm in hand.landmark]
+                          for hand in results.multi_hand_landmarks], dtype=np.float32)
+    classes = [h.classification[0] for h in results.multi_handedness]
+    handedness = np.array([RIGHT_HAND if c.label == 'Right' else LEFT_HAND for c in classes], dtype=np.int8)
+    scores = np.array([c.score for c in classes], dtype=np.float32)
+    return HandArrays(landmarks, handedness, scores)
+
+
+def faces_to_arrays(detections):
+    if not detections:
+        return NO_FACES
+    keypoints = np.array([[(kp.x, kp.y) for kp in d.location_data.relative_keypoints]
+                          for d in detections], dtype=np.float32)
+    boxes = np.array([(b.xmin, b.ymin, b.width, b.height)
+                      for b in (d.location_data.relative_bounding_box for d in detections)], dtype=np.float32)
+    scores = np.array([d.score[0] for d in detections], dtype=np.float32)
+    return FaceArrays(keypoints, boxes, scores)
+
+
+def prepare(image, size=None):
+    # Results are normalised to the image, so inference can run below capture resolution
+    if size is not None and (image.shape[1], image.shape[0]) != tuple(size):
+        image = cv2.resize(image, tuple(size), interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+
+
+def detect_hands(hands, image, size=None, frame=-1):
+    with profiling.span('hands prepare', frame):
+        image = prepare(image, size)
+    with profiling.span('hands process', frame):
+        results = hands.process(image)
+    return hands_to_arrays(results)
+
+
+def detect_faces(face, image, size=None, frame=-1):
+    with profiling.span('faces prepare', frame):
+        image = prepare(image, size)
+    with profiling.span('faces process', frame):
+        results = face.process(image)
+    return faces_to_arrays(results.detections)
+
+
+class DetectorBackend:
+    """Detector backend interface: detect() takes a BGR frame and returns its detections.
+
+    A backend is created, used and closed on one thread. size is the (width, height) to run
+    inference at, None for the frame size; results are normalised to the frame either way."""
+
+    def detect(self, image, size=None, frame=-1):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class HandBackend(DetectorBackend):
+    """A DetectorBackend whose detect() returns HandArrays."""
+
+
+class FaceBackend(DetectorBackend):
+    """A DetectorBackend whose detect() returns FaceArrays."""
+
+
+class SolutionsHands(HandBackend):
+    def __init__(self, static_image_mode=False, max_num_hands=4, model_complexity=0,
+                 min_detection_confidence=0.3, min_tracking_confidence=0.5):
+        if mp_hands is None:
+            raise RuntimeError('mediapipe is not installed, install it with: pip install mediapipe')
+        self.hands = mp_hands.Hands(
+            static_image_mode=static_image_mode,
+            max_num_hands=max_num_hands,
+            model_complexity=model_complexity,
+            min_detection_confidence=min_detection_confidence,
+            min_tracking_confidence=min_tracking_confidence)
+
+    def detect(self, image, size=None, frame=-1):
+        return detect_hands(self.hands, image, size, frame)
+
+    def close(self):
+        self.hands.close()
+
+
+class SolutionsFaces(FaceBackend):
+    def __init__(self, model_selection=1, min_detection_confidence=0.5):
+        if mp_face_detection is None:
+            raise RuntimeError('mediapipe is not installed, install it with: pip install mediapipe')
+        self.face = mp_face_detection.FaceDetection(
+            model_selection=model_selection, min_detection_confidence=min_detection_confidence)
+
+    def detect(self, image, size=None, frame=-1):
+        return detect_faces(self.face, image, size, frame)
+
+    def close(self):
+        self.face.close()
 
 
 class Tracker:
-    def __init__(self, camera):
+    def __init__(self, camera, threaded=True, inference_size=None, hand_batcher=None,
+                 hand_backend=None, face_backend=None, propagator=None, hand_gate=None, face_gate=None):
         self.camera = camera
+        self.inference_size = inference_size
+        # Batched mode: known hands are tracked through a shared hand_batch.HandBatcher, and the
+        # hand backend only runs to find new ones. roi_source adds pixel boxes of expected hands.
+        self.hand_batcher = hand_batcher
+        self.roi_source = None
+        # Backend factories, called on the detector threads
+        if hand_backend is None:
+            hand_backend = partial(SolutionsHands, static_image_mode=hand_batcher is not None)
+        self.hand_backend = hand_backend
+        self.face_backend = face_backend or SolutionsFaces
+        # propagation.FlowPropagator: moves the last hands with optical flow on frames the detector skips
+        self.propagator = propagator
+        # motion.MotionGate per loop: frames without motion keep the previous results
+        self.hand_gate = hand_gate
+        self.face_gate = face_gate
         self.running = True
-        self.results = {'hands': None, 'faces': None}
+        self.results = Publisher(Detections(NO_HANDS, NO_FACES))
+        self.hands_ready = Event()
+        self.faces_ready = Event()
+        self.channels = []
+
+        self.threads = []
+        if threaded:
+            self.hand_frames = camera.subscribe('hand frames')
+            self.face_frames = camera.subscribe('face frames')
+            self.threads = [Thread(target=self.hand_update, args=(), daemon=True),
+                            Thread(target=self.face_update, args=(), daemon=True)]
+            for thread in self.threads:
+                thread.start()
 
-        Thread(target=self.hand_update, args=(), daemon=True).start()
-        Thread(target=self.face_update, args=(), daemon=True).start()
     def hand_update(self):
-        with mp_hands.Hands(
-                max_num_hands=4,
-                model_complexity=0,
-                min_detection_confidence=0.3,
-                min_tracking_confidence=0.5) as hands:
+        affinity.apply('hands')
+        with self.hand_backend() as hands:
+            self.hands_ready.set()
+            hands_found = NO_HANDS
+            tracked = 0
             while self.running:
-                self.camera.new_frame.wait(timeout=0.01)
-                success, image = self.camera.read()
-                if not success:
+                frame = self.hand_frames.get(timeout=0.1)
+                if frame is None:
                     continue
-                image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-                self.results['hands'] = hands.process(image).multi_hand_landmarks
+                if self.hand_gate is not None:
+                    with profiling.span('hands gate', frame.index):
+                        static = self.hand_gate.static(frame.image, motion.hand_regions(hands_found))
+                    if static:
+                        # The next propagation starts from this frame, not from the last one that ran
+                        if self.propagator is not None:
+                            self.propagator.hold(frame.image)
+                        continue
+                if self.propagator is not None:
+                    with profiling.span('hands flow', frame.index):
+                        propagated = self.propagator.propagate(frame.image)
+                    if propagated is not None:
+                        hands_found = propagated
+                        self.publish(self.results.update(hands=hands_found, frame=frame.image))
+                        continue
+                if self.hand_batcher is not None and tracked < REDETECT_FRAMES:
+                    previous = hands_found
+                    hands_found = self.track_hands(previous, frame)
+                    # Losing a hand sends the frame through the full detector again
+                    if hands_found is None or len(hands_found.landmarks) < len(previous.landmarks):
+                        tracked = REDETECT_FRAMES
+                if self.hand_batcher is None or tracked >= REDETECT_FRAMES:
+                    hands_found = hands.detect(frame.image, self.inference_size, frame.index)
+                    tracked = 0
+                else:
+                    tracked += 1
+                if self.propagator is not None:
+                    self.propagator.reset(frame.image, hands_found)
+                self.publish(self.results.update(hands=hands_found, frame=frame.image))
+
+    def track_hands(self, previous, frame):
+        with profiling.span('hands prepare', frame.index):
+            image = prepare(frame.image, self.inference_size)
+        boxes = []
+        if self.roi_source is not None:
+            # The boxes are in capture pixels
+            scale = image.shape[1] / frame.image.shape[1]
+            boxes = [[v * scale for v in box] for box in self.roi_source().values()]
+        return self.hand_batcher.track(image, previous, boxes, frame.index)
 
     def face_update(self):
-        with mp_face_detection.FaceDetection(
-                model_selection=1, min_detection_confidence=0.5) as face:
+        affinity.apply('faces')
+        with self.face_backend() as face:
+            self.faces_ready.set()
+            faces_found = NO_FACES
             while self.running:
-                self.camera.new_frame.wait(timeout=0.01)
-                success, image = self.camera.read()
-                if not success:
+                frame = self.face_frames.get(timeout=0.1)
+                if frame is None:
                     continue
-                image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-                self.results['faces'] = face.process(image).detections
+                if self.face_gate is not None:
+                    with profiling.span('faces gate', frame.index):
+                        static = self.face_gate.static(frame.image, motion.face_regions(faces_found))
+                    if static:
+                        continue
+                faces_found = face.detect(frame.image, self.inference_size, frame.index)
+                self.publish(self.results.update(faces=faces_found, face_frame=frame.image))
+
+    def wait_ready(self, timeout=None):
+        # Both models loaded
+        return self.hands_ready.wait(timeout) and self.faces_ready.wait(timeout)
+
+    def subscribe(self, name, capacity=1, policy=LATEST):
+        channel = Channel(name, capacity, policy)
+        self.channels.append(channel)
+        return channel
+
+    def publish(self, snapshot):
+        for channel in self.channels:
+            channel.put(snapshot)
+
     def get_results(self):
-        return self.results
+        return self.results.read().data
+
+    def get_snapshot(self):
+        return self.results.read()
 
     def stop(self):
         self.running = False
+        for channel in self.channels:
+            channel.close()
+        for thread in self.threads:
+            thread.join(timeout=1.0)
+
+def draw_hands(img, hands, mirror=False):
+    h, w = img.shape[:2]
+    for landmarks in hands.landmarks:
+        points = (landmarks[:, :2] * (w, h)).astype(np.int32)
+        if mirror:
+            points[:, 0] = w - 1 - points[:, 0]
+        for a, b in HAND_CONNECTIONS:
+            cv2.line(img, tuple(points[a]), tuple(points[b]), (255, 255, 255), 2)
+        for x, y in points:
+            cv2.circle(img, (int(x), int(y)), 3, (0, 0, 255), -1)
+
+
+def draw_faces(img, faces, mirror=False):
+    h, w = img.shape[:2]
+    for box, keypoints in zip(faces.boxes, faces.keypoints):
+        x, y, bw, bh = (box * (w, h, w, h)).astype(np.int32)
+        if mirror:
+            x = w - 1 - x - bw
+        cv2.rectangle(img, (int(x), int(y)), (int(x + bw), int(y + bh)), (0, 255, 0), 2)
+        for kx, ky in (keypoints * (w, h)).astype(np.int32):
+            if mirror:
+                kx = w - 1 - kx
+            cv2.circle(img, (int(kx), int(ky)), 3, (0, 0, 255), -1)
+
 
 def view(c1, t1, c2, t2):
+    # Frames are flipped straight into reused buffers and drawn on at mirrored coordinates
+    buffers = [None, None]
     while c1.running and c2.running:
         for idx, (c, t) in enumerate([(c1, t1), (c2, t2)]):
             c.new_frame.wait(timeout=0.01)
             success, img = c.read()
             if not success:
                 continue
-            img = img.copy()
-            img.flags.writeable = True
+            if buffers[idx] is None or buffers[idx].shape != img.shape:
+                buffers[idx] = np.empty_like(img)
+            cv2.flip(img, 1, dst=buffers[idx])
 
             results = t.get_results()
-            if results['hands'] is not None:
-                for detection in results['hands']:
-                    mp_drawing.draw_landmarks(
-                        img,
-                        detection,
-                        mp_hands.HAND_CONNECTIONS,
-                        mp_drawing_styles.get_default_hand_landmarks_style(),
-                        mp_drawing_styles.get_default_hand_connections_style())
-
-            if results['faces'] is not None:
-                for detection in results['faces']:
-                    mp_drawing.draw_detection(img, detection)
-            cv2.imshow(f'{idx}', cv2.flip(img, 1))
+            draw_hands(buffers[idx], results.hands, mirror=True)
+            draw_faces(buffers[idx], results.faces, mirror=True)
+            cv2.imshow(f'{idx}', buffers[idx])
 
         if cv2.waitKey(5) & 0xFF == 27:
             break
@@ -0,0 +1,213 @@
+import multiprocessing
+import queue
+import time
+from threading import Thread
+
+import numpy as np
+
+import affinity
+import backends
+import detectors
+import stream
+from channels import Channel, LATEST
+from coordinates import Coordinates, Points3D, screen_points
+from screens import ScreenLayout
+from snapshots import Publisher, frozen
+from tracking import MultiTracker
+from utils import Point3D
+
+FPS_MS = 0.033
+
+MERGE_DISTANCE = 0.08  # metres between duplicate detections from overlapping rigs
+MAX_RIG_AGE = 0.25  # seconds before a silent rig's detections are dropped
+
+
+class Rig:
+    def __init__(self, rig_id, left_src, right_src, left_calibration, right_calibration,
+                 width, height, rotation=None, translation=None, backend=None, inference_size=None,
+                 affinity=None, hand_backend=None, face_backend=None, triangulation=None):
+        self.rig_id = rig_id
+        self.left_src = left_src
+        self.right_src = right_src
+        self.left_calibration = left_calibration
+        self.right_calibration = right_calibration
+        self.width = width
+        self.height = height
+        self.backend = backend
+        self.inference_size = inference_size
+        # Affinity config section applied inside the worker process
+        self.affinity = affinity
+        # Detector backend config sections ({'type': ..., **options}), built inside the worker
+        self.hand_backend = hand_backend or {'type': 'solutions'}
+        self.face_backend = face_backend or {'type': 'solutions'}
+        # Triangulation config section (min_depth, max_depth, disparity_sign) for the rig's Coordinates
+        self.triangulation = triangulation or {}
+        # Extrinsics: world = rotation @ rig + translation
+        self.rotation = np.eye(3) if rotation is None else np.asarray(rotation, dtype=float)
+        self.translation = np.zeros(3) if translation is None else np.asarray(translation, dtype=float)
+
+    def to_world(self, point):
+        x, y, z = self.rotation @ (point.x, point.y, point.z) + self.translation
+        return Point3D(x, y, z)
+
+    def hand_to_world(self, hand):
+        world = {name: self.to_world(p) for name, p in hand.items() if name != 'confidence'}
+        world['confidence'] = hand['confidence']
+        return world
+
+
+def run_rig(rig, results, stop):
+    # Worker process: one stereo rig with its own cameras, detector threads and triangulation
+    if rig.affinity is not None:
+        affinity.limit_threads(rig.affinity['opencv_threads'], rig.affinity['inference_threads'])
+        affinity.configure(rig.affinity['roles'])
+    left = stream.Camera(src=rig.left_src, width=rig.width, height=rig.height, backend=rig.backend)
+    left.undistort(rig.left_calibration, 1)
+    right = stream.Camera(src=rig.right_src, width=rig.width, height=rig.height, backend=rig.backend)
+    right.undistort(rig.right_calibration, 1)
+
+    hand_backend = backends.factory(rig.hand_backend, backends.HAND_BACKENDS)
+    face_backend = backends.factory(rig.face_backend, backends.FACE_BACKENDS)
+    left_tracker = detectors.Tracker(left, inference_size=rig.inference_size, hand_backend=hand_backend,
+                                     face_backend=face_backend)
+    right_tracker = detectors.Tracker(right, inference_size=rig.inference_size, hand_backend=hand_backend,
+                                      face_backend=face_backend)
+    coords = Coordinates(right_tracker, left_tracker, rig.width, rig.height, rig.left_calibration,
+                         **rig.triangulation)
+    updates = coords.subscribe('rig output')
+
+    try:
+        while not stop.is_set():
+            if updates.get(timeout=FPS_MS) is None:
+                continue
+            hand_coords_3d, face_coords_3d = coords.get3DCoordinates()
+            hands = [rig.hand_to_world(hand) for hand in hand_coords_3d.values()]
+            faces = [rig.to_world(face) for face in face_coords_3d.values()]
+            try:
+                results.put_nowait((rig.rig_id, time.time(), hands, faces))
+            except queue.Full:
+                pass
+    finally:
+        coords.stop()
+        left_tracker.stop()
+        right_tracker.stop()
+        left.stop()
+        right.stop()
+
+
+def merge(detections, key, merge_distance):
+    # Greedy clustering of (rig_id, detection) pairs; a cluster takes at most one detection per rig
+    clusters = []
+    for rig_id, detection in detections:
+        position = key(detection)
+        best = None
+        best_distance = merge_distance
+        for cluster in clusters:
+            if rig_id in cluster['rigs']:
+                continue
+            distance = position.distance_to(cluster['position'])
+            if distance < best_distance:
+                best = cluster
+                best_distance = distance
+        if best is None:
+            clusters.append({'rigs': {rig_id}, 'members': [detection], 'position': position})
+        else:
+            best['rigs'].add(rig_id)
+            best['members'].append(detection)
+            best['position'] = (best['position'] * (len(best['members']) - 1) + position) / len(best['members'])
+    return [cluster['members'] for cluster in clusters]
+
+
+def average_points(points):
+    total = points[0]
+    for p in points[1:]:
+        total = total + p
+    return total / len(points)
+
+
+class RigFusion:
+    def __init__(self, rigs, screens, merge_distance=MERGE_DISTANCE, max_rig_age=MAX_RIG_AGE):
+        self.rigs = list(rigs)
+        self.screens = screens if isinstance(screens, ScreenLayout) else ScreenLayout(screens)
+        self.merge_distance = merge_distance
+        self.max_rig_age = max_rig_age
+
+        self.coords_3d = Publisher(Points3D(frozen({}), frozen({})))
+        self.latest = {}
+        self.channels = []
+
+        self.hand_tracker = MultiTracker()
+        self.face_tracker = MultiTracker()
+
+        # Spawned workers so each rig gets a fresh interpreter with its own MediaPipe graphs
+        context = multiprocessing.get_context('spawn')
+        self.stop_event = context.Event()
+        self.results = context.Queue(maxsize=4 * len(self.rigs))
+        self.workers = [context.Process(target=run_rig, args=(rig, self.results, self.stop_event), daemon=True)
+                        for rig in self.rigs]
+        for worker in self.workers:
+            worker.start()
+
+        self.running = True
+        Thread(target=self.update, args=(), daemon=True).start()
+
+    def update(self):
+        while self.running:
+            try:
+                rig_id, timestamp, hands, faces = self.results.get(timeout=FPS_MS)
+            except queue.Empty:
+                continue
+            self.latest[rig_id] = (timestamp, hands, faces)
+            self.fuse()
+
+    def fuse(self):
+        now = time.time()
+        hands = []
+        faces = []
+        for rig_id, (timestamp, rig_hands, rig_faces) in list(self.latest.items()):
+            if now - timestamp > self.max_rig_age:
+                continue
+            hands.extend((rig_id, hand) for hand in rig_hands)
+            faces.extend((rig_id, face) for face in rig_faces)
+
+        fused_hands = [{name: average_points([h[name] for h in members]) for name in members[0]}
+                       for members in merge(hands, lambda h: h['wrist'], self.merge_distance)]
+        fused_faces = [average_points(members)
+                       for members in merge(faces, lambda f: f, self.merge_distance)]
+
+        timestamp = time.monotonic()
+        hand_ids = self.hand_tracker.update(
+            [(h['wrist'].x, h['wrist'].y, h['wrist'].z) for h in fused_hands], timestamp)
+        face_ids = self.face_tracker.update([(f.x, f.y, f.z) for f in fused_faces], timestamp)
+
+        self.coords_3d.publish(Points3D(
+            frozen({f'Hand {i}': frozen(h) for i, h in zip(hand_ids, fused_hands) if i is not None}),
+            frozen({f'Face {i}': f for i, f in zip(face_ids, fused_faces) if i is not None})))
+        self.publish()
+
+    def subscribe(self, name, capacity=1, policy=LATEST):
+        channel = Channel(name, capacity, policy)
+        self.channels.append(channel)
+        return channel
+
+    def publish(self):
+        snapshot = self.coords_3d.read()
+        for channel in self.channels:
+            channel.put(snapshot)
+
+    def get3DCoordinates(self):
+        return self.coords_3d.read().data
+
+    def getOnScrenPixels(self):
+        hand_coords_3d, face_coords_3d = self.get3DCoordinates()
+        return screen_points(self.screens, hand_coords_3d, face_coords_3d)
+
+    def stop(self):
+        self.running = False
+        for channel in self.channels:
+            channel.close()
+        self.stop_event.set()
+        for worker in self.workers:
+            worker.join(timeout=2.0)
+            if worker.is_alive():
+                worker.terminate()
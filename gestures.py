@@ -0,0 +1,128 @@
+from typing import NamedTuple
+
+import numpy as np
+
+# Times in seconds, distances in metres (pinch) or screen pixels (movement)
+PRESS_THRESHOLD = 0.02
+RELEASE_THRESHOLD = 0.03
+RELEASE_TIME = 0.1
+CLICK_TIME = 0.35
+DOUBLE_CLICK_TIME = 0.45
+DRAG_DISTANCE = 25.0
+SCROLL_THRESHOLD = 0.025
+
+DOWN = 'down'
+UP = 'up'
+CLICK = 'click'
+DOUBLE_CLICK = 'double_click'
+DRAG = 'drag'
+SCROLL = 'scroll'
+
+
+class GestureEvent(NamedTuple):
+    kind: str
+    slot: int
+    timestamp: float
+    x: float
+    y: float
+    dx: float = 0.0
+    dy: float = 0.0
+
+
+class GestureEngine:
+    """Streaming pinch state machine for a fixed number of hand slots, updated for all slots at once.
+
+    Everything is time based, so behaviour does not change when the frame rate drops under load."""
+
+    def __init__(self, slots, press_threshold=PRESS_THRESHOLD, release_threshold=RELEASE_THRESHOLD,
+                 release_time=RELEASE_TIME, click_time=CLICK_TIME, double_click_time=DOUBLE_CLICK_TIME,
+                 drag_distance=DRAG_DISTANCE, scroll_threshold=SCROLL_THRESHOLD):
+        self.slots = slots
+        self.press_threshold = press_threshold
+        self.release_threshold = release_threshold
+        self.release_time = release_time
+        self.click_time = click_time
+        self.double_click_time = double_click_time
+        self.drag_distance = drag_distance
+        self.scroll_threshold = scroll_threshold
+
+        self.pressed = np.zeros(slots, dtype=bool)
+        self.dragging = np.zeros(slots, dtype=bool)
+        self.scrolling = np.zeros(slots, dtype=bool)
+        self.press_time = np.full(slots, -np.inf)
+        self.release_since = np.full(slots, np.nan)
+        self.last_click = np.full(slots, -np.inf)
+        self.press_position = np.zeros((slots, 2))
+        self.last_position = np.zeros((slots, 2))
+
+    def reset(self, mask, timestamp):
+        """Ends every gesture in the masked slots, e.g. when a slot is handed to another hand."""
+        mask = np.asarray(mask, dtype=bool)
+        events = [GestureEvent(UP, int(i), timestamp, *self.last_position[i]) for i in np.flatnonzero(mask & self.pressed)]
+        self.pressed[mask] = False
+        self.dragging[mask] = False
+        self.scrolling[mask] = False
+        self.release_since[mask] = np.nan
+        self.last_click[mask] = -np.inf
+        return events
+
+    def update(self, timestamp, active, pinch, positions, scroll_pinch=None):
+        """active: (S,) bool, pinch/scroll_pinch: (S,) metres (nan = unknown), positions: (S, 2) pixels."""
+        active = np.asarray(active, dtype=bool)
+        pinch = np.asarray(pinch, dtype=float)
+        positions = np.asarray(positions, dtype=float)
+        events = []
+
+        with np.errstate(invalid='ignore'):
+            below = active & (pinch < self.press_threshold)
+            above = pinch >= self.release_threshold
+
+        down = below & ~self.pressed
+        for i in np.flatnonzero(down):
+            events.append(GestureEvent(DOWN, int(i), timestamp, *positions[i]))
+        self.pressed |= down
+        self.press_time[down] = timestamp
+        self.press_position[down] = positions[down]
+        self.dragging[down] = False
+
+        # Release needs the pinch to stay open for release_time, or the hand to disappear
+        opening = self.pressed & above & active
+        self.release_since = np.where(opening, np.fmin(self.release_since, timestamp), np.nan)
+        release = self.pressed & ((opening & (timestamp - self.release_since >= self.release_time)) | ~active)
+        release_position = np.where(active[:, None], positions, self.last_position)
+
+        moved = np.linalg.norm(positions - self.press_position, axis=1)
+        start_drag = self.pressed & active & ~release & ~self.dragging & (moved > self.drag_distance)
+        self.dragging |= start_drag
+        for i in np.flatnonzero(self.dragging & active & ~release):
+            delta = positions[i] - self.last_position[i]
+            if start_drag[i] or delta.any():
+                events.append(GestureEvent(DRAG, int(i), timestamp, *positions[i], *delta))
+
+        for i in np.flatnonzero(release):
+            x, y = release_position[i]
+            events.append(GestureEvent(UP, int(i), timestamp, x, y))
+            if self.dragging[i] or timestamp - self.press_time[i] > self.click_time:
+                continue
+            events.append(GestureEvent(CLICK, int(i), timestamp, x, y))
+            if timestamp - self.last_click[i] <= self.double_click_time:
+                events.append(GestureEvent(DOUBLE_CLICK, int(i), timestamp, x, y))
+                self.last_click[i] = -np.inf
+            else:
+                self.last_click[i] = timestamp
+        self.pressed &= ~release
+        self.dragging &= ~release
+        self.release_since[release] = np.nan
+
+        # Thumb-to-middle pinch scrolls with the hand's vertical movement
+        if scroll_pinch is not None:
+            with np.errstate(invalid='ignore'):
+                scrolling = active & ~self.pressed & (np.asarray(scroll_pinch, dtype=float) < self.scroll_threshold)
+            for i in np.flatnonzero(scrolling & self.scrolling):
+                delta = positions[i] - self.last_position[i]
+                if delta[1]:
+                    events.append(GestureEvent(SCROLL, int(i), timestamp, *positions[i], *delta))
+            self.scrolling = scrolling
+
+        self.last_position[active] = positions[active]
+        return events
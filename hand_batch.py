@@ -0,0 +1,249 @@
+import os
+import threading
+
+import cv2
+import numpy as np
+
+try:
+    from tflite_runtime.interpreter import Interpreter
+except ImportError:
+    try:
+        from tensorflow.lite import Interpreter
+    except ImportError:
+        Interpreter = None
+
+import profiling
+from detectors import HandArrays, NO_HANDS, HAND_LANDMARKS, LEFT_HAND, RIGHT_HAND
+
+INPUT_SIZE = 224  # square RGB input of the hand landmark model
+ROI_SCALE = 2.0  # crop side relative to the landmark bounding box, as in MediaPipe's hand tracking
+MIN_ROI = 32  # pixels; smaller crops are too blurry to be worth running
+PRESENCE_THRESHOLD = 0.5
+BATCH_SIZES = (1, 2, 4, 8, 16)  # batches are padded up to one of these to limit tensor reallocations
+MAX_WAIT = 0.005  # seconds the first request of a batch waits for the other cameras
+MODEL_FILE = os.path.join('modules', 'hand_landmark', 'hand_landmark_lite.tflite')
+
+
+def default_model_path():
+    # The landmark model that mp.solutions.hands runs with model_complexity=0
+    import mediapipe
+    return os.path.join(os.path.dirname(mediapipe.__file__), MODEL_FILE)
+
+
+def rois_from_landmarks(landmarks, width, height):
+    """(H, 21, 3) normalised landmarks -> (H, 3) square crops as centre x, centre y, side in pixels."""
+    if len(landmarks) == 0:
+        return np.zeros((0, 3), np.float32)
+    points = landmarks[:, :, :2] * (width, height)
+    low = points.min(axis=1)
+    high = points.max(axis=1)
+    centre = (low + high) / 2
+    side = np.maximum((high - low).max(axis=1) * ROI_SCALE, MIN_ROI)
+    return np.column_stack([centre, side]).astype(np.float32)
+
+
+def rois_from_boxes(boxes):
+    """(x0, y0, x1, y1) pixel boxes, e.g. from Coordinates.getTrackROIs, -> (N, 3) square crops."""
+    boxes = np.asarray(list(boxes), np.float32).reshape(-1, 4)
+    centre = (boxes[:, :2] + boxes[:, 2:]) / 2
+    side = np.maximum((boxes[:, 2:] - boxes[:, :2]).max(axis=1), MIN_ROI)
+    return np.column_stack([centre, side]).astype(np.float32)
+
+
+def crop(image, rois, out=None):
+    """Warps each square ROI of an RGB image to the model input; out: (N, 224, 224, 3) uint8 to fill."""
+    if out is None:
+        out = np.empty((len(rois), INPUT_SIZE, INPUT_SIZE, 3), np.uint8)
+    for i, (cx, cy, side) in enumerate(rois):
+        scale = INPUT_SIZE / side
+        matrix = np.array([[scale, 0, (side / 2 - cx) * scale],
+                           [0, scale, (side / 2 - cy) * scale]], np.float32)
+        cv2.warpAffine(image, matrix, (INPUT_SIZE, INPUT_SIZE), dst=out[i], flags=cv2.INTER_LINEAR,
+                       borderMode=cv2.BORDER_CONSTANT)
+    return out
+
+
+def to_image(landmarks, rois, width, height):
+    """Crop-pixel landmarks (N, 21, 3) -> landmarks normalised to the full image, like the solutions API."""
+    scale = rois[:, 2, None] / INPUT_SIZE
+    origin = rois[:, :2] - rois[:, 2, None] / 2
+    result = np.empty_like(landmarks, dtype=np.float32)
+    result[:, :, 0] = (landmarks[:, :, 0] * scale + origin[:, None, 0]) / width
+    result[:, :, 1] = (landmarks[:, :, 1] * scale + origin[:, None, 1]) / height
+    result[:, :, 2] = landmarks[:, :, 2] * scale / width
+    return result
+
+
+class HandLandmarkModel:
+    """The TFLite hand landmark model run directly, on a whole batch of crops per invoke()."""
+
+    def __init__(self, model_path=None, num_threads=None):
+        if Interpreter is None:
+            raise RuntimeError('No TFLite interpreter found, install one with: pip install tflite-runtime')
+        self.model_path = model_path or default_model_path()
+        self.interpreter = Interpreter(model_path=self.model_path, num_threads=num_threads)
+        self.input_index = self.interpreter.get_input_details()[0]['index']
+        # Outputs in model order: landmarks, presence, handedness, world landmarks. Tensor names differ
+        # between exports, so the landmarks are picked by shape and the two scores by their order.
+        outputs = self.interpreter.get_output_details()
+        points = [d['index'] for d in outputs if d['shape'][-1] == HAND_LANDMARKS * 3]
+        scores = [d['index'] for d in outputs if d['shape'][-1] == 1]
+        if not points or len(scores) < 2:
+            raise RuntimeError(f'{self.model_path} does not have the outputs of a hand landmark model')
+        self.landmarks_index = points[0]
+        self.presence_index, self.handedness_index = scores[:2]
+        self.batch = 0
+        self.batchable = True
+        self.buffer = np.zeros((0, INPUT_SIZE, INPUT_SIZE, 3), np.float32)
+        self.invokes = 0
+        self.crops = 0
+        self.resize(1)
+
+    def resize(self, batch):
+        if batch == self.batch:
+            return
+        self.interpreter.resize_tensor_input(self.input_index, [batch, INPUT_SIZE, INPUT_SIZE, 3])
+        self.interpreter.allocate_tensors()
+        self.batch = batch
+        self.buffer = np.zeros((batch, INPUT_SIZE, INPUT_SIZE, 3), np.float32)
+
+    def infer(self, crops):
+        """crops: (N, 224, 224, 3) uint8 RGB. Returns crop-pixel landmarks (N, 21, 3), presence and
+        right-hand probability (N,)."""
+        n = len(crops)
+        if n == 0:
+            return np.zeros((0, HAND_LANDMARKS, 3), np.float32), np.zeros(0, np.float32), np.zeros(0, np.float32)
+        if self.batchable:
+            try:
+                self.resize(next((b for b in BATCH_SIZES if b >= n), n))
+            except (RuntimeError, ValueError):
+                # Models exported with a fixed batch of one still work, one crop per invoke
+                print('Hand landmark model has a fixed batch size, running crops one at a time')
+                self.batchable = False
+                self.batch = 0
+                self.resize(1)
+        results = [self.run(crops[i:i + self.batch]) for i in range(0, n, self.batch)]
+        landmarks, presence, handedness = (np.concatenate(r) for r in zip(*results))
+        self.crops += n
+        return landmarks.reshape(n, HAND_LANDMARKS, 3), presence.reshape(n), handedness.reshape(n)
+
+    def run(self, crops):
+        n = len(crops)
+        np.multiply(crops, 1 / 255, out=self.buffer[:n], casting='unsafe')
+        self.buffer[n:] = 0
+        self.interpreter.set_tensor(self.input_index, self.buffer)
+        self.interpreter.invoke()
+        self.invokes += 1
+        get = self.interpreter.get_tensor
+        return (get(self.landmarks_index)[:n].reshape(n, -1), get(self.presence_index)[:n].reshape(n),
+                get(self.handedness_index)[:n].reshape(n))
+
+
+class Request:
+    __slots__ = ('crops', 'rois', 'width', 'height', 'result', 'done')
+
+    def __init__(self, crops, rois, width, height):
+        self.crops = crops
+        self.rois = rois
+        self.width = width
+        self.height = height
+        self.result = None
+        self.done = False
+
+
+class HandBatcher:
+    """Collects the ROI crops of several trackers and runs them through the model together.
+
+    The first tracker to submit waits up to max_wait for the other clients (the other camera of the
+    stereo pair), then runs every pending crop in one batch and hands each tracker its own hands."""
+
+    def __init__(self, model, clients=2, max_wait=MAX_WAIT, threshold=PRESENCE_THRESHOLD):
+        self.model = model
+        self.clients = clients
+        self.max_wait = max_wait
+        self.threshold = threshold
+        self.pending = []
+        self.condition = threading.Condition()
+        self.leading = False
+        # Clients that have nothing to track this frame; the batch does not wait for them
+        self.skipped = 0
+        self.batches = 0
+        self.requests = 0
+
+    def submit(self, image, rois, frame=-1):
+        """image: RGB frame; rois: (N, 3) square crops. Blocks until the batch containing them has run."""
+        height, width = image.shape[:2]
+        with profiling.span('hands crop', frame):
+            request = Request(crop(image, rois), rois, width, height)
+        with self.condition:
+            self.pending.append(request)
+            self.condition.notify_all()
+            # A request that arrives while a batch runs leads the next one
+            while self.leading and not request.done:
+                self.condition.wait()
+            if request.done:
+                return request.result
+            self.leading = True
+            self.condition.wait_for(lambda: len(self.pending) + self.skipped >= self.clients, self.max_wait)
+            batch, self.pending = self.pending, []
+            self.skipped = 0
+
+        try:
+            with profiling.span('hands batch', frame):
+                self.run(batch)
+        finally:
+            with self.condition:
+                self.leading = False
+                for r in batch:
+                    r.done = True
+                self.condition.notify_all()
+        return request.result
+
+    def track(self, image, hands, boxes=(), frame=-1):
+        """Landmarks in image for the previous frame's hands plus any extra pixel boxes not already
+        covered by one of them. Returns None when there is nothing to track."""
+        height, width = image.shape[:2]
+        rois = rois_from_landmarks(hands.landmarks, width, height)
+        extra = rois_from_boxes(boxes)
+        if len(rois) and len(extra):
+            covered = (np.abs(extra[:, None, :2] - rois[None, :, :2]) < rois[None, :, 2:] / 2).all(axis=2)
+            extra = extra[~covered.any(axis=1)]
+        rois = np.concatenate([rois, extra])
+        if not len(rois):
+            self.skip()
+            return None
+        return self.submit(image, rois, frame)
+
+    def skip(self):
+        """Tells the batch being collected that one client has nothing to submit for this frame."""
+        with self.condition:
+            self.skipped = min(self.skipped + 1, self.clients - 1)
+            self.condition.notify_all()
+
+    def run(self, batch):
+        crops = np.concatenate([r.crops for r in batch])
+        landmarks, presence, handedness = self.model.infer(crops)
+        self.batches += 1
+        self.requests += len(batch)
+        start = 0
+        for r in batch:
+            end = start + len(r.rois)
+            found = presence[start:end] >= self.threshold
+            if found.any():
+                image_landmarks = to_image(landmarks[start:end][found], r.rois[found], r.width, r.height)
+                right = handedness[start:end][found]
+                r.result = HandArrays(image_landmarks,
+                                      np.where(right > 0.5, RIGHT_HAND, LEFT_HAND).astype(np.int8),
+                                      np.maximum(right, 1 - right).astype(np.float32))
+            else:
+                r.result = NO_HANDS
+            start = end
+
+    def stats(self):
+        return {'batches': self.batches, 'requests': self.requests, 'crops': self.model.crops,
+                'invokes': self.model.invokes}
+
+    def format_stats(self):
+        s = self.stats()
+        return (f"Hand batches: {s['batches']} batches of {s['requests']} requests, {s['crops']} crops "
+                f"in {s['invokes']} model invokes, {s['crops'] / max(s['batches'], 1):.1f} crops per batch")
@@ -0,0 +1,59 @@
+import numpy as np
+
+# MediaPipe hand landmark indices
+WRIST = 0
+THUMB_MCP = 2
+THUMB_IP = 3
+THUMB_TIP = 4
+INDEX_PIP = 6
+INDEX_DIP = 7
+INDEX_TIP = 8
+MIDDLE_PIP = 10
+MIDDLE_DIP = 11
+MIDDLE_TIP = 12
+
+# Distal/middle phalanx length ratios used to predict a tip from the joints behind it
+THUMB_RATIO = 0.85
+INDEX_RATIO = 0.80
+MIDDLE_RATIO = 0.80
+
+EPIPOLAR_SIGMA = 6.0  # pixels of left/right row mismatch before a landmark loses half its weight
+HAND_DEPTH_SPAN = 0.15  # metres; landmarks further than this from the hand's median depth are outliers
+
+
+def landmark_weights(points, left, right):
+    """Per-landmark weights in [0, 1] from stereo row consistency and depth plausibility.
+
+    points: (N, 21, 3) triangulated landmarks, left/right: (N, 21, 2) pixel positions."""
+    row_error = np.abs(left[..., 1] - right[..., 1])
+    weights = 1.0 / (1.0 + (row_error / EPIPOLAR_SIGMA) ** 2)
+
+    depth = points[..., 2]
+    # Landmarks rejected by the triangulation are NaN and must not take the whole hand with them
+    median_depth = np.nanmedian(depth, axis=1, keepdims=True)
+    weights = np.where(np.isfinite(depth) & (np.abs(depth - median_depth) < HAND_DEPTH_SPAN), weights, 0.0)
+    return weights
+
+
+def robust_tip(points, weights, tip, dip, pip, ratio):
+    # Blend the measured tip with the tip extrapolated from the two joints behind it
+    predicted = points[:, dip] + (points[:, dip] - points[:, pip]) * ratio
+    w_tip = weights[:, tip][:, None]
+    w_predicted = (weights[:, dip] * weights[:, pip])[:, None]
+    total = w_tip + w_predicted
+    measured = np.where(np.isfinite(points[:, tip]), points[:, tip], 0.0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        blended = (w_tip * measured + w_predicted * np.nan_to_num(predicted)) / total
+    return np.where(total > 0, blended, np.nan)
+
+
+def fit_hands(points, left, right, scores):
+    """Robust hand keypoints for N hands from all 21 triangulated landmarks.
+
+    Returns (thumb_tips, index_tips, middle_tips, confidence), (N, 3) each and (N,)."""
+    weights = landmark_weights(points, left, right)
+    thumb = robust_tip(points, weights, THUMB_TIP, THUMB_IP, THUMB_MCP, THUMB_RATIO)
+    index = robust_tip(points, weights, INDEX_TIP, INDEX_DIP, INDEX_PIP, INDEX_RATIO)
+    middle = robust_tip(points, weights, MIDDLE_TIP, MIDDLE_DIP, MIDDLE_PIP, MIDDLE_RATIO)
+    confidence = weights.mean(axis=1) * scores
+    return thumb, index, middle, confidence
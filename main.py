@@ -1,9 +1,13 @@
+import sys
 
+import pipeline
 
-def main():
 
+def main():
+    # Usage: python main.py [config.json]
+    path = sys.argv[1] if len(sys.argv) > 1 else pipeline.CONFIG_FILE
+    pipeline.run(path)
 
-    return
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
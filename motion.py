@@ -0,0 +1,81 @@
+import cv2
+import numpy as np
+
+SIZE = (80, 60)  # tiny grayscale copy the gate compares
+THRESHOLD = 8  # grey levels a pixel has to change by to count as moving
+MIN_MOTION = 0.01  # fraction of moving pixels, in the tracked regions or the whole frame, that counts as motion
+MAX_SKIPS = 5  # skipped frames in a row before the detector runs regardless
+MARGIN = 0.05  # tracked regions are grown by this much of the frame on each side
+
+
+def hand_regions(hands):
+    """(H, 4) normalised xmin, ymin, xmax, ymax boxes around each hand's landmarks."""
+    points = hands.landmarks[:, :, :2]
+    return np.concatenate([points.min(axis=1), points.max(axis=1)], axis=1)
+
+
+def face_regions(faces):
+    return np.concatenate([faces.boxes[:, :2], faces.boxes[:, :2] + faces.boxes[:, 2:]], axis=1)
+
+
+class MotionGate:
+    """Decides whether a detector can skip a frame and keep its previous results.
+
+    Each frame is shrunk to a tiny grayscale copy and compared with the copy of the last frame the
+    detector ran on, so slow drift still adds up. A frame is static when few pixels changed both
+    inside the regions of the tracked hands or faces and across the whole frame."""
+
+    def __init__(self, name, size=SIZE, threshold=THRESHOLD, min_motion=MIN_MOTION, max_skips=MAX_SKIPS,
+                 margin=MARGIN):
+        self.name = name
+        self.size = tuple(size)
+        self.threshold = threshold
+        self.min_motion = min_motion
+        self.max_skips = max_skips
+        self.margin = margin
+        self.reference = None
+        self.skipped = 0
+
+        self.frames = 0
+        self.skips = 0
+        self.forced = 0
+
+    def tiny(self, image):
+        grey = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+        return cv2.resize(grey, self.size, interpolation=cv2.INTER_AREA)
+
+    def motion(self, tiny, regions):
+        moving = cv2.absdiff(tiny, self.reference) > self.threshold
+        energy = moving.mean()
+        if regions is not None and len(regions):
+            w, h = self.size
+            boxes = np.clip(regions + (-self.margin, -self.margin, self.margin, self.margin), 0, 1)
+            boxes = np.rint(boxes * (w, h, w, h)).astype(np.intp)
+            mask = np.zeros_like(moving)
+            for x0, y0, x1, y1 in boxes:
+                mask[y0:max(y1, y0 + 1), x0:max(x1, x0 + 1)] = True
+            energy = max(energy, moving[mask].mean())
+        return energy
+
+    def static(self, image, regions=None):
+        """True when the detector can skip image; regions are normalised boxes of what it tracks."""
+        self.frames += 1
+        tiny = self.tiny(image)
+        if self.reference is not None and self.motion(tiny, regions) < self.min_motion:
+            if self.skipped < self.max_skips:
+                self.skipped += 1
+                self.skips += 1
+                return True
+            self.forced += 1
+        self.reference = tiny
+        self.skipped = 0
+        return False
+
+    def stats(self):
+        return {'frames': self.frames, 'skipped': self.skips, 'forced': self.forced,
+                'skip_rate': self.skips / max(self.frames, 1)}
+
+    def format_stats(self):
+        s = self.stats()
+        return (f"Motion gate ({self.name}): {s['skipped']} of {s['frames']} frames skipped "
+                f"({s['skip_rate'] * 100:.0f}%), {s['forced']} static frames run after {self.max_skips} skips")
@@ -0,0 +1,352 @@
+import math
+import os
+import socket
+import struct
+import time
+from threading import Thread
+
+import numpy as np
+
+from channels import Channel, LATEST
+from coordinates import Points3D, nearest_face, screen_points
+from cursor import MouseState
+from screens import ScreenLayout
+from snapshots import Publisher, frozen
+from utils import Point2D, Point3D
+
+FPS_MS = 0.033
+
+MAGIC = b'HC'
+VERSION = 2
+DELTA = 0x01
+KEYFRAME_INTERVAL = 10  # a lost keyframe costs the delta frames up to the next one
+DELTA_RANGE = 0.5  # largest per-value change (metres) sent as a float16 delta against the keyframe
+MAX_DATAGRAM = 65507
+
+HAND_FIELDS = ('wrist', 'thumb_tip', 'index_tip', 'middle_tip')
+
+# magic, version, flags, sequence, keyframe sequence, sender time,
+# full hands, delta hands, full faces, delta faces, cursors
+HEADER = struct.Struct('<2sBBIId5B')
+# track id, 4 points, confidence
+HAND = struct.Struct('<i13f')
+HAND_DELTA = struct.Struct('<i13e')
+# track id, eye midpoint
+FACE = struct.Struct('<i3f')
+FACE_DELTA = struct.Struct('<i3e')
+# slot, flags, screen id, track id (-1 = none), x, y, pinch distance (nan = none)
+CURSOR = struct.Struct('<BBbi3f')
+HAS_POSITION = 0x01
+PRESSED = 0x02
+
+
+def label_id(label):
+    return int(label.rsplit(' ', 1)[1])
+
+
+def hand_values(hand):
+    values = [c for name in HAND_FIELDS for c in (hand[name].x, hand[name].y, hand[name].z)]
+    values.append(hand.get('confidence', 1.0))
+    return np.array(values, dtype=np.float32)
+
+
+def hand_from_values(values):
+    values = values.tolist()
+    hand = {name: Point3D(*values[3 * i:3 * i + 3]) for i, name in enumerate(HAND_FIELDS)}
+    hand['confidence'] = values[12]
+    return frozen(hand)
+
+
+class FrameEncoder:
+    """Packs Points3D and cursor state into one datagram.
+
+    With delta encoding, records are sent as float16 differences against the last keyframe. A lost
+    delta frame only costs itself, but a lost keyframe makes every delta frame up to the next
+    keyframe undecodable, up to keyframe_interval - 1 frames."""
+
+    def __init__(self, delta=False, keyframe_interval=KEYFRAME_INTERVAL):
+        self.delta = delta
+        self.keyframe_interval = keyframe_interval
+        self.sequence = 0
+        self.keyframe = None
+
+    def encode(self, points, mice=None, timestamp=None):
+        hand_coords_3d, face_coords_3d = points
+        mice = mice or {}
+        if timestamp is None:
+            timestamp = time.time()
+        self.sequence += 1
+
+        hands = {label_id(label): hand_values(hand) for label, hand in hand_coords_3d.items()}
+        faces = {label_id(label): np.array([face.x, face.y, face.z], dtype=np.float32)
+                 for label, face in face_coords_3d.items()}
+
+        is_delta = self.delta and self.keyframe is not None and \
+            self.sequence - self.keyframe[0] < self.keyframe_interval
+        if not is_delta:
+            if self.delta:
+                self.keyframe = (self.sequence, hands, faces)
+            base_sequence, base_hands, base_faces = self.sequence, {}, {}
+        else:
+            base_sequence, base_hands, base_faces = self.keyframe
+
+        full_hands, delta_hands = self.split(hands, base_hands, HAND, HAND_DELTA)
+        full_faces, delta_faces = self.split(faces, base_faces, FACE, FACE_DELTA)
+        cursors = [self.pack_cursor(slot, mouse) for slot, mouse in mice.items()]
+
+        header = HEADER.pack(MAGIC, VERSION, DELTA if is_delta else 0, self.sequence, base_sequence, timestamp,
+                             len(full_hands), len(delta_hands), len(full_faces), len(delta_faces), len(cursors))
+        return b''.join([header] + full_hands + delta_hands + full_faces + delta_faces + cursors)
+
+    def split(self, records, base, full, delta):
+        full_records = []
+        delta_records = []
+        for record_id, values in records.items():
+            if record_id in base:
+                difference = values - base[record_id]
+                # NaNs and large jumps fail the comparison and go out in full
+                if np.all(np.abs(difference) <= DELTA_RANGE):
+                    delta_records.append(delta.pack(record_id, *difference.tolist()))
+                    continue
+            full_records.append(full.pack(record_id, *values.tolist()))
+        return full_records, delta_records
+
+    def pack_cursor(self, slot, mouse):
+        flags = (HAS_POSITION if mouse.position is not None else 0) | (PRESSED if mouse.pressed else 0)
+        x, y = (mouse.position.x, mouse.position.y) if mouse.position is not None else (math.nan, math.nan)
+        track = -1 if mouse.track is None else label_id(mouse.track)
+        pinch = math.nan if mouse.pinch_distance is None else mouse.pinch_distance
+        return CURSOR.pack(slot, flags, mouse.screen_id, track, x, y, pinch)
+
+
+class FrameDecoder:
+    """Unpacks datagrams from FrameEncoder and counts lost, late and undecodable frames."""
+
+    def __init__(self):
+        self.last_sequence = None
+        self.keyframe = None
+        self.received = 0
+        self.lost = 0
+        self.late = 0
+        self.missing_keyframe = 0
+
+    def decode(self, payload):
+        """Returns (sequence, sender time, Points3D, mice), or None for frames that cannot be used."""
+        magic, version, flags, sequence, base_sequence, timestamp, \
+            full_hands, delta_hands, full_faces, delta_faces, cursors = HEADER.unpack_from(payload)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f'Not a hand frame (magic {magic!r}, version {version})')
+        size = HEADER.size + full_hands * HAND.size + delta_hands * HAND_DELTA.size + full_faces * FACE.size + \
+            delta_faces * FACE_DELTA.size + cursors * CURSOR.size
+        if len(payload) < size:
+            raise ValueError(f'Truncated hand frame ({len(payload)} of {size} bytes)')
+
+        offset = HEADER.size
+        hands, offset = self.unpack(payload, offset, HAND, full_hands)
+        hand_deltas, offset = self.unpack(payload, offset, HAND_DELTA, delta_hands)
+        faces, offset = self.unpack(payload, offset, FACE, full_faces)
+        face_deltas, offset = self.unpack(payload, offset, FACE_DELTA, delta_faces)
+        has_keyframe = self.keyframe is not None and self.keyframe[0] == base_sequence
+        if flags & DELTA and has_keyframe:
+            unknown = (hand_deltas.keys() - self.keyframe[1].keys()) | (face_deltas.keys() - self.keyframe[2].keys())
+            if unknown:
+                raise ValueError(f'Delta records {sorted(unknown)} are not in keyframe {base_sequence}')
+
+        if self.last_sequence is not None:
+            if sequence <= self.last_sequence:
+                self.late += 1
+                return None
+            self.lost += sequence - self.last_sequence - 1
+        self.last_sequence = sequence
+        self.received += 1
+
+        if flags & DELTA:
+            if not has_keyframe:
+                self.missing_keyframe += 1
+                return None
+            _, base_hands, base_faces = self.keyframe
+            hands.update({i: base_hands[i] + d for i, d in hand_deltas.items()})
+            faces.update({i: base_faces[i] + d for i, d in face_deltas.items()})
+        else:
+            self.keyframe = (sequence, hands, faces)
+
+        mice = {}
+        for _ in range(cursors):
+            slot, cursor_flags, screen_id, track, x, y, pinch = CURSOR.unpack_from(payload, offset)
+            offset += CURSOR.size
+            mice[slot] = MouseState(Point2D(x, y) if cursor_flags & HAS_POSITION else None,
+                                    bool(cursor_flags & PRESSED),
+                                    None if math.isnan(pinch) else pinch,
+                                    None if track < 0 else f'Hand {track}',
+                                    screen_id)
+
+        points = Points3D(
+            frozen({f'Hand {i}': hand_from_values(values) for i, values in hands.items()}),
+            frozen({f'Face {i}': Point3D(*values.tolist()) for i, values in faces.items()}))
+        return sequence, timestamp, points, frozen(mice)
+
+    def unpack(self, payload, offset, record, count):
+        records = {}
+        for _ in range(count):
+            record_id, *values = record.unpack_from(payload, offset)
+            records[record_id] = np.array(values, dtype=np.float32)
+            offset += record.size
+        return records, offset
+
+    def stats(self):
+        return {'received': self.received, 'lost': self.lost, 'late': self.late,
+                'missing_keyframe': self.missing_keyframe}
+
+
+def open_socket(address):
+    # A string is a local (unix datagram) socket path, a tuple a UDP host and port
+    family = socket.AF_UNIX if isinstance(address, str) else socket.AF_INET
+    return socket.socket(family, socket.SOCK_DGRAM)
+
+
+class NetworkPublisher:
+    """Streams every new Coordinates generation, plus the cursor state, as binary datagrams."""
+
+    def __init__(self, coordinates, address=None, cursor=None, sock=None, delta=False,
+                 keyframe_interval=KEYFRAME_INTERVAL, threaded=True):
+        self.coordinates = coordinates
+        self.cursor = cursor
+        self.address = address
+        # A connected socket (e.g. one end of a socketpair) is used as is
+        self.sock = sock if sock is not None else open_socket(address)
+        self.encoder = FrameEncoder(delta, keyframe_interval)
+        self.sent = 0
+        self.bytes_sent = 0
+        self.errors = 0
+
+        self.running = True
+        self.thread = None
+        if threaded:
+            self.points = coordinates.subscribe('network frames')
+            self.thread = Thread(target=self.update, args=(), daemon=True)
+            self.thread.start()
+
+    def update(self):
+        while self.running:
+            snapshot = self.points.get(timeout=FPS_MS)
+            if snapshot is None:
+                continue
+            # The cursor state is the one from the previous tick; it runs on its own thread
+            mice = self.cursor.get_mice() if self.cursor is not None else None
+            self.send(self.coordinates.get3DCoordinates(), mice)
+
+    def send(self, points, mice=None, timestamp=None):
+        payload = self.encoder.encode(points, mice, timestamp)
+        try:
+            if self.address is None:
+                self.sock.send(payload)
+            else:
+                self.sock.sendto(payload, self.address)
+        except OSError:
+            # Nobody listening yet; datagrams are fire and forget
+            self.errors += 1
+            return payload
+        self.sent += 1
+        self.bytes_sent += len(payload)
+        return payload
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join(timeout=1.0)
+        self.sock.close()
+
+
+class RemoteCoordinates:
+    """Client side of NetworkPublisher with the Coordinates API.
+
+    Screen pixels are computed locally, so each display machine passes its own screen layout."""
+
+    def __init__(self, address=None, sock=None, screens=None, threaded=True):
+        self.address = address
+        if sock is None:
+            sock = open_socket(address)
+            if isinstance(address, str) and os.path.exists(address):
+                os.unlink(address)
+            sock.bind(address)
+        self.sock = sock
+        if screens is not None and not isinstance(screens, ScreenLayout):
+            screens = ScreenLayout(screens)
+        self.screens = screens
+
+        self.decoder = FrameDecoder()
+        self.undecodable = 0
+        self.coords_3d = Publisher(Points3D(frozen({}), frozen({})))
+        self.mice = Publisher(frozen({}))
+        self.remote_timestamp = None
+        self.channels = []
+
+        self.running = True
+        self.thread = None
+        if threaded:
+            self.thread = Thread(target=self.update, args=(), daemon=True)
+            self.thread.start()
+
+    def update(self):
+        while self.running:
+            self.receive(timeout=FPS_MS)
+
+    def receive(self, timeout=None):
+        """Reads one datagram; returns True when it produced a new generation."""
+        self.sock.settimeout(timeout)
+        try:
+            payload = self.sock.recv(MAX_DATAGRAM)
+        except (socket.timeout, OSError):
+            return False
+        try:
+            frame = self.decoder.decode(payload)
+        except (ValueError, struct.error):
+            # Stray or truncated datagram
+            self.undecodable += 1
+            return False
+        if frame is None:
+            return False
+        _, self.remote_timestamp, points, mice = frame
+        self.mice.publish(mice)
+        self.coords_3d.publish(points)
+        self.publish()
+        return True
+
+    def subscribe(self, name, capacity=1, policy=LATEST):
+        channel = Channel(name, capacity, policy)
+        self.channels.append(channel)
+        return channel
+
+    def publish(self):
+        snapshot = self.coords_3d.read()
+        for channel in self.channels:
+            channel.put(snapshot)
+
+    def get3DCoordinates(self):
+        return self.coords_3d.read().data
+
+    def getNearestFace(self, hand_point, face_coords_3d):
+        return nearest_face(hand_point, face_coords_3d)
+
+    def getOnScrenPixels(self):
+        hand_coords_3d, face_coords_3d = self.get3DCoordinates()
+        return screen_points(self.screens, hand_coords_3d, face_coords_3d)
+
+    def get_mice(self):
+        return self.mice.read().data
+
+    def get_mice_data(self):
+        return {label: mouse.position for label, mouse in self.get_mice().items()}
+
+    def stats(self):
+        return dict(self.decoder.stats(), undecodable=self.undecodable)
+
+    def stop(self):
+        self.running = False
+        for channel in self.channels:
+            channel.close()
+        if self.thread is not None:
+            self.thread.join(timeout=1.0)
+        self.sock.close()
+        if isinstance(self.address, str) and os.path.exists(self.address):
+            os.unlink(self.address)
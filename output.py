@@ -0,0 +1,145 @@
+import os
+import struct
+
+try:
+    from evdev import UInput, AbsInfo
+except ImportError:
+    UInput = None
+    AbsInfo = None
+
+import gestures
+
+# linux/input-event-codes.h
+EV_SYN = 0x00
+EV_KEY = 0x01
+EV_REL = 0x02
+EV_ABS = 0x03
+SYN_REPORT = 0
+ABS_X = 0x00
+ABS_Y = 0x01
+REL_WHEEL = 0x08
+BTN_LEFT = 0x110
+BTN_RIGHT = 0x111
+
+# struct input_event: timeval (ignored by uinput), type, code, value
+INPUT_EVENT = struct.Struct('llHHi')
+SYN = INPUT_EVENT.pack(0, 0, EV_SYN, SYN_REPORT, 0)
+
+SCROLL_STEP = 40.0  # screen pixels of hand movement per wheel notch
+
+
+def pack(events):
+    return b''.join(INPUT_EVENT.pack(0, 0, type_, code, value) for type_, code, value in events)
+
+
+def unpack(payload):
+    return [(type_, code, value) for _, _, type_, code, value in INPUT_EVENT.iter_unpack(payload)]
+
+
+class UInputSink:
+    """Absolute-positioning virtual pointer; every payload goes out in a single write()."""
+
+    def __init__(self, name, width, height):
+        if UInput is None:
+            raise RuntimeError('evdev is not installed, install it with: pip install evdev')
+        capabilities = {
+            EV_KEY: [BTN_LEFT, BTN_RIGHT],
+            EV_ABS: [(ABS_X, AbsInfo(0, 0, width - 1, 0, 0, 0)),
+                     (ABS_Y, AbsInfo(0, 0, height - 1, 0, 0, 0))],
+            EV_REL: [REL_WHEEL],
+        }
+        self.device = UInput(capabilities, name=name)
+
+    def write(self, payload):
+        os.write(self.device.fd, payload)
+
+    def close(self):
+        self.device.close()
+
+
+class MemorySink:
+    """Stand-in for UInputSink that records payloads, for running without /dev/uinput."""
+
+    def __init__(self, name, width, height):
+        self.name = name
+        self.width = width
+        self.height = height
+        self.writes = []
+
+    def write(self, payload):
+        self.writes.append(payload)
+
+    def events(self):
+        return [unpack(payload) for payload in self.writes]
+
+    def close(self):
+        pass
+
+
+class PointerOutput:
+    """One virtual pointer per Cursor mouse, updated once per cursor tick.
+
+    width and height are the pixel size of each screen; the pointers span the whole desktop."""
+
+    def __init__(self, mice_count, width, height, sink=UInputSink, screen_offsets=None, mirror=True):
+        self.width = width
+        self.height = height
+        # Desktop position of each screen's top-left pixel, for multi-screen layouts
+        self.screen_offsets = screen_offsets or {0: (0, 0)}
+        self.desktop_width = max(x for x, _ in self.screen_offsets.values()) + width
+        self.desktop_height = max(y for _, y in self.screen_offsets.values()) + height
+        # The screen mapping is in camera orientation; mirror it like the demos do
+        self.mirror = mirror
+
+        self.sinks = {i: sink(f'Hand Pointer {i}', self.desktop_width, self.desktop_height)
+                      for i in range(mice_count)}
+        self.positions = {i: None for i in range(mice_count)}
+        self.scroll = {i: 0.0 for i in range(mice_count)}
+
+    def desktop_position(self, mouse):
+        # Mirrored within its own screen, so the screen keeps its place on the desktop
+        x = min(max(int(round(mouse.position.x)), 0), self.width - 1)
+        y = min(max(int(round(mouse.position.y)), 0), self.height - 1)
+        if self.mirror:
+            x = self.width - 1 - x
+        offset_x, offset_y = self.screen_offsets.get(mouse.screen_id, (0, 0))
+        return x + offset_x, y + offset_y
+
+    def apply(self, mice, events):
+        pending = {label: [] for label in self.sinks}
+        for label, mouse in mice.items():
+            if label not in self.sinks or mouse.position is None:
+                continue
+            position = self.desktop_position(mouse)
+            previous = self.positions[label]
+            if previous is None or position[0] != previous[0]:
+                pending[label].append((EV_ABS, ABS_X, position[0]))
+            if previous is None or position[1] != previous[1]:
+                pending[label].append((EV_ABS, ABS_Y, position[1]))
+            self.positions[label] = position
+
+        for event in events:
+            if event.slot not in pending:
+                continue
+            if event.kind == gestures.DOWN:
+                pending[event.slot].append((EV_KEY, BTN_LEFT, 1))
+            elif event.kind == gestures.UP:
+                # A press and release in the same tick need a report between them to register
+                if (EV_KEY, BTN_LEFT, 1) in pending[event.slot]:
+                    pending[event.slot].append((EV_SYN, SYN_REPORT, 0))
+                pending[event.slot].append((EV_KEY, BTN_LEFT, 0))
+            elif event.kind == gestures.SCROLL:
+                self.scroll[event.slot] -= event.dy / SCROLL_STEP
+                notches = int(self.scroll[event.slot])
+                if notches:
+                    self.scroll[event.slot] -= notches
+                    pending[event.slot].append((EV_REL, REL_WHEEL, notches))
+
+        # Unchanged pointers are skipped; the rest get one write ending in SYN_REPORT
+        for label, batch in pending.items():
+            if batch:
+                self.sinks[label].write(pack(batch) + SYN)
+
+    def close(self):
+        for sink in self.sinks.values():
+            sink.close()
@@ -0,0 +1,84 @@
+import colorsys
+
+import cv2
+import numpy as np
+
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+CURSOR_RADIUS = 20
+PADDING = 4
+
+
+class OverlayRenderer:
+    """Cursor overlay that redraws only what changed.
+
+    Static text is rendered once into a persistent background. Each frame restores the rectangles
+    drawn on the previous frame from that background, and the horizontal mirror is applied to
+    coordinates instead of flipping the whole image."""
+
+    def __init__(self, width, height, background=255, mirror=True):
+        self.width = width
+        self.height = height
+        self.mirror = mirror
+        self.background = np.full((height, width, 3), background, dtype=np.uint8)
+        self.canvas = self.background.copy()
+        self.drawn = []
+
+    def add_static_text(self, text, org, scale, color, thickness=1):
+        # Drawn straight into the background (and canvas), never redrawn
+        for image in (self.background, self.canvas):
+            cv2.putText(image, text, org, FONT, scale, color, thickness)
+
+    def begin(self):
+        for x0, y0, x1, y1 in self.drawn:
+            self.canvas[y0:y1, x0:x1] = self.background[y0:y1, x0:x1]
+        self.drawn = []
+
+    def mark(self, x0, y0, x1, y1):
+        x0 = max(0, x0 - PADDING)
+        y0 = max(0, y0 - PADDING)
+        x1 = min(self.width, x1 + PADDING)
+        y1 = min(self.height, y1 + PADDING)
+        if x0 < x1 and y0 < y1:
+            self.drawn.append((x0, y0, x1, y1))
+
+    def screen_x(self, x):
+        return self.width - 1 - x if self.mirror else x
+
+    def text(self, text, org, scale, color, thickness=1):
+        (w, h), baseline = cv2.getTextSize(text, FONT, scale, thickness)
+        cv2.putText(self.canvas, text, org, FONT, scale, color, thickness)
+        self.mark(org[0], org[1] - h, org[0] + w, org[1] + baseline)
+
+    def cursor(self, x, y, color, border_color=(0, 0, 0), border_thickness=2, labels=()):
+        """Draws a cursor at unmirrored screen position (x, y) with text labels (text, dx, dy, scale, color, thickness)."""
+        x = self.screen_x(int(x))
+        y = int(y)
+        cv2.circle(self.canvas, (x, y), CURSOR_RADIUS, color, -1)
+        cv2.circle(self.canvas, (x, y), CURSOR_RADIUS + 2, border_color, border_thickness)
+        cv2.line(self.canvas, (x - 10, y), (x + 10, y), (0, 0, 0), 1)
+        cv2.line(self.canvas, (x, y - 10), (x, y + 10), (0, 0, 0), 1)
+        extent = CURSOR_RADIUS + 2 + border_thickness
+        self.mark(x - extent, y - extent, x + extent + 1, y + extent + 1)
+        for text, dx, dy, scale, text_color, thickness in labels:
+            self.text(text, (x + dx, y + dy), scale, text_color, thickness)
+
+    def frame(self):
+        return self.canvas
+
+
+def generate_unique_colors(n):
+    """Generate n visually distinct colors using HSV color space"""
+    colors = []
+    for i in range(n):
+        hue = i / n  # Distribute hues evenly across color wheel
+        saturation = 0.8  # High saturation for vibrant colors
+        value = 0.9  # High value for bright colors
+
+        # Convert HSV to RGB (0-1 range)
+        rgb = colorsys.hsv_to_rgb(hue, saturation, value)
+
+        # Convert to BGR (0-255 range) for OpenCV
+        bgr = (int(rgb[2] * 255), int(rgb[1] * 255), int(rgb[0] * 255))
+        colors.append(bgr)
+
+    return colors
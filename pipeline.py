@@ -0,0 +1,566 @@
+import asyncio
+import json
+import math
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Thread
+
+import cv2
+
+import affinity
+import backends
+import calibration
+import detectors
+import profiling
+import stream
+from async_pipeline import AsyncPipeline
+from channels import format_stats
+from coordinates import Coordinates
+from cursor import Cursor
+from fusion import Rig, RigFusion
+from hand_batch import HandBatcher, HandLandmarkModel
+from motion import MotionGate
+from network import NetworkPublisher
+from output import PointerOutput
+from propagation import FlowPropagator
+from overlay import OverlayRenderer, generate_unique_colors
+from refinement import StereoRefiner
+from screens import Screen
+
+CONFIG_FILE = 'config.json'
+# Stages whose start-to-start jitter is reported, to check the effect of the affinity settings
+JITTER_STAGES = ('capture', 'hands process', 'faces process', 'stereo pairing')
+STARTUP_TIMEOUT = 10.0  # seconds to wait for first frames and loaded models
+
+CAPTURE_BACKENDS = {
+    'auto': None,
+    'any': cv2.CAP_ANY,
+    'v4l2': cv2.CAP_V4L2,
+    'avfoundation': cv2.CAP_AVFOUNDATION,
+    'dshow': cv2.CAP_DSHOW,
+    'msmf': cv2.CAP_MSMF,
+    'gstreamer': cv2.CAP_GSTREAMER,
+}
+# thread: detector threads in this process. process: the whole rig runs in a worker process.
+DETECTOR_BACKENDS = ('thread', 'process')
+# latest: each new detection is paired with the other camera's latest one.
+# lockstep: both cameras are captured and detected together by the asyncio pipeline.
+SYNC_POLICIES = ('latest', 'lockstep')
+SINK_TYPES = ('overlay', 'uinput', 'network')
+OVERLAY_MODES = ('mice', 'hands')
+
+NUMBER = (int, float)
+OPTIONAL_INT = (int, type(None))
+OPTIONAL_STR = (str, type(None))
+
+# Expected type of every config value; unknown keys are reported too, to catch typos
+SCHEMA = {
+    'screen': {'pixel_width': int, 'pixel_height': int, 'diagonal_inches': NUMBER,
+               'aspect_ratio': list, 'camera_offset': list},
+    'capture': {'backend': str, 'width': int, 'height': int, 'left': dict, 'right': dict},
+    'inference': {'width': OPTIONAL_INT, 'height': OPTIONAL_INT},
+    'triangulation': {'min_depth': NUMBER, 'max_depth': NUMBER, 'disparity_sign': int},
+    'refinement': {'enabled': bool, 'max_points': int, 'search_radius': int},
+    'propagation': {'enabled': bool, 'max_frames': int, 'scale': NUMBER, 'min_tracked': NUMBER},
+    'motion': {'enabled': bool, 'threshold': int, 'min_motion': NUMBER, 'max_skips': int},
+    'detector': {'backend': str, 'batch_hands': bool, 'hand_model': OPTIONAL_STR, 'hands': dict, 'faces': dict},
+    'sync': {'policy': str},
+    'affinity': {'enabled': bool, 'opencv_threads': int, 'inference_threads': int, 'roles': dict},
+    'profiling': {'enabled': bool, 'trace_file': str},
+    'cursor': {'mice': int, 'max_x_dist': NUMBER, 'max_y_dist': NUMBER, 'timeout': NUMBER,
+               'press_threshold': NUMBER, 'unpress_threshold': NUMBER, 'unpress_frames': int},
+}
+CAMERA_SCHEMA = {'src': (int, str), 'calibration': str}
+POSITIVE = [('screen', 'pixel_width'), ('screen', 'pixel_height'), ('screen', 'diagonal_inches'),
+            ('capture', 'width'), ('capture', 'height'), ('cursor', 'mice'), ('cursor', 'max_x_dist'),
+            ('cursor', 'max_y_dist'), ('cursor', 'timeout'), ('cursor', 'press_threshold'),
+            ('cursor', 'unpress_threshold'), ('cursor', 'unpress_frames'), ('refinement', 'max_points'),
+            ('refinement', 'search_radius'), ('triangulation', 'min_depth'), ('triangulation', 'max_depth'),
+            ('affinity', 'opencv_threads'), ('affinity', 'inference_threads'), ('propagation', 'max_frames'),
+            ('propagation', 'scale'), ('propagation', 'min_tracked'), ('motion', 'threshold'),
+            ('motion', 'min_motion'), ('motion', 'max_skips')]
+
+
+def merge(base, overrides):
+    merged = dict(base)
+    for key, value in (overrides or {}).items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = merge(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+def load_config(path=CONFIG_FILE, overrides=None):
+    with open(path) as f:
+        config = merge(json.load(f), overrides)
+    validate(config)
+    return config
+
+
+def check_fields(errors, name, section, schema):
+    if not isinstance(section, dict):
+        errors.append(f'{name} must be an object')
+        return
+    for key in section.keys() - schema.keys():
+        errors.append(f'{name}.{key} is not a known setting')
+    for key, kind in schema.items():
+        if key not in section:
+            errors.append(f'{name}.{key} is missing')
+        elif isinstance(section[key], bool) != (kind is bool) or not isinstance(section[key], kind):
+            errors.append(f'{name}.{key} has the wrong type: {section[key]!r}')
+
+
+def validate(config):
+    """Checks the whole config at once and raises ValueError listing every problem."""
+    errors = []
+    for key in config.keys() - SCHEMA.keys() - {'sinks'}:
+        errors.append(f'{key} is not a known section')
+    for name, schema in SCHEMA.items():
+        check_fields(errors, name, config.get(name), schema)
+    capture = config.get('capture') if isinstance(config.get('capture'), dict) else {}
+    for side in ('left', 'right'):
+        camera = capture.get(side)
+        check_fields(errors, f'capture.{side}', camera, CAMERA_SCHEMA)
+        if isinstance(camera, dict) and isinstance(camera.get('calibration'), str) \
+                and not os.path.exists(camera['calibration']):
+            errors.append(f'capture.{side}.calibration: {camera["calibration"]} does not exist')
+    if errors:
+        raise ValueError('Invalid pipeline config:\n  ' + '\n  '.join(errors))
+
+    for section, key in POSITIVE:
+        if config[section][key] <= 0:
+            errors.append(f'{section}.{key} must be positive, got {config[section][key]}')
+    if len(config['screen']['aspect_ratio']) != 2:
+        errors.append('screen.aspect_ratio must be [width, height]')
+    if len(config['screen']['camera_offset']) != 3:
+        errors.append('screen.camera_offset must be [x, y, z] in metres')
+    if config['capture']['backend'] not in CAPTURE_BACKENDS:
+        errors.append(f'capture.backend must be one of {list(CAPTURE_BACKENDS)}')
+    if config['detector']['backend'] not in DETECTOR_BACKENDS:
+        errors.append(f'detector.backend must be one of {list(DETECTOR_BACKENDS)}')
+    if config['sync']['policy'] not in SYNC_POLICIES:
+        errors.append(f'sync.policy must be one of {list(SYNC_POLICIES)}')
+    if config['sync']['policy'] == 'lockstep' and config['detector']['backend'] != 'thread':
+        errors.append('sync.policy lockstep needs detector.backend thread')
+    triangulation = config['triangulation']
+    if triangulation['min_depth'] >= triangulation['max_depth']:
+        errors.append('triangulation.min_depth must be below triangulation.max_depth')
+    if triangulation['disparity_sign'] not in (-1, 0, 1):
+        errors.append('triangulation.disparity_sign must be 1, -1 or 0 (either sign)')
+    if config['refinement']['enabled'] and config['detector']['backend'] != 'thread':
+        errors.append('refinement.enabled needs detector.backend thread')
+    if config['detector']['batch_hands'] and (config['detector']['backend'] != 'thread' or
+                                              config['sync']['policy'] != 'latest'):
+        errors.append('detector.batch_hands needs detector.backend thread and sync.policy latest')
+    if config['propagation']['enabled'] and (config['detector']['backend'] != 'thread' or
+                                             config['sync']['policy'] != 'latest'):
+        errors.append('propagation.enabled needs detector.backend thread and sync.policy latest')
+    if config['motion']['enabled'] and (config['detector']['backend'] != 'thread' or
+                                        config['sync']['policy'] != 'latest'):
+        errors.append('motion.enabled needs detector.backend thread and sync.policy latest')
+    if config['propagation']['scale'] > 1 or config['propagation']['min_tracked'] > 1:
+        errors.append('propagation.scale and propagation.min_tracked must be at most 1')
+    errors.extend(backends.validate('detector.hands', config['detector']['hands'], backends.HAND_BACKENDS))
+    errors.extend(backends.validate('detector.faces', config['detector']['faces'], backends.FACE_BACKENDS))
+    hand_model = config['detector']['hand_model']
+    if hand_model is not None and not os.path.exists(hand_model):
+        errors.append(f'detector.hand_model: {hand_model} does not exist')
+
+    if config['affinity']['enabled']:
+        errors.extend(affinity.validate(config['affinity']))
+
+    inference = config['inference']
+    if (inference['width'] is None) != (inference['height'] is None):
+        errors.append('inference.width and inference.height must both be set or both be null')
+    elif inference['width'] is not None and (inference['width'] <= 0 or inference['height'] <= 0):
+        errors.append('inference.width and inference.height must be positive')
+
+    sinks = config.get('sinks', [])
+    if not isinstance(sinks, list):
+        errors.append('sinks must be a list')
+        sinks = []
+    for i, sink in enumerate(sinks):
+        if not isinstance(sink, dict) or sink.get('type') not in SINK_TYPES:
+            errors.append(f'sinks[{i}] needs a type, one of {list(SINK_TYPES)}')
+        elif sink['type'] == 'overlay' and sink.get('mode', 'mice') not in OVERLAY_MODES:
+            errors.append(f'sinks[{i}].mode must be one of {list(OVERLAY_MODES)}')
+        elif sink['type'] == 'network' and not (
+                isinstance(sink.get('address'), str) or
+                (isinstance(sink.get('address'), list) and len(sink['address']) == 2)):
+            errors.append(f'sinks[{i}].address must be a socket path or [host, port]')
+    if sum(isinstance(s, dict) and s.get('type') == 'overlay' for s in sinks) > 1:
+        errors.append('only one overlay sink is supported')
+
+    if errors:
+        raise ValueError('Invalid pipeline config:\n  ' + '\n  '.join(errors))
+
+
+def get_monitor_dimensions(diagonal_length, ar1, ar2):
+    """Calculate monitor physical dimensions in inches from diagonal and aspect ratio"""
+    k = diagonal_length / math.sqrt(ar1 ** 2 + ar2 ** 2)
+    return ar1 * k, ar2 * k
+
+
+class Pipeline:
+    """Cameras, detectors, 3D coordinates, cursor and sinks, built from a validated config."""
+
+    def __init__(self, config):
+        self.config = config
+        self.start_time = time.monotonic()
+        screen = config['screen']
+        capture = config['capture']
+        self.monitor_width = screen['pixel_width']
+        self.monitor_height = screen['pixel_height']
+        self.physical_width, self.physical_height = get_monitor_dimensions(
+            screen['diagonal_inches'], *screen['aspect_ratio'])
+        inference = config['inference']
+        self.inference_size = None if inference['width'] is None else (inference['width'], inference['height'])
+        self.backend = CAPTURE_BACKENDS[capture['backend']]
+        self.lockstep = config['sync']['policy'] == 'lockstep'
+
+        print(f"Monitor: {self.monitor_width}x{self.monitor_height} pixels")
+        print(f"Physical: {self.physical_width:.2f}\" x {self.physical_height:.2f}\"")
+        print(f"Camera offset: X={screen['camera_offset'][0]}m, Y={screen['camera_offset'][1]}m, "
+              f"Z={screen['camera_offset'][2]}m")
+        batched = ' (batched hands)' if config['detector']['batch_hands'] else ''
+        print(f"Capture: {capture['width']}x{capture['height']}, inference: "
+              f"{'capture size' if self.inference_size is None else '%dx%d' % self.inference_size}, "
+              f"detector: {config['detector']['backend']}{batched}, sync: {config['sync']['policy']}, "
+              f"hands: {config['detector']['hands']['type']}, faces: {config['detector']['faces']['type']}")
+
+        if config['profiling']['enabled']:
+            profiling.PROFILER.enable()
+        if config['affinity']['enabled']:
+            # Before any pipeline thread starts, so each one places itself as it begins
+            affinity.limit_threads(config['affinity']['opencv_threads'], config['affinity']['inference_threads'])
+            affinity.configure(config['affinity']['roles'])
+
+        self.cameras = []
+        self.trackers = []
+        refinement = config['refinement']
+        self.refiner = StereoRefiner(search_radius=refinement['search_radius'],
+                                     max_points=refinement['max_points']) if refinement['enabled'] else None
+        self.hand_batcher = None
+        detector = config['detector']
+        hands = dict(detector['hands'])
+        if detector['batch_hands'] and hands['type'] == 'solutions':
+            # Only used to find new hands, so there is nothing for its own tracking to do
+            hands.setdefault('static_image_mode', True)
+        self.hand_backend = backends.factory(hands, backends.HAND_BACKENDS)
+        self.face_backend = backends.factory(detector['faces'], backends.FACE_BACKENDS)
+        self.async_pipeline = None
+        self.loop = None
+        if config['detector']['backend'] == 'process':
+            self.coords = self.build_rig()
+        else:
+            self.coords = self.build_local()
+
+        print("Initializing cursor tracker...")
+        cursor = config['cursor']
+        self.cursor = Cursor(
+            coordinate=self.coords,
+            mice_count=cursor['mice'],
+            max_x_dist=cursor['max_x_dist'],
+            max_y_dist=cursor['max_y_dist'],
+            timeout=cursor['timeout'],
+            press_threshold=cursor['press_threshold'],
+            unpress_threshold=cursor['unpress_threshold'],
+            unpress_frames=cursor['unpress_frames']
+        )
+
+        self.overlay = None
+        self.publishers = []
+        for sink in config.get('sinks', []):
+            if sink['type'] == 'overlay':
+                self.overlay = sink
+            elif sink['type'] == 'uinput':
+                self.cursor.add_output(PointerOutput(cursor['mice'], self.monitor_width, self.monitor_height,
+                                                     screen_offsets=self.coords.screens.desktop_offsets()))
+            elif sink['type'] == 'network':
+                address = sink['address'] if isinstance(sink['address'], str) else tuple(sink['address'])
+                self.publishers.append(NetworkPublisher(self.coords, address, cursor=self.cursor,
+                                                        delta=sink.get('delta', False)))
+
+        self.running = True
+        if self.lockstep:
+            # The asyncio pipeline drives capture, detection, coordinates and cursor on its own loop
+            self.async_pipeline = AsyncPipeline(self.cameras[1], self.cameras[0], self.coords, self.cursor,
+                                                inference_size=self.inference_size,
+                                                hand_backend=self.hand_backend, face_backend=self.face_backend)
+            self.loop = asyncio.new_event_loop()
+            Thread(target=self.loop.run_forever, daemon=True).start()
+            asyncio.run_coroutine_threadsafe(self.async_pipeline.start(), self.loop).result()
+        else:
+            Thread(target=self.cursor.update, daemon=True).start()
+        print(f"Pipeline ready in {time.monotonic() - self.start_time:.2f}s")
+        Thread(target=self.report_first_cursor, daemon=True).start()
+
+    def report_first_cursor(self):
+        while self.running:
+            if any(mouse.position is not None for mouse in self.cursor.get_mice().values()):
+                print(f"Time to first cursor: {time.monotonic() - self.start_time:.2f}s")
+                return
+            time.sleep(0.01)
+
+    def screen(self):
+        x, y, z = self.config['screen']['camera_offset']
+        return Screen.from_camera_offset(x, y, z, self.physical_width, self.physical_height,
+                                         self.monitor_width, self.monitor_height)
+
+    def open_camera(self, side):
+        capture = self.config['capture']
+        camera = stream.Camera(src=capture[side]['src'], width=capture['width'], height=capture['height'],
+                               threaded=not self.lockstep, backend=self.backend)
+        camera.undistort(capture[side]['calibration'], 1)
+        return camera
+
+    def build_local(self):
+        capture = self.config['capture']
+        print("Initializing cameras...")
+        # Both cameras open and load their (cached) calibration at the same time
+        with ThreadPoolExecutor(max_workers=3) as pool:
+            cameras = [pool.submit(self.open_camera, side) for side in ('left', 'right')]
+            pool.submit(calibration.load_coefficients, capture['left']['calibration'])
+            self.cameras = [camera.result() for camera in cameras]
+        print(f"Cameras opened in {time.monotonic() - self.start_time:.2f}s")
+
+        if not self.lockstep:
+            # Each tracker loads its two models on its own threads, in parallel
+            print("Starting detection trackers...")
+            detector = self.config['detector']
+            if detector['batch_hands']:
+                # One landmark model shared by both trackers, fed both views of each instant at once
+                affinity_config = self.config['affinity']
+                model = HandLandmarkModel(detector['hand_model'], affinity_config['inference_threads']
+                                          if affinity_config['enabled'] else None)
+                self.hand_batcher = HandBatcher(model, clients=len(self.cameras))
+            propagation = self.config['propagation']
+            self.trackers = [detectors.Tracker(camera, inference_size=self.inference_size,
+                                               hand_batcher=self.hand_batcher, hand_backend=self.hand_backend,
+                                               face_backend=self.face_backend,
+                                               propagator=FlowPropagator(propagation['scale'],
+                                                                         propagation['max_frames'],
+                                                                         propagation['min_tracked'])
+                                               if propagation['enabled'] else None,
+                                               hand_gate=self.motion_gate(f'{side} hands'),
+                                               face_gate=self.motion_gate(f'{side} faces'))
+                             for side, camera in zip(('left', 'right'), self.cameras)]
+
+        print("Initializing 3D coordinate system...")
+        x, y, z = self.config['screen']['camera_offset']
+        # The second camera's detections are the left input of the triangulation, as in the demos
+        first, second = self.trackers or [None, None]
+        coords = Coordinates(
+            second, first, capture['width'], capture['height'], capture['left']['calibration'],
+            x, y, z, self.physical_width, self.physical_height, self.monitor_width, self.monitor_height,
+            screens=[self.screen()], threaded=not self.lockstep, refiner=self.refiner,
+            **self.config['triangulation']
+        )
+        if self.hand_batcher is not None:
+            # Hands that the 3D tracker expects are cropped even before either view has found them
+            coords.track_every_generation = True
+            for tracker in self.trackers:
+                tracker.roi_source = coords.getTrackROIs
+
+        # Wait for the first frames and loaded models instead of fixed warm-up sleeps
+        if not self.lockstep:
+            for source in self.cameras + self.trackers:
+                if not source.wait_ready(STARTUP_TIMEOUT):
+                    print(f"Warning: {type(source).__name__} not ready after {STARTUP_TIMEOUT}s")
+        return coords
+
+    def motion_gate(self, name):
+        settings = self.config['motion']
+        if not settings['enabled']:
+            return None
+        return MotionGate(name, threshold=settings['threshold'], min_motion=settings['min_motion'],
+                          max_skips=settings['max_skips'])
+
+    def build_rig(self):
+        capture = self.config['capture']
+        print("Starting rig worker process...")
+        rig = Rig(0, capture['left']['src'], capture['right']['src'],
+                  capture['left']['calibration'], capture['right']['calibration'],
+                  capture['width'], capture['height'], backend=self.backend, inference_size=self.inference_size,
+                  affinity=self.config['affinity'] if self.config['affinity']['enabled'] else None,
+                  hand_backend=self.config['detector']['hands'], face_backend=self.config['detector']['faces'],
+                  triangulation=self.config['triangulation'])
+        return RigFusion([rig], [self.screen()])
+
+    def channels(self):
+        return [c for source in self.cameras + self.trackers + [self.coords] for c in source.channels]
+
+    def run(self):
+        """Shows the overlay (if configured) until ESC, or runs headless until interrupted."""
+        affinity.apply('ui')
+        try:
+            if self.overlay is None:
+                print("Running headless... Press Ctrl+C to exit")
+                while self.running:
+                    time.sleep(0.1)
+            elif self.overlay.get('mode', 'mice') == 'mice':
+                self.show_mice()
+            else:
+                self.show_hands()
+        except KeyboardInterrupt:
+            print("\nInterrupted by user")
+        finally:
+            self.stop()
+
+    def show_mice(self):
+        cursor = self.config['cursor']
+        mouse_colors = generate_unique_colors(cursor['mice'])
+
+        # Static text is drawn once; each frame only repaints around the cursors
+        renderer = OverlayRenderer(self.monitor_width, self.monitor_height)
+        renderer.add_static_text("Tracked Hand Cursor Demo - Press ESC to exit",
+                                 (10, 30), 0.7, (0, 0, 0), 2)
+        renderer.add_static_text(f"Press: <{cursor['press_threshold']*100:.1f}cm | Unpress: "
+                                 f">{cursor['unpress_threshold']*100:.1f}cm for {cursor['unpress_frames']} frames",
+                                 (10, self.monitor_height - 20), 0.5, (100, 100, 100), 1)
+
+        print("Starting tracked cursor demo... Press ESC to exit")
+        while self.running:
+            renderer.begin()
+
+            # Get a consistent snapshot of the tracked mice
+            mice = self.cursor.get_mice()
+
+            active_count = 0
+            for mouse_id, mouse_info in mice.items():
+                position = mouse_info.position
+                if position is None:
+                    continue
+
+                active_count += 1
+
+                x = int(position.x)
+                y = int(position.y)
+
+                # Check if point is within screen bounds
+                if 0 <= x < self.monitor_width and 0 <= y < self.monitor_height:
+                    is_pressed = mouse_info.pressed
+
+                    # Mouse ID and coordinates, pinch distance and press status
+                    labels = [(f"Mouse {mouse_id}: ({x}, {y})", 25, -10, 0.5, (0, 0, 0), 1)]
+                    if mouse_info.pinch_distance is not None:
+                        labels.append((f"{mouse_info.pinch_distance*100:.1f}cm", 25, 10, 0.4, (100, 100, 100), 1))
+                    if is_pressed:
+                        labels.append(("PRESSED", -30, 40, 0.5, (0, 0, 255), 2))
+
+                    # Border is red if pressed, black otherwise
+                    renderer.cursor(x, y, mouse_colors[mouse_id],
+                                    border_color=(0, 0, 255) if is_pressed else (0, 0, 0),
+                                    border_thickness=4 if is_pressed else 2,
+                                    labels=labels)
+                else:
+                    # Point is out of bounds - show warning
+                    print(f"Mouse {mouse_id} position out of bounds: ({x}, {y})")
+
+            renderer.text(f"Active mice: {active_count}/{cursor['mice']}", (10, 60), 0.6, (100, 100, 100), 1)
+
+            with profiling.span('display'):
+                cv2.imshow('Tracked Hand Cursor', renderer.frame())
+                key = cv2.waitKey(1)
+
+            # Check for ESC key
+            if key & 0xFF == 27:
+                break
+
+    def show_hands(self):
+        # Raw on-screen hand positions, without cursor tracking
+        renderer = OverlayRenderer(self.monitor_width, self.monitor_height)
+        renderer.add_static_text("Hand Cursor Demo - Press ESC to exit",
+                                 (10, 30), 0.7, (0, 0, 0), 2)
+
+        print("Starting cursor demo... Press ESC to exit")
+        while self.running:
+            renderer.begin()
+
+            # Get hand cursors with positions and pinch distances
+            hand_cursors = self.coords.getOnScrenPixels()
+
+            for cursor in hand_cursors:
+                point = cursor['position']
+                pinch_dist = cursor['pinch_distance']
+
+                x = int(point.x)
+                y = int(point.y)
+
+                # Determine if pinched (distance < 0.04 meters = 4cm)
+                is_pinched = pinch_dist < 0.04
+
+                # Choose color: red if pinched, blue otherwise
+                color = (0, 0, 255) if is_pinched else (255, 0, 0)  # BGR format
+
+                # Check if point is within screen bounds
+                if 0 <= x < self.monitor_width and 0 <= y < self.monitor_height:
+                    # Coordinates and pinch distance, and pinch status
+                    labels = [(f"({x}, {y}) {pinch_dist*100:.1f}cm", 25, -10, 0.5, (0, 0, 0), 1)]
+                    if is_pinched:
+                        labels.append(("PINCHED", -30, 40, 0.5, (0, 0, 255), 2))
+                    renderer.cursor(x, y, color, labels=labels)
+                else:
+                    # Point is out of bounds - show warning
+                    print(f"Hand position out of bounds: ({x}, {y})")
+
+            renderer.text(f"Hands detected: {len(hand_cursors)}", (10, 60), 0.6, (100, 100, 100), 1)
+
+            with profiling.span('display'):
+                cv2.imshow('Hand Cursor', renderer.frame())
+                key = cv2.waitKey(1)
+
+            # Check for ESC key
+            if key & 0xFF == 27:
+                break
+
+    def stop(self):
+        if not self.running:
+            return
+        self.running = False
+        print("Channel statistics:")
+        print(format_stats(self.channels()))
+        if self.refiner is not None:
+            print(self.refiner.format_stats())
+        if self.hand_batcher is not None:
+            print(self.hand_batcher.format_stats())
+        for tracker in self.trackers:
+            if tracker.propagator is not None:
+                print(tracker.propagator.format_stats())
+            for gate in (tracker.hand_gate, tracker.face_gate):
+                if gate is not None:
+                    print(gate.format_stats())
+        if isinstance(self.coords, Coordinates):
+            print(f"Rejected by triangulation: {self.coords.rejections_total}")
+        if profiling.PROFILER.enabled:
+            print("Stage timings:")
+            print(profiling.PROFILER.format_summary())
+            print(profiling.PROFILER.format_jitter(JITTER_STAGES))
+            print(f"Timeline written to {profiling.PROFILER.export(self.config['profiling']['trace_file'])}")
+        print("Cleaning up...")
+        if self.async_pipeline is not None:
+            asyncio.run_coroutine_threadsafe(self.async_pipeline.stop(), self.loop).result()
+            self.loop.call_soon_threadsafe(self.loop.stop)
+        for publisher in self.publishers:
+            publisher.stop()
+        self.cursor.stop()
+        self.coords.stop()
+        for tracker in self.trackers:
+            tracker.stop()
+        if self.async_pipeline is None:
+            for camera in self.cameras:
+                camera.stop()
+        cv2.destroyAllWindows()
+        print("Done!")
+
+
+def run(path=CONFIG_FILE, overrides=None):
+    try:
+        config = load_config(path, overrides)
+    except ValueError as e:
+        print(e)
+        sys.exit(1)
+    Pipeline(config).run()
@@ -0,0 +1,160 @@
+import itertools
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+CAPACITY = 1 << 16  # spans kept; older ones are overwritten
+
+
+class Span:
+    __slots__ = ('profiler', 'stage', 'frame', 'start')
+
+    def __init__(self, profiler, stage, frame):
+        self.profiler = profiler
+        self.stage = stage
+        self.frame = frame
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.record(self.stage, self.frame, self.start, time.perf_counter())
+
+
+class NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+NULL_SPAN = NullSpan()
+
+
+class Profiler:
+    """Opt-in stage timing into a preallocated ring, exported as a Chrome trace / Perfetto timeline.
+
+    While disabled, span() returns a shared no-op context, so the hooks cost one attribute check."""
+
+    def __init__(self):
+        self.enabled = False
+        # The ring is only allocated once profiling is enabled
+        self.allocate(0)
+
+    def allocate(self, capacity):
+        self.capacity = capacity
+        self.starts = np.zeros(capacity)
+        self.ends = np.zeros(capacity)
+        self.frames = np.zeros(capacity, dtype=np.int64)
+        self.stage_ids = np.full(capacity, -1, dtype=np.int32)
+        self.thread_ids = np.zeros(capacity, dtype=np.int64)
+        self.stages = {}
+        self.stage_names = []
+        self.thread_names = {}
+        self.counter = itertools.count()
+        self.lock = threading.Lock()
+
+    def enable(self, capacity=CAPACITY):
+        if capacity != self.capacity:
+            self.allocate(capacity)
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def span(self, stage, frame=-1):
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, stage, frame)
+
+    def stage_id(self, stage):
+        stage_id = self.stages.get(stage)
+        if stage_id is None:
+            with self.lock:
+                stage_id = self.stages.setdefault(stage, len(self.stage_names))
+                if stage_id == len(self.stage_names):
+                    self.stage_names.append(stage)
+        return stage_id
+
+    def record(self, stage, frame, start, end):
+        # next() on a count is atomic under the GIL, so each thread writes its own slot
+        i = next(self.counter) % self.capacity
+        thread = threading.get_ident()
+        if thread not in self.thread_names:
+            self.thread_names[thread] = threading.current_thread().name
+        self.starts[i] = start
+        self.ends[i] = end
+        self.frames[i] = frame
+        self.thread_ids[i] = thread
+        self.stage_ids[i] = self.stage_id(stage)
+
+    def spans(self):
+        """Recorded spans as (stage, frame, start, end, thread id), oldest first."""
+        filled = np.flatnonzero(self.stage_ids >= 0)
+        order = filled[np.argsort(self.starts[filled], kind='stable')]
+        return [(self.stage_names[self.stage_ids[i]], int(self.frames[i]), float(self.starts[i]),
+                 float(self.ends[i]), int(self.thread_ids[i])) for i in order]
+
+    def summary(self):
+        # Mean and max milliseconds per stage
+        durations = {}
+        for stage, _, start, end, _ in self.spans():
+            durations.setdefault(stage, []).append((end - start) * 1000)
+        return {stage: (len(d), float(np.mean(d)), float(np.max(d))) for stage, d in durations.items()}
+
+    def format_summary(self):
+        return '\n'.join(f"{stage:<24} {count:>7} spans  mean {mean:.2f} ms  max {peak:.2f} ms"
+                         for stage, (count, mean, peak) in sorted(self.summary().items()))
+
+    def jitter(self, stage):
+        """Start-to-start interval statistics of one stage per thread, in milliseconds."""
+        starts = {}
+        for name, _, start, _, tid in self.spans():
+            if name == stage:
+                starts.setdefault(tid, []).append(start)
+        intervals = np.concatenate([np.diff(s) for s in starts.values()] or [np.zeros(0)]) * 1000
+        if len(intervals) == 0:
+            return None
+        return {'count': len(intervals), 'mean_ms': float(intervals.mean()), 'std_ms': float(intervals.std()),
+                'p99_ms': float(np.percentile(intervals, 99)), 'max_ms': float(intervals.max())}
+
+    def format_jitter(self, stages):
+        lines = []
+        for stage in stages:
+            j = self.jitter(stage)
+            if j is not None:
+                lines.append(f"{stage:<24} interval {j['mean_ms']:.2f} ms  std {j['std_ms']:.2f} ms  "
+                             f"p99 {j['p99_ms']:.2f} ms  max {j['max_ms']:.2f} ms")
+        return '\n'.join(lines)
+
+    def chrome_trace(self):
+        spans = self.spans()
+        origin = spans[0][2] if spans else 0.0
+        pid = os.getpid()
+        events = [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': name}}
+                  for tid, name in self.thread_names.items()]
+        for stage, frame, start, end, tid in spans:
+            events.append({'name': stage, 'ph': 'X', 'pid': pid, 'tid': tid,
+                           'ts': (start - origin) * 1e6, 'dur': (end - start) * 1e6,
+                           'args': {'frame': frame}})
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def export(self, path):
+        """Writes a JSON timeline for chrome://tracing or ui.perfetto.dev."""
+        with open(path, 'w') as f:
+            json.dump(self.chrome_trace(), f)
+        return path
+
+
+PROFILER = Profiler()
+
+
+def span(stage, frame=-1):
+    return PROFILER.span(stage, frame)
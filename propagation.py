@@ -0,0 +1,96 @@
+import cv2
+import numpy as np
+
+SCALE = 0.5  # the flow runs on a grayscale copy at this fraction of the frame size
+MAX_FRAMES = 2  # propagated frames in a row before the detector has to run again
+MIN_TRACKED = 0.8  # fraction of a hand's landmarks that must track for the hand to be carried forward
+MAX_ROUND_TRIP = 1.0  # pixels, at flow scale, between a landmark and its forward-backward tracked position
+LK_PARAMS = dict(winSize=(15, 15), maxLevel=2,
+                 criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 0.03))
+
+
+class FlowPropagator:
+    """Carries hand landmarks from frame to frame with sparse pyramidal Lucas-Kanade optical flow.
+
+    Each landmark is tracked forwards and back; one that fails or does not return close to where it
+    started has its hand's median motion applied instead. When too few landmarks of any hand track,
+    or after max_frames propagated frames, propagate() returns None and the detector runs again."""
+
+    def __init__(self, scale=SCALE, max_frames=MAX_FRAMES, min_tracked=MIN_TRACKED, max_round_trip=MAX_ROUND_TRIP):
+        self.scale = scale
+        self.max_frames = max_frames
+        self.min_tracked = min_tracked
+        self.max_round_trip = max_round_trip
+        self.previous = None
+        self.hands = None
+        self.propagated = 0
+
+        self.detected_frames = 0
+        self.propagated_frames = 0
+        self.failures = 0
+        self.confidence_total = 0.0
+
+    def grey(self, image):
+        small = cv2.resize(image, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+
+    def reset(self, image, hands):
+        """Starts from a detector result: image is the BGR frame, hands its HandArrays."""
+        self.previous = self.grey(image)
+        self.hands = hands
+        self.propagated = 0
+        self.detected_frames += 1
+
+    def hold(self, image):
+        """The hands did not move on image (a gated frame): flow continues from it, without counting a frame."""
+        if self.hands is not None:
+            self.previous = self.grey(image)
+
+    def ready(self):
+        return self.hands is not None and len(self.hands.landmarks) > 0 and self.propagated < self.max_frames
+
+    def propagate(self, image):
+        """HandArrays moved onto image, or None when the detector should run on it instead."""
+        if not self.ready():
+            return None
+        current = self.grey(image)
+        h, w = current.shape[:2]
+        landmarks = self.hands.landmarks
+        count, per_hand = landmarks.shape[:2]
+        points = (landmarks[:, :, :2].reshape(-1, 1, 2) * (w, h)).astype(np.float32)
+
+        forward, status, _ = cv2.calcOpticalFlowPyrLK(self.previous, current, points, None, **LK_PARAMS)
+        backward, back_status, _ = cv2.calcOpticalFlowPyrLK(current, self.previous, forward, None, **LK_PARAMS)
+        round_trip = np.linalg.norm((backward - points).reshape(-1, 2), axis=1)
+        good = ((status.reshape(-1) == 1) & (back_status.reshape(-1) == 1) &
+                (round_trip < self.max_round_trip)).reshape(count, per_hand)
+
+        confidence = good.mean(axis=1)
+        if confidence.min() < self.min_tracked:
+            self.failures += 1
+            return None
+
+        motion = (forward - points).reshape(count, per_hand, 2)
+        for hand in range(count):
+            # Landmarks that lost track move with the rest of their hand
+            motion[hand, ~good[hand]] = np.median(motion[hand, good[hand]], axis=0)
+        moved = landmarks.copy()
+        moved[:, :, :2] += motion / (w, h)
+
+        self.previous = current
+        self.hands = self.hands._replace(landmarks=moved)
+        self.propagated += 1
+        self.propagated_frames += 1
+        self.confidence_total += float(confidence.mean())
+        return self.hands
+
+    def stats(self):
+        return {'detected': self.detected_frames, 'propagated': self.propagated_frames, 'failures': self.failures,
+                'mean_confidence': self.confidence_total / max(self.propagated_frames, 1)}
+
+    def format_stats(self):
+        s = self.stats()
+        total = max(s['detected'] + s['propagated'], 1)
+        return (f"Flow propagation: {s['propagated']} of {total} hand frames propagated "
+                f"({s['propagated'] / total * 100:.0f}%), {s['failures']} fell back to the detector, "
+                f"mean confidence {s['mean_confidence']:.2f}")
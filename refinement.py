@@ -0,0 +1,129 @@
+import time
+
+import numpy as np
+
+PATCH_RADIUS = 4  # pixels; 9x9 patches
+SEARCH_RADIUS = 6  # pixels either side of the detected match along the row
+MAX_POINTS = 32  # per frame; bounds the cost at MAX_POINTS * patch area * search width
+MIN_SCORE = 0.7  # normalised cross-correlation needed to trust a match
+MIN_TEXTURE = 4.0  # grey-level standard deviation below which a patch is too flat to match
+
+GREY = np.array([0.114, 0.587, 0.299], dtype=np.float32)  # BGR weights
+
+
+def gather(image, xs, ys):
+    # (N, rows, cols) grey patches via fancy indexing; coordinates are clipped so nothing raises
+    h, w = image.shape[:2]
+    patches = image[np.clip(ys, 0, h - 1)[:, :, None], np.clip(xs, 0, w - 1)[:, None, :]].astype(np.float32)
+    if patches.ndim == 4:
+        patches = patches @ GREY
+    return patches
+
+
+def normalise(patches, axes):
+    centered = patches - patches.mean(axis=axes, keepdims=True)
+    std = np.sqrt((centered ** 2).mean(axis=axes, keepdims=True))
+    return centered / np.maximum(std, 1e-6), std
+
+
+class StereoRefiner:
+    """Sub-pixel disparities by patch matching along the image row around selected landmarks.
+
+    The left patch is compared with every offset in a small window of the right image row with
+    normalised cross-correlation, and a parabola through the best score and its neighbours gives
+    the sub-pixel offset. Matches that are weak, flat or at the window edge keep the detector's value."""
+
+    def __init__(self, patch_radius=PATCH_RADIUS, search_radius=SEARCH_RADIUS, max_points=MAX_POINTS,
+                 min_score=MIN_SCORE, min_texture=MIN_TEXTURE):
+        self.patch_radius = patch_radius
+        self.search_radius = search_radius
+        self.max_points = max_points
+        self.min_score = min_score
+        self.min_texture = min_texture
+
+        self.frames = 0
+        self.refined = 0
+        self.rejected = 0
+        self.skipped = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def refine(self, views):
+        """Refines one stereo frame. views: (left_image, right_image, left, right, priority) tuples with
+        (N, 2) pixel positions and (N,) priorities, lower first, sharing one max_points budget.
+        Returns a copy of each view's right positions with refined x positions."""
+        start = time.perf_counter()
+        results = []
+        candidates = []
+        for v, (_, _, left, right, priority) in enumerate(views):
+            right = np.array(right, dtype=np.float64)
+            left = np.asarray(left, dtype=np.float64)
+            results.append(right)
+            finite = np.flatnonzero(np.isfinite(left).all(axis=1) & np.isfinite(right).all(axis=1))
+            candidates.extend((priority[i], v, i) for i in finite.tolist())
+        # Over budget points keep the detector's disparity; the sort is stable so ties keep view order
+        candidates.sort(key=lambda c: c[0])
+        self.skipped += max(0, len(candidates) - self.max_points)
+        chosen = candidates[:self.max_points]
+        for v, (left_image, right_image, left, _, _) in enumerate(views):
+            points = np.array([i for _, view, i in chosen if view == v], dtype=np.intp)
+            if not len(points):
+                continue
+            right = results[v]
+            refined, ok = self.match(left_image, right_image, np.asarray(left, dtype=np.float64)[points], right[points])
+            right[points[ok], 0] = refined[ok]
+            self.refined += int(ok.sum())
+            self.rejected += int((~ok).sum())
+
+        elapsed = (time.perf_counter() - start) * 1000
+        self.frames += 1
+        self.total_ms += elapsed
+        self.max_ms = max(self.max_ms, elapsed)
+        return results
+
+    def match(self, left_image, right_image, left, right):
+        r = self.patch_radius
+        s = self.search_radius
+        offsets = np.arange(-r, r + 1)
+        strip_offsets = np.arange(-r - s, r + s + 1)
+
+        lx = np.rint(left[:, 0]).astype(np.intp)
+        ly = np.rint(left[:, 1]).astype(np.intp)
+        rx = np.rint(right[:, 0]).astype(np.intp)
+        ry = np.rint(right[:, 1]).astype(np.intp)
+
+        h, w = left_image.shape[:2]
+        inside = ((lx - r >= 0) & (lx + r < w) & (ly - r >= 0) & (ly + r < h) &
+                  (rx - r - s >= 0) & (rx + r + s < w) & (ry - r >= 0) & (ry + r < h))
+
+        patches = gather(left_image, lx[:, None] + offsets, ly[:, None] + offsets)  # (N, P, P)
+        strips = gather(right_image, rx[:, None] + strip_offsets, ry[:, None] + offsets)  # (N, P, P + 2S)
+        windows = np.lib.stride_tricks.sliding_window_view(strips, 2 * r + 1, axis=2)  # (N, P, 2S + 1, P)
+
+        patches, texture = normalise(patches, (1, 2))
+        windows, _ = normalise(windows, (1, 3))
+        scores = np.einsum('nij,nikj->nk', patches, windows) / patches[0].size  # (N, 2S + 1)
+
+        best = scores.argmax(axis=1)
+        rows = np.arange(len(best))
+        interior = (best > 0) & (best < 2 * s)
+        before = scores[rows, np.maximum(best - 1, 0)]
+        peak = scores[rows, best]
+        after = scores[rows, np.minimum(best + 1, 2 * s)]
+        curvature = before - 2 * peak + after
+        with np.errstate(invalid='ignore', divide='ignore'):
+            sub_pixel = np.where(interior & (curvature < 0), 0.5 * (before - after) / curvature, 0.0)
+
+        ok = inside & interior & (peak >= self.min_score) & (texture[:, 0, 0] >= self.min_texture)
+        # The integer left patch centre maps to rx + shift; carry the left sub-pixel part across
+        refined = rx + (best - s) + sub_pixel + (left[:, 0] - lx)
+        return refined, ok
+
+    def stats(self):
+        return {'frames': self.frames, 'refined': self.refined, 'rejected': self.rejected,
+                'skipped': self.skipped, 'mean_ms': self.total_ms / max(self.frames, 1), 'max_ms': self.max_ms}
+
+    def format_stats(self):
+        s = self.stats()
+        return (f"Stereo refinement: {s['frames']} frames, {s['refined']} refined, {s['rejected']} rejected, "
+                f"{s['skipped']} over budget, {s['mean_ms']:.2f}/{s['max_ms']:.2f} ms per frame")
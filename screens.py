@@ -0,0 +1,101 @@
+import numpy as np
+
+INCH = 0.0254
+
+
+class Screen:
+    def __init__(self, origin, x_axis, y_axis, width, height, pixel_width, pixel_height):
+        # origin is the top-left pixel corner and the axes run along pixel rows/columns,
+        # all in the camera frame (metres)
+        self.origin = np.asarray(origin, dtype=float)
+        self.x_axis = np.asarray(x_axis, dtype=float) / np.linalg.norm(x_axis)
+        self.y_axis = np.asarray(y_axis, dtype=float) / np.linalg.norm(y_axis)
+        self.width = width
+        self.height = height
+        self.pixel_width = pixel_width
+        self.pixel_height = pixel_height
+
+    @classmethod
+    def from_camera_offset(cls, camera_x_offset, camera_y_offset, camera_z_offset,
+                           physical_width, physical_height, pixel_width, pixel_height):
+        """Screen parallel to the image plane, sized in inches like the original single-screen setup"""
+        return cls((camera_x_offset, camera_y_offset, camera_z_offset), (1, 0, 0), (0, 1, 0),
+                   physical_width * INCH, physical_height * INCH, pixel_width, pixel_height)
+
+    def __repr__(self):
+        return f"Screen({self.pixel_width}x{self.pixel_height} at {np.round(self.origin, 3)})"
+
+
+class ScreenLayout:
+    def __init__(self, screens):
+        self.screens = list(screens)
+        if not self.screens:
+            raise ValueError('ScreenLayout needs at least one screen')
+        self.origins = np.array([s.origin for s in self.screens]).reshape(-1, 3)
+        self.x_axes = np.array([s.x_axis for s in self.screens]).reshape(-1, 3)
+        self.y_axes = np.array([s.y_axis for s in self.screens]).reshape(-1, 3)
+        self.normals = np.cross(self.x_axes, self.y_axes)
+        self.sizes = np.array([(s.width, s.height) for s in self.screens], dtype=float).reshape(-1, 2)
+        self.pixels = np.array([(s.pixel_width, s.pixel_height) for s in self.screens], dtype=float).reshape(-1, 2)
+
+        # Per-screen constants of the ray/plane equations
+        self.origin_n = np.einsum('sk,sk->s', self.origins, self.normals)
+        self.origin_x = np.einsum('sk,sk->s', self.origins, self.x_axes)
+        self.origin_y = np.einsum('sk,sk->s', self.origins, self.y_axes)
+
+    @classmethod
+    def grid(cls, rows, cols, origin, width, height, pixel_width, pixel_height, bezel=0.0):
+        """Flat video wall of identical screens, ids in row-major order"""
+        origin = np.asarray(origin, dtype=float)
+        screens = []
+        for row in range(rows):
+            for col in range(cols):
+                offset = np.array([col * (width + bezel), row * (height + bezel), 0.0])
+                screens.append(Screen(origin + offset, (1, 0, 0), (0, 1, 0),
+                                      width, height, pixel_width, pixel_height))
+        return cls(screens)
+
+    def __len__(self):
+        return len(self.screens)
+
+    def desktop_offsets(self):
+        """Desktop position of each screen's top-left pixel, tiling screens by their physical column and row"""
+        xs = np.round(self.origins @ self.x_axes[0], 3)
+        ys = np.round(self.origins @ self.y_axes[0], 3)
+        columns, column = np.unique(xs, return_inverse=True)
+        rows, row = np.unique(ys, return_inverse=True)
+        widths = np.zeros(len(columns))
+        heights = np.zeros(len(rows))
+        np.maximum.at(widths, column, self.pixels[:, 0])
+        np.maximum.at(heights, row, self.pixels[:, 1])
+        left = np.concatenate([[0], np.cumsum(widths)[:-1]])
+        top = np.concatenate([[0], np.cumsum(heights)[:-1]])
+        return {i: (int(left[column[i]]), int(top[row[i]])) for i in range(len(self.screens))}
+
+    def intersect(self, eyes, targets):
+        """Casts eye->target rays against every screen at once.
+
+        Returns (screen_ids, pixels) with screen_id -1 where no screen is hit."""
+        eyes = np.asarray(eyes, dtype=float).reshape(-1, 3)
+        directions = np.asarray(targets, dtype=float).reshape(-1, 3) - eyes
+
+        denom = directions @ self.normals.T
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = (self.origin_n[None, :] - eyes @ self.normals.T) / denom
+            a = eyes @ self.x_axes.T - self.origin_x[None, :] + t * (directions @ self.x_axes.T)
+            b = eyes @ self.y_axes.T - self.origin_y[None, :] + t * (directions @ self.y_axes.T)
+
+            valid = ((np.abs(denom) > 1e-9) & (t > 0) &
+                     (a >= 0) & (a <= self.sizes[:, 0]) & (b >= 0) & (b <= self.sizes[:, 1]))
+        t = np.where(valid, t, np.inf)
+
+        rows = np.arange(len(eyes))
+        best = np.argmin(t, axis=1)
+        hit = valid[rows, best]
+        screen_ids = np.where(hit, best, -1)
+
+        pixels = np.empty((len(eyes), 2))
+        pixels[:, 0] = a[rows, best] / self.sizes[best, 0] * self.pixels[best, 0]
+        pixels[:, 1] = b[rows, best] / self.sizes[best, 1] * self.pixels[best, 1]
+        pixels[~hit] = np.nan
+        return screen_ids, pixels
@@ -0,0 +1,40 @@
+import time
+from threading import Lock
+from types import MappingProxyType
+from typing import Any, NamedTuple
+
+
+class Snapshot(NamedTuple):
+    version: int
+    timestamp: float
+    data: Any
+
+
+class Publisher:
+    """Publishes immutable snapshots by swapping a single reference.
+
+    Readers take `current` without locking and always see one whole generation.
+    The lock only serialises writers so that read-modify-write updates are not lost."""
+
+    def __init__(self, data=None):
+        self.lock = Lock()
+        self.current = Snapshot(0, time.monotonic(), data)
+
+    def publish(self, data):
+        with self.lock:
+            self.current = Snapshot(self.current.version + 1, time.monotonic(), data)
+            return self.current
+
+    def update(self, **fields):
+        # data must be a NamedTuple; the other writers' fields are carried over
+        with self.lock:
+            data = self.current.data._replace(**fields)
+            self.current = Snapshot(self.current.version + 1, time.monotonic(), data)
+            return self.current
+
+    def read(self):
+        return self.current
+
+
+def frozen(mapping):
+    return MappingProxyType(dict(mapping))
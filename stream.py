@@ -3,10 +3,23 @@ import numpy as np
 from threading import Thread, Lock, Event
 import time
 import sys
+from typing import NamedTuple
+from channels import Channel, LATEST
+import affinity
+import calibration
+import profiling
+
+
+class Frame(NamedTuple):
+    index: int  # per camera, for matching profiling spans across stages
+    image: object
+
 
 class Camera:
-    def __init__(self, src, width, height):
-        if sys.platform.startswith("linux"):
+    def __init__(self, src, width, height, threaded=True, backend=None):
+        if backend is not None:
+            print(f"Backend is {backend}")
+        elif sys.platform.startswith("linux"):
             backend = cv2.CAP_V4L2
             print("Backend is linux")
         elif sys.platform == "darwin":
@@ -30,34 +43,50 @@ class Camera:
         self.success = False
         self.lock = Lock()
         self.new_frame = Event()
+        # Set once the first frame has arrived
+        self.ready = Event()
+        self.channels = []
+        self.frame_index = 0
 
-        Thread(target=self.update, args=(), daemon=True).start()
+        self.thread = None
+        if threaded:
+            self.thread = Thread(target=self.update, args=(), daemon=True)
+            self.thread.start()
 
     def undistort(self, calibration_file, alpha):
-        w = self.width
-        h = self.height
-        mtx, dist = self.load_coefficients(calibration_file)
-        self.newcameramtx, self.roi = cv2.getOptimalNewCameraMatrix(
-            mtx, dist, (w, h), alpha, (w, h))
-        self.mapx, self.mapy = cv2.initUndistortRectifyMap(
-            mtx, dist, None, self.newcameramtx, (w, h), cv2.CV_32FC1)
+        calib = calibration.load_calibration(calibration_file, self.width, self.height, alpha)
+        self.newcameramtx, self.roi = calib.new_camera_matrix, tuple(calib.roi)
+        self.mapx, self.mapy = calib.mapx, calib.mapy
         print('Undistorted camera matrix and distortion coefficients')
 
-    def load_coefficients(self, calibration_file):
-        cv_file = cv2.FileStorage(calibration_file, cv2.FILE_STORAGE_READ)
-        camera_matrix = cv_file.getNode("K").mat()
-        dist_matrix = cv_file.getNode("D").mat()
-        cv_file.release()
-        return [camera_matrix, dist_matrix]
+    def wait_ready(self, timeout=None):
+        return self.ready.wait(timeout)
 
-    def update(self):
-        while self.running:
+    def subscribe(self, name, capacity=1, policy=LATEST):
+        channel = Channel(name, capacity, policy)
+        self.channels.append(channel)
+        return channel
+
+    def capture(self):
+        self.frame_index += 1
+        with profiling.span('capture', self.frame_index):
             success, image = self.cap.read()
-            if not success:
-                continue
+        if success:
             with self.lock:
                 self.image = image
                 self.success = success
+            self.ready.set()
+            frame = Frame(self.frame_index, image)
+            for channel in self.channels:
+                channel.put(frame)
+        return success, image
+
+    def update(self):
+        affinity.apply('capture')
+        while self.running:
+            success, _ = self.capture()
+            if not success:
+                continue
             self.new_frame.set()
             time.sleep(0.01)
             self.new_frame.clear()
@@ -67,4 +96,9 @@ class Camera:
             return self.success, self.image
 
     def stop(self):
-        self.running = False
\ No newline at end of file
+        self.running = False
+        for channel in self.channels:
+            channel.close()
+        if self.thread is not None:
+            self.thread.join(timeout=1.0)
+        self.cap.release()
\ No newline at end of file
@@ -0,0 +1,418 @@
+import sys
+import time
+from typing import NamedTuple
+
+import numpy as np
+
+import calibration
+import detectors
+import pipeline
+from channels import Channel, LATEST
+from coordinates import Coordinates, BASELINE_DISTANCE
+from cursor import Cursor
+from handfit import WRIST, THUMB_MCP, THUMB_TIP, INDEX_TIP, MIDDLE_TIP, THUMB_RATIO, INDEX_RATIO
+from screens import Screen, ScreenLayout
+from snapshots import Publisher
+
+RATE = 30.0  # frames per second of synthetic time
+
+# Canonical right hand in metres: wrist at the origin, fingers along -y, palm facing +z, thumb towards +x.
+# Each finger: landmark indices (MCP, PIP, DIP, tip), MCP position, proximal and middle phalanx lengths.
+# Distal phalanges are INDEX_RATIO of the middle ones, so handfit's tip prediction agrees with the tips.
+FINGERS = (
+    ((5, 6, 7, 8), (0.022, -0.090), 0.040, 0.025),
+    ((9, 10, 11, 12), (0.000, -0.095), 0.045, 0.028),
+    ((13, 14, 15, 16), (-0.020, -0.090), 0.042, 0.026),
+    ((17, 18, 19, 20), (-0.038, -0.080), 0.032, 0.020),
+)
+THUMB_CMC = (0.025, -0.025)
+THUMB_MCP_POSITION = (0.045, -0.045)
+THUMB_OPEN_TIP = (0.075, -0.085)
+
+# Face keypoints relative to the eye midpoint of a head facing the camera: right eye, left eye,
+# nose tip, mouth centre, right ear, left ear. The person's right is the camera's -x.
+FACE_POINTS = np.array([(-0.032, 0.0, 0.0), (0.032, 0.0, 0.0), (0.0, 0.035, -0.03), (0.0, 0.07, -0.01),
+                        (-0.075, 0.02, 0.08), (0.075, 0.02, 0.08)])
+HEAD_BOX = ((-0.08, -0.09), (0.08, 0.11))  # metres around the eye midpoint, at eye depth
+
+PINCH_CLOSED = 0.01  # metres between thumb and index tips while pinching
+PINCH_OPEN = 0.06
+PINCH_PERIOD = 2.0  # seconds; each hand pinches once per period
+PINCH_DUTY = 0.3  # fraction of the period spent pinching
+REACH = (0.3, 0.45)  # metres from the eyes to the pinch point along the eye-target ray
+# Metres; with the wide baseline, hands closer than about 0.8 m are outside one of the two views
+DEPTH = (1.2, 2.8)
+MIN_SPACING = 0.35  # metres between people
+VISIBLE = 0.7  # people stand within this fraction of the half field of view
+GRID_HEIGHT = 0.4  # metres above and below the middle row that grid layouts use
+
+
+class Truth(NamedTuple):
+    hands: np.ndarray  # (N, 21, 3) landmarks in the camera frame, metres
+    people: np.ndarray  # (N,) person index of each hand
+    pinch: np.ndarray  # (N,) thumb-index tip distance
+    pressed: np.ndarray  # (N,) bool, pinched below the press threshold
+    screens: np.ndarray  # (N,) id of the screen each hand points at
+    targets: np.ndarray  # (N, 2) screen pixel each hand points at
+    eyes: np.ndarray  # (P, 3) eye midpoints
+    left_hands: np.ndarray  # (N,) bool, hand fully inside the left image
+    right_hands: np.ndarray  # (N,) bool
+
+
+class SyntheticFrame(NamedTuple):
+    index: int
+    timestamp: float
+    left: detectors.Detections
+    right: detectors.Detections
+    truth: Truth
+
+
+def canonical_hand(pinch):
+    """(21, 3) landmarks of the canonical right hand with the thumb tip pinch metres from the index tip."""
+    points = np.zeros((detectors.HAND_LANDMARKS, 3))
+    for (mcp, pip, dip, tip), base, proximal, middle in FINGERS:
+        x, y = base
+        points[mcp] = (x, y, 0)
+        points[pip] = (x, y - proximal, 0)
+        points[dip] = (x, y - proximal - middle, 0)
+        points[tip] = (x, y - proximal - middle * (1 + INDEX_RATIO), 0)
+    points[1] = (*THUMB_CMC, 0)
+    points[THUMB_MCP] = (*THUMB_MCP_POSITION, 0)
+    # The tip sits on the line from the index tip towards the open thumb tip, slightly in front of the palm
+    open_tip = np.array((*THUMB_OPEN_TIP, 0.01))
+    direction = open_tip - points[INDEX_TIP]
+    points[THUMB_TIP] = points[INDEX_TIP] + direction / np.linalg.norm(direction) * pinch
+    # The IP joint keeps the thumb straight, with the distal phalanx THUMB_RATIO of the proximal one
+    points[THUMB_TIP - 1] = points[THUMB_MCP] + (points[THUMB_TIP] - points[THUMB_MCP]) / (1 + THUMB_RATIO)
+    return points
+
+
+def pointing_rotation(forward):
+    """Rotation taking the canonical hand's fingers (-y) along forward."""
+    forward = forward / np.linalg.norm(forward)
+    y_axis = -forward
+    x_axis = np.cross((0.0, 1.0, 0.0), y_axis)
+    if np.linalg.norm(x_axis) < 1e-6:
+        x_axis = np.array((1.0, 0.0, 0.0))
+    x_axis /= np.linalg.norm(x_axis)
+    z_axis = np.cross(x_axis, y_axis)
+    return np.column_stack([x_axis, y_axis, z_axis])
+
+
+class StereoRig:
+    """The rectified stereo model Coordinates triangulates with, run forwards."""
+
+    def __init__(self, camera_matrix, width, height, baseline=BASELINE_DISTANCE, disparity_sign=1):
+        self.fx = camera_matrix[0, 0]
+        self.fy = camera_matrix[1, 1]
+        self.cx = camera_matrix[0, 2]
+        self.cy = camera_matrix[1, 2]
+        self.width = width
+        self.height = height
+        self.baseline = baseline
+        self.disparity_sign = disparity_sign or 1
+
+    @classmethod
+    def from_calibration(cls, calibration_file, width, height, **kwargs):
+        camera_matrix, _ = calibration.load_coefficients(calibration_file)
+        return cls(camera_matrix, width, height, **kwargs)
+
+    def project(self, points):
+        """(..., 3) camera-frame points -> exact (..., 2) left and right pixel positions."""
+        points = np.asarray(points, dtype=np.float64)
+        z = points[..., 2]
+        u = points[..., 0] * self.fx / z + self.cx
+        v = points[..., 1] * self.fy / z + self.cy
+        half = self.disparity_sign * self.baseline * self.fx / z / 2
+        return np.stack([u - half, v], axis=-1), np.stack([u + half, v], axis=-1)
+
+    def inside(self, pixels):
+        return ((pixels[..., 0] >= 0) & (pixels[..., 0] < self.width) &
+                (pixels[..., 1] >= 0) & (pixels[..., 1] < self.height))
+
+    def half_width(self, z):
+        # Half the horizontal field of view at depth z, in metres, for the view both cameras share
+        return (min(self.cx, self.width - self.cx) / self.fx) * z - self.baseline / 2
+
+
+class Scene:
+    """Deterministic people pointing at screens, rendered as both cameras' detector results.
+
+    Every person has eyes at a fixed spot and one or two hands on the ray from the eyes to a target
+    that moves over the screens. Each hand pinches once per PINCH_PERIOD. frame(index) gives the
+    left/right Detections of frame index at `rate` frames per second plus the ground truth; the same
+    seed always gives the same scene."""
+
+    def __init__(self, rig, screens, people=1, hands_per_person=1, seed=0, rate=RATE, noise=0.0,
+                 press_threshold=0.02, depth=None, grid=False):
+        self.rig = rig
+        self.screens = screens if isinstance(screens, ScreenLayout) else ScreenLayout(screens)
+        self.people = people
+        self.hands_per_person = hands_per_person
+        self.seed = seed
+        self.rate = rate
+        self.noise = noise  # pixels of Gaussian detector noise
+        self.press_threshold = press_threshold
+        # (near, far) metres people stand at; by default crowds spread further back
+        self.depth = depth or (DEPTH[0], min(DEPTH[1], DEPTH[0] + 0.1 * people))
+        # Evenly spaced rows and columns at the near depth instead of random spots, for crowds that
+        # do not fit MIN_SPACING apart
+        self.grid = grid
+
+        rng = np.random.default_rng(seed)
+        self.eyes = self.place_people(rng)
+        count = people * hands_per_person
+        self.hand_people = np.repeat(np.arange(people), hands_per_person)
+        self.hand_screens = rng.integers(0, len(self.screens), count)
+        self.frequencies = rng.uniform(0.05, 0.25, (count, 2))
+        self.phases = rng.uniform(0, 2 * np.pi, (count, 2))
+        self.pinch_phases = rng.uniform(0, 1, count)
+        self.reach = rng.uniform(*REACH, count)
+        # The second hand of a person is a left hand
+        self.handedness = np.where(np.arange(count) % hands_per_person == 0,
+                                   detectors.RIGHT_HAND, detectors.LEFT_HAND).astype(np.int8)
+
+    def place_people(self, rng):
+        screen_centre = (self.screens.origins + (self.screens.x_axes * self.screens.sizes[:, :1] +
+                                                 self.screens.y_axes * self.screens.sizes[:, 1:]) / 2).mean(axis=0)
+        if self.grid:
+            return self.grid_people(screen_centre)
+        eyes = []
+        for _ in range(self.people):
+            for _ in range(100):
+                z = rng.uniform(*self.depth)
+                half = max(self.rig.half_width(z) * VISIBLE, 0.05)
+                eye = np.array((screen_centre[0] + rng.uniform(-half, half),
+                                screen_centre[1] - 0.15 + rng.uniform(-0.05, 0.05), z))
+                if all(np.linalg.norm(eye - other) >= MIN_SPACING for other in eyes):
+                    break
+            eyes.append(eye)
+        return np.array(eyes).reshape(-1, 3)
+
+    def grid_people(self, screen_centre):
+        z = self.depth[0]
+        width = 2 * self.rig.half_width(z) * VISIBLE
+        height = 2 * GRID_HEIGHT
+
+        def spacing(columns):
+            rows = -(-self.people // columns)
+            return min(width / max(columns - 1, 1), height / max(rows - 1, 1))
+
+        columns = max(range(1, self.people + 1), key=spacing)
+        rows = -(-self.people // columns)
+        row, column = np.divmod(np.arange(self.people), columns)
+        x = np.linspace(-width / 2, width / 2, columns)[column] if columns > 1 else np.zeros(self.people)
+        y = np.linspace(-height / 2, height / 2, rows)[row] if rows > 1 else np.zeros(self.people)
+        return np.column_stack([screen_centre[0] + x, screen_centre[1] - 0.15 + y, np.full(self.people, z)])
+
+    def targets(self, t):
+        # Lissajous paths over the middle 80% of each hand's screen
+        u = 0.5 + 0.4 * np.sin(2 * np.pi * self.frequencies[:, 0] * t + self.phases[:, 0])
+        v = 0.5 + 0.4 * np.sin(2 * np.pi * self.frequencies[:, 1] * t + self.phases[:, 1])
+        s = self.hand_screens
+        points = (self.screens.origins[s] + self.screens.x_axes[s] * (u * self.screens.sizes[s, 0])[:, None] +
+                  self.screens.y_axes[s] * (v * self.screens.sizes[s, 1])[:, None])
+        return points, np.column_stack([u, v]) * self.screens.pixels[s]
+
+    def pinches(self, t):
+        closed = (t / PINCH_PERIOD + self.pinch_phases) % 1.0 < PINCH_DUTY
+        return np.where(closed, PINCH_CLOSED, PINCH_OPEN)
+
+    def hands(self, t):
+        """(N, 21, 3) camera-frame landmarks at time t, with the targets and pinch distances."""
+        targets, pixels = self.targets(t)
+        pinch = self.pinches(t)
+        eyes = self.eyes[self.hand_people]
+        rays = targets - eyes
+        pinch_points = eyes + rays / np.linalg.norm(rays, axis=1, keepdims=True) * self.reach[:, None]
+        hands = np.empty((len(targets), detectors.HAND_LANDMARKS, 3))
+        for i, (ray, distance) in enumerate(zip(rays, pinch)):
+            local = canonical_hand(distance)
+            if self.handedness[i] == detectors.LEFT_HAND:
+                local[:, 0] = -local[:, 0]
+            local -= (local[THUMB_TIP] + local[INDEX_TIP]) / 2
+            hands[i] = local @ pointing_rotation(ray).T + pinch_points[i]
+        return hands, pixels, pinch
+
+    def hand_arrays(self, hands, pixels, visible):
+        rig = self.rig
+        wrist_z = hands[visible, WRIST, 2:3]
+        landmarks = np.empty((int(visible.sum()), detectors.HAND_LANDMARKS, 3), np.float32)
+        landmarks[:, :, :2] = pixels[visible] / (rig.width, rig.height)
+        # Relative depth in roughly image-width units, like the MediaPipe z
+        landmarks[:, :, 2] = (hands[visible, :, 2] - wrist_z) * rig.fx / wrist_z / rig.width
+        return detectors.HandArrays(landmarks, self.handedness[visible],
+                                    np.ones(len(landmarks), np.float32))
+
+    def face_arrays(self, keypoints, boxes, visible):
+        rig = self.rig
+        size = np.array((rig.width, rig.height))
+        corners = boxes[visible] / np.tile(size, 2)
+        return detectors.FaceArrays((keypoints[visible] / size).astype(np.float32),
+                                    np.column_stack([corners[:, :2], corners[:, 2:] - corners[:, :2]])
+                                    .astype(np.float32),
+                                    np.ones(int(visible.sum()), np.float32))
+
+    def frame(self, index):
+        t = index / self.rate
+        hands, targets, pinch = self.hands(t)
+        left_hands, right_hands = self.rig.project(hands)
+        faces = self.eyes[:, None, :] + FACE_POINTS
+        left_faces, right_faces = self.rig.project(faces)
+        head = self.eyes[:, None, :] + np.array([(x, y, 0.0) for x, y in HEAD_BOX])
+        left_boxes, right_boxes = (b.reshape(-1, 4) for b in self.rig.project(head))
+
+        if self.noise:
+            rng = np.random.default_rng((self.seed, index))
+            left_hands, right_hands, left_faces, right_faces = (
+                p + rng.normal(0, self.noise, p.shape)
+                for p in (left_hands, right_hands, left_faces, right_faces))
+
+        # A detector only reports hands and faces that are fully in view
+        left_visible = self.rig.inside(left_hands).all(axis=1)
+        right_visible = self.rig.inside(right_hands).all(axis=1)
+        left_face_visible = self.rig.inside(left_faces[:, :2]).all(axis=1)
+        right_face_visible = self.rig.inside(right_faces[:, :2]).all(axis=1)
+
+        left = detectors.Detections(self.hand_arrays(hands, left_hands, left_visible),
+                                    self.face_arrays(left_faces, left_boxes, left_face_visible))
+        right = detectors.Detections(self.hand_arrays(hands, right_hands, right_visible),
+                                     self.face_arrays(right_faces, right_boxes, right_face_visible))
+        truth = Truth(hands, self.hand_people, pinch, pinch < self.press_threshold, self.hand_screens, targets,
+                      self.eyes, left_visible, right_visible)
+        return SyntheticFrame(index, t, left, right, truth)
+
+
+def scene_from_config(config, people=1, hands_per_person=1, seed=0, rate=RATE, noise=0.0, depth=None, grid=False):
+    """A Scene for the rig and screen of a validated pipeline config."""
+    capture = config['capture']
+    screen = config['screen']
+    rig = StereoRig.from_calibration(capture['left']['calibration'], capture['width'], capture['height'],
+                                     disparity_sign=config['triangulation']['disparity_sign'])
+    physical_width, physical_height = pipeline.get_monitor_dimensions(screen['diagonal_inches'],
+                                                                      *screen['aspect_ratio'])
+    x, y, z = screen['camera_offset']
+    screens = [Screen.from_camera_offset(x, y, z, physical_width, physical_height,
+                                         screen['pixel_width'], screen['pixel_height'])]
+    return Scene(rig, screens, people, hands_per_person, seed, rate, noise,
+                 config['cursor']['press_threshold'], depth, grid)
+
+
+def coordinates_from_config(config, scene, left_detector=None, right_detector=None, threaded=False):
+    """Coordinates over the scene's rig and screens; unthreaded ones are driven with compute()."""
+    capture = config['capture']
+    return Coordinates(left_detector, right_detector, capture['width'], capture['height'],
+                       capture['left']['calibration'], screens=scene.screens, threaded=threaded,
+                       **config['triangulation'])
+
+
+def cursor_from_config(config, coords, mice=None):
+    cursor = config['cursor']
+    return Cursor(coords, mice or cursor['mice'], cursor['max_x_dist'], cursor['max_y_dist'], cursor['timeout'],
+                  cursor['press_threshold'], cursor['unpress_threshold'], cursor['unpress_frames'])
+
+
+class SyntheticTracker:
+    """Stands in for a detectors.Tracker: publishes whatever Detections it is fed."""
+
+    def __init__(self):
+        self.results = Publisher(detectors.Detections(detectors.NO_HANDS, detectors.NO_FACES))
+        self.channels = []
+
+    def feed(self, detections):
+        snapshot = self.results.publish(detections)
+        for channel in self.channels:
+            channel.put(snapshot)
+
+    def subscribe(self, name, capacity=1, policy=LATEST):
+        channel = Channel(name, capacity, policy)
+        self.channels.append(channel)
+        return channel
+
+    def wait_ready(self, timeout=None):
+        return True
+
+    def get_results(self):
+        return self.results.read().data
+
+    def get_snapshot(self):
+        return self.results.read()
+
+    def stop(self):
+        for channel in self.channels:
+            channel.close()
+
+
+def play(scene, left, right, frames, realtime=True):
+    """Feeds frames of the scene to two SyntheticTrackers, at the scene rate or as fast as possible."""
+    start = time.perf_counter()
+    for index in range(frames):
+        frame = scene.frame(index)
+        if realtime:
+            delay = start + frame.timestamp - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        left.feed(frame.left)
+        right.feed(frame.right)
+
+
+def match(truth_points, points):
+    # Greedy nearest pairs between ground-truth and measured points, as (truth index, measured index)
+    pairs = []
+    if not len(truth_points) or not len(points):
+        return pairs
+    cost = np.linalg.norm(np.asarray(truth_points)[:, None] - np.asarray(points)[None], axis=2)
+    while np.isfinite(cost).any():
+        i, j = np.unravel_index(np.argmin(cost), cost.shape)
+        pairs.append((i, j))
+        cost[i, :] = np.inf
+        cost[:, j] = np.inf
+    return pairs
+
+
+def main():
+    # Usage: python synthetic.py [people] [frames] [noise pixels]
+    # Runs the scene through Coordinates and Cursor offline and reports the error against the ground truth
+    people = int(sys.argv[1]) if len(sys.argv) > 1 else 2
+    frames = int(sys.argv[2]) if len(sys.argv) > 2 else 300
+    noise = float(sys.argv[3]) if len(sys.argv) > 3 else 0.0
+    config = pipeline.load_config()
+    scene = scene_from_config(config, people=people, noise=noise)
+    coords = coordinates_from_config(config, scene)
+    cursor = cursor_from_config(config, coords, mice=people * scene.hands_per_person)
+
+    tip_errors = []
+    pixel_errors = []
+    press_agreement = []
+    for index in range(frames):
+        frame = scene.frame(index)
+        hands_3d, _ = coords.compute(frame.left, frame.right)
+        cursor.step(frame.timestamp)
+        truth = frame.truth
+
+        measured = list(hands_3d.values())
+        pairs = match(truth.hands[:, INDEX_TIP], [(h['index_tip'].x, h['index_tip'].y, h['index_tip'].z)
+                                                  for h in measured])
+        for i, j in pairs:
+            for name, landmark in (('thumb_tip', THUMB_TIP), ('index_tip', INDEX_TIP), ('middle_tip', MIDDLE_TIP)):
+                p = measured[j][name]
+                tip_errors.append(np.linalg.norm(truth.hands[i, landmark] - (p.x, p.y, p.z)))
+
+        pixels = coords.getOnScrenPixels()
+        for i, j in match(truth.targets, [(p['position'].x, p['position'].y) for p in pixels]):
+            pixel_errors.append(np.linalg.norm(truth.targets[i] - (pixels[j]['position'].x, pixels[j]['position'].y)))
+        mice = [m for m in cursor.get_mice().values() if m.position is not None]
+        for i, j in match(truth.targets, [(m.position.x, m.position.y) for m in mice]):
+            press_agreement.append(mice[j].pressed == truth.pressed[i])
+
+    print(f'{people} people, {frames} frames, {noise} px noise')
+    print(f'Fingertips: {len(tip_errors)} matched, mean error {np.mean(tip_errors) * 1000:.2f} mm, '
+          f'max {np.max(tip_errors) * 1000:.2f} mm' if tip_errors else 'Fingertips: none matched')
+    print(f'Screen points: {len(pixel_errors)} matched, mean error {np.mean(pixel_errors):.2f} px, '
+          f'max {np.max(pixel_errors):.2f} px' if pixel_errors else 'Screen points: none matched')
+    if press_agreement:
+        print(f'Press state agrees with the ground truth in {np.mean(press_agreement) * 100:.1f}% of mouse frames')
+
+
+if __name__ == '__main__':
+    main()
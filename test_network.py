@@ -0,0 +1,131 @@
+import math
+import socket
+import struct
+
+from coordinates import Points3D
+from cursor import MouseState
+from network import FrameEncoder, NetworkPublisher, RemoteCoordinates, HEADER
+from screens import Screen
+from snapshots import frozen
+from utils import Point2D, Point3D
+
+# Same single screen as the demos
+MONITOR_WIDTH = 1920
+MONITOR_HEIGHT = 1080
+
+
+def make_points(step):
+    # One hand moving right in front of one face
+    x = -0.1 + 0.005 * step
+    hand = {'wrist': Point3D(x, 0.1, 0.45), 'thumb_tip': Point3D(x + 0.02, 0.05, 0.4),
+            'index_tip': Point3D(x + 0.03, 0.04, 0.4), 'middle_tip': Point3D(x + 0.04, 0.05, 0.41),
+            'confidence': 0.9}
+    return Points3D(frozen({'Hand 3': frozen(hand)}), frozen({'Face 1': Point3D(0.0, 0.0, 0.7)}))
+
+
+def close(a, b, tolerance=1e-3):
+    return all(abs(getattr(a, axis) - getattr(b, axis)) <= tolerance for axis in ('x', 'y', 'z') if hasattr(a, axis))
+
+
+def loopback(delta=True, keyframe_interval=10, screens=None):
+    # A local socket pair stands in for the network
+    server_sock, client_sock = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+    publisher = NetworkPublisher(None, sock=server_sock, delta=delta, keyframe_interval=keyframe_interval,
+                                 threaded=False)
+    client = RemoteCoordinates(sock=client_sock, screens=screens, threaded=False)
+    return publisher, client
+
+
+def test_loopback():
+    screen = Screen.from_camera_offset(-0.29, 0.03, -0.015, 23.53, 13.24, MONITOR_WIDTH, MONITOR_HEIGHT)
+    publisher, client = loopback(screens=[screen])
+    channel = client.subscribe('test points')
+
+    sizes = []
+    for step in range(25):
+        points = make_points(step)
+        mice = frozen({0: MouseState(Point2D(100.0 + step, 200.0), step % 2 == 0, 0.015, 'Hand 3', 0),
+                       1: MouseState(None, False, None, None, 0)})
+        payload = publisher.send(points, mice)
+        sizes.append(len(payload))
+
+        # Frame 12 never arrives
+        if step == 12:
+            client.sock.recv(65507)
+            continue
+        assert client.receive(timeout=1.0), f"Frame {step} was not decoded"
+
+        received = client.get3DCoordinates()
+        assert list(received.hands) == ['Hand 3'] and list(received.faces) == ['Face 1']
+        hand = received.hands['Hand 3']
+        for name in ('wrist', 'thumb_tip', 'index_tip', 'middle_tip'):
+            assert close(hand[name], points.hands['Hand 3'][name]), f"{name} differs at frame {step}"
+        assert close(received.faces['Face 1'], points.faces['Face 1'])
+        assert channel.get_nowait() is not None
+
+        remote_mice = client.get_mice()
+        assert close(remote_mice[0].position, mice[0].position)
+        assert remote_mice[0].pressed == mice[0].pressed and remote_mice[0].track == 'Hand 3'
+        assert remote_mice[1].position is None and remote_mice[1].pinch_distance is None
+
+        pixels = client.getOnScrenPixels()
+        assert len(pixels) == 1 and pixels[0]['id'] == 'Hand 3'
+        assert math.isclose(pixels[0]['pinch_distance'], math.sqrt(2) * 0.01, abs_tol=1e-4)
+
+    stats = client.stats()
+    print(f"Frame sizes: keyframe {sizes[0]} bytes, delta {sizes[1]} bytes (header {HEADER.size})")
+    print(f"Client stats: {stats}")
+    assert sizes[1] < sizes[0]
+    assert stats['lost'] == 1 and stats['late'] == 0 and stats['missing_keyframe'] == 0
+
+    publisher.stop()
+    client.stop()
+
+
+def test_lost_keyframe():
+    publisher, client = loopback(keyframe_interval=5)
+    for step in range(12):
+        publisher.send(make_points(step))
+        # The second keyframe never arrives
+        if step == 5:
+            client.sock.recv(65507)
+            continue
+        decoded = client.receive(timeout=1.0)
+        # Its delta frames cannot be decoded, the next keyframe recovers
+        assert decoded == (step < 5 or step >= 10), f"Frame {step} decoded: {decoded}"
+
+    stats = client.stats()
+    assert stats['lost'] == 1 and stats['missing_keyframe'] == 4
+    assert close(client.get3DCoordinates().hands['Hand 3']['wrist'], make_points(11).hands['Hand 3']['wrist'])
+    publisher.stop()
+    client.stop()
+
+
+def test_undecodable():
+    publisher, client = loopback()
+    # Stray, truncated and foreign datagrams are counted and skipped
+    for payload in (b'xx', bytes(40), FrameEncoder().encode(make_points(0))[:HEADER.size + 10]):
+        publisher.sock.send(payload)
+        assert not client.receive(timeout=1.0)
+    publisher.send(make_points(1))
+    assert client.receive(timeout=1.0)
+
+    # A delta against the right keyframe but for a track the keyframe does not have
+    payload = bytearray(publisher.encoder.encode(make_points(2)))
+    struct.pack_into('<i', payload, HEADER.size, 99)
+    publisher.sock.send(payload)
+    assert not client.receive(timeout=1.0)
+    publisher.send(make_points(3))
+    assert client.receive(timeout=1.0)
+
+    stats = client.stats()
+    assert stats['undecodable'] == 4 and stats['received'] == 2 and stats['lost'] == 1
+    publisher.stop()
+    client.stop()
+
+
+if __name__ == "__main__":
+    test_loopback()
+    test_lost_keyframe()
+    test_undecodable()
+    print("Loopback tests passed")
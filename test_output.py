@@ -0,0 +1,52 @@
+import gestures
+from cursor import MouseState
+from output import PointerOutput, MemorySink, EV_SYN, EV_KEY, EV_ABS, SYN_REPORT, ABS_X, ABS_Y, BTN_LEFT
+from screens import ScreenLayout
+from utils import Point2D
+
+# Same single screen as the demos
+MONITOR_WIDTH = 1920
+MONITOR_HEIGHT = 1080
+
+SYN_EVENT = (EV_SYN, SYN_REPORT, 0)
+
+
+def mouse(x, y, screen_id=0):
+    return MouseState(Point2D(x, y), False, None, None, screen_id)
+
+
+def event(kind, slot):
+    return gestures.GestureEvent(kind, slot, 0.0, 0.0, 0.0)
+
+
+def test_one_write_per_device_per_tick():
+    output = PointerOutput(2, MONITOR_WIDTH, MONITOR_HEIGHT, sink=MemorySink, mirror=False)
+    # A click inside one tick needs a report between the press and the release
+    output.apply({0: mouse(100, 200), 1: mouse(300, 400)}, [event(gestures.DOWN, 0), event(gestures.UP, 0)])
+    assert output.sinks[0].events() == [[(EV_ABS, ABS_X, 100), (EV_ABS, ABS_Y, 200), (EV_KEY, BTN_LEFT, 1),
+                                         SYN_EVENT, (EV_KEY, BTN_LEFT, 0), SYN_EVENT]]
+    assert output.sinks[1].events() == [[(EV_ABS, ABS_X, 300), (EV_ABS, ABS_Y, 400), SYN_EVENT]]
+
+    # Unchanged axes are left out, unchanged pointers are not written at all
+    output.apply({0: mouse(100, 250), 1: mouse(300, 400)}, [])
+    assert output.sinks[0].events()[1:] == [[(EV_ABS, ABS_Y, 250), SYN_EVENT]]
+    assert len(output.sinks[1].writes) == 1
+
+
+def test_screens_tile_the_desktop():
+    layout = ScreenLayout.grid(1, 2, (0.0, 0.0, 0.0), 0.5, 0.3, MONITOR_WIDTH, MONITOR_HEIGHT, bezel=0.01)
+    offsets = layout.desktop_offsets()
+    assert offsets == {0: (0, 0), 1: (MONITOR_WIDTH, 0)}
+
+    output = PointerOutput(1, MONITOR_WIDTH, MONITOR_HEIGHT, sink=MemorySink, screen_offsets=offsets)
+    assert (output.sinks[0].width, output.sinks[0].height) == (2 * MONITOR_WIDTH, MONITOR_HEIGHT)
+    # Mirrored within its own screen, the left edge of screen 1 is the right edge of the desktop
+    assert output.desktop_position(mouse(0, 10, screen_id=1)) == (2 * MONITOR_WIDTH - 1, 10)
+    assert output.desktop_position(mouse(MONITOR_WIDTH - 1, 10, screen_id=1)) == (MONITOR_WIDTH, 10)
+    assert output.desktop_position(mouse(-50, 10, screen_id=0)) == (MONITOR_WIDTH - 1, 10)
+
+
+if __name__ == "__main__":
+    test_one_write_per_device_per_tick()
+    test_screens_tile_the_desktop()
+    print("Output tests passed")
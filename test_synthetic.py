@@ -0,0 +1,116 @@
+import numpy as np
+
+import pipeline
+import synthetic
+from cursor import FRAME_TIME
+from handfit import THUMB_TIP, INDEX_TIP, MIDDLE_TIP
+
+FRAMES = 120
+PINKY_MCP = 17
+TIPS = (('thumb_tip', THUMB_TIP), ('index_tip', INDEX_TIP), ('middle_tip', MIDDLE_TIP))
+
+
+def run(people, hands_per_person=1, frames=FRAMES):
+    # Coordinates and Cursor driven offline over a noiseless scene, one frame at a time
+    config = pipeline.load_config()
+    scene = synthetic.scene_from_config(config, people=people, hands_per_person=hands_per_person)
+    coords = synthetic.coordinates_from_config(config, scene)
+    cursor = synthetic.cursor_from_config(config, coords, mice=people * hands_per_person)
+    for index in range(frames):
+        frame = scene.frame(index)
+        hands_3d, _ = coords.compute(frame.left, frame.right)
+        cursor.step(frame.timestamp)
+        yield config, scene, frame, hands_3d, coords.getOnScrenPixels(), cursor.get_mice()
+
+
+def test_same_seed_same_scene():
+    config = pipeline.load_config()
+    first, second = (synthetic.scene_from_config(config, people=3, seed=7).frame(42) for _ in range(2))
+    assert np.array_equal(first.truth.hands, second.truth.hands)
+    assert np.array_equal(first.left.hands.landmarks, second.left.hands.landmarks)
+    assert np.array_equal(first.right.faces.keypoints, second.right.faces.keypoints)
+
+
+def visible(truth):
+    # Hands the detectors report in both views
+    return np.flatnonzero(truth.left_hands & truth.right_hands)
+
+
+def truth_index(truth, hand):
+    # The ground-truth hand a measured hand belongs to, by nearest index tip
+    tip = (hand['index_tip'].x, hand['index_tip'].y, hand['index_tip'].z)
+    return int(np.argmin(np.linalg.norm(truth.hands[:, INDEX_TIP] - tip, axis=1)))
+
+
+def check_exact(people):
+    for _, _, frame, hands_3d, pixels, _ in run(people):
+        truth = frame.truth
+        # New tracks are confirmed on their second frame
+        if frame.index >= 2:
+            assert len(hands_3d) == len(visible(truth)), f'hands are missing in frame {frame.index}'
+        for hand in hands_3d.values():
+            i = truth_index(truth, hand)
+            for name, landmark in TIPS:
+                p = hand[name]
+                assert np.linalg.norm(truth.hands[i, landmark] - (p.x, p.y, p.z)) < 1e-6, \
+                    f'{name} of hand {i} is off in frame {frame.index}'
+        for point in pixels:
+            i = truth_index(truth, hands_3d[point['id']])
+            position = point['position']
+            assert np.linalg.norm(truth.targets[i] - (position.x, position.y)) < 1e-2, \
+                f'screen point of hand {i} is off in frame {frame.index}'
+            assert point['screen_id'] == truth.screens[i]
+
+
+def test_one_person_is_exact():
+    check_exact(1)
+
+
+def test_two_people_are_exact():
+    check_exact(2)
+
+
+def test_one_rejected_landmark_keeps_the_hand():
+    config = pipeline.load_config()
+    scene = synthetic.scene_from_config(config, people=1)
+    coords = synthetic.coordinates_from_config(config, scene)
+    for index in range(5):
+        frame = scene.frame(index)
+        # Zero disparity on the pinky knuckle puts it outside the depth range
+        right_hands = frame.right.hands._replace(landmarks=frame.right.hands.landmarks.copy())
+        right_hands.landmarks[:, PINKY_MCP, 0] = frame.left.hands.landmarks[:, PINKY_MCP, 0]
+        coords.compute(frame.left, frame.right._replace(hands=right_hands))
+        pixels = coords.getOnScrenPixels()
+        assert coords.rejections == {'landmarks': 1, 'hands': 0, 'faces': 0}
+    assert len(pixels) == 1
+    position = pixels[0]['position']
+    assert np.linalg.norm(frame.truth.targets[0] - (position.x, position.y)) < 1.0
+
+
+def test_press_state_follows_the_pinch():
+    checked = 0
+    for config, scene, frame, hands_3d, pixels, mice in run(2):
+        # Releases are held for unpress_frames, so frames within that time of a pinch change are skipped
+        steady = config['cursor']['unpress_frames'] * FRAME_TIME + 1 / scene.rate
+        window = np.arange(max(frame.timestamp - steady, 0), frame.timestamp, 1 / scene.rate)
+        changed = np.array([scene.pinches(t) != frame.truth.pinch for t in window]).any(axis=0)
+        mapped = {point['id'] for point in pixels}
+        for mouse in mice.values():
+            # Mice keep their last state for a while after their hand stops pointing at a screen
+            if mouse.track not in mapped:
+                continue
+            i = truth_index(frame.truth, hands_3d[mouse.track])
+            if changed[i]:
+                continue
+            assert mouse.pressed == frame.truth.pressed[i], f'hand {i} press state is wrong in frame {frame.index}'
+            checked += 1
+    assert checked > FRAMES
+
+
+if __name__ == '__main__':
+    test_same_seed_same_scene()
+    test_one_person_is_exact()
+    test_two_people_are_exact()
+    test_one_rejected_landmark_keeps_the_hand()
+    test_press_state_follows_the_pinch()
+    print('Synthetic scene tests passed')
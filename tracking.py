@@ -0,0 +1,91 @@
+import itertools
+
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+# Gating and motion model parameters, in metres and seconds
+GATE_DISTANCE = 0.15
+GATE_GROWTH = 1.5
+MAX_AGE = 0.5
+MIN_HITS = 2
+ALPHA = 0.6
+BETA = 0.2
+
+
+class Track:
+    def __init__(self, track_id, position, timestamp):
+        self.track_id = track_id
+        self.position = np.asarray(position, dtype=float)
+        self.velocity = np.zeros(3)
+        self.time = timestamp
+        self.hits = 1
+
+    def predict(self, timestamp):
+        return self.position + self.velocity * (timestamp - self.time)
+
+    def correct(self, position, timestamp, alpha, beta):
+        dt = timestamp - self.time
+        predicted = self.predict(timestamp)
+        residual = np.asarray(position, dtype=float) - predicted
+        self.position = predicted + alpha * residual
+        if dt > 0:
+            self.velocity = self.velocity + (beta / dt) * residual
+        self.time = timestamp
+        self.hits += 1
+
+
+class MultiTracker:
+    """Keeps stable ids for 3D points with an alpha-beta motion model and metric gating."""
+
+    def __init__(self, gate_distance=GATE_DISTANCE, gate_growth=GATE_GROWTH, max_age=MAX_AGE,
+                 min_hits=MIN_HITS, alpha=ALPHA, beta=BETA):
+        self.gate_distance = gate_distance
+        self.gate_growth = gate_growth
+        self.max_age = max_age
+        self.min_hits = min_hits
+        self.alpha = alpha
+        self.beta = beta
+
+        self.tracks = []
+        self.ids = itertools.count()
+
+    def update(self, positions, timestamp):
+        """Returns the track id of each position, or None while its track is unconfirmed."""
+        positions = np.asarray(positions, dtype=float).reshape(-1, 3)
+        self.tracks = [t for t in self.tracks if timestamp - t.time <= self.max_age]
+
+        assignment = [None] * len(positions)
+        matched = set()
+        if self.tracks and len(positions):
+            predicted = np.array([t.predict(timestamp) for t in self.tracks])
+            gates = np.array([self.gate_distance + self.gate_growth * (timestamp - t.time)
+                              for t in self.tracks])
+            cost = np.linalg.norm(predicted[:, None, :] - positions[None, :, :], axis=2)
+            gated = ~(cost <= gates[:, None])
+            cost[gated] = 1e6
+
+            rows, cols = linear_sum_assignment(cost)
+            for row, col in zip(rows, cols):
+                if gated[row, col]:
+                    continue
+                track = self.tracks[row]
+                track.correct(positions[col], timestamp, self.alpha, self.beta)
+                assignment[col] = track
+                matched.add(col)
+
+        for idx, position in enumerate(positions):
+            if idx in matched:
+                continue
+            track = Track(next(self.ids), position, timestamp)
+            self.tracks.append(track)
+            assignment[idx] = track
+
+        return [t.track_id if t.hits >= self.min_hits else None for t in assignment]
+
+    def snapshot(self):
+        """Copies of the confirmed tracks' motion state as (id, position, velocity, time) tuples.
+
+        Track.correct updates a track in several steps, so other threads predict from a snapshot
+        taken on the updating thread instead of reading the live tracks."""
+        return tuple((t.track_id, t.position.copy(), t.velocity.copy(), t.time)
+                     for t in self.tracks if t.hits >= self.min_hits)
@@ -1,13 +1,26 @@
 import math
 
+import numpy as np
+
+
+# Plausible working volume for triangulated points, in meters
+MIN_DEPTH = 0.1
+MAX_DEPTH = 3.0
+
 
 class Calculate:
-    def __init__(self, focal_length_x, focal_length_y, baseline_distance, c_x, c_y):
+    def __init__(self, focal_length_x, focal_length_y, baseline_distance, c_x, c_y,
+                 min_depth=MIN_DEPTH, max_depth=MAX_DEPTH, disparity_sign=0):
         self.focal_length_x = focal_length_x  # pixels
         self.focal_length_y = focal_length_y
         self.baseline_distance = baseline_distance  # meters
         self.c_x = c_x  # pixels
         self.c_y = c_y  # pixels
+        self.min_depth = min_depth
+        self.max_depth = max_depth
+        # Expected sign of p2.x - p1.x; 0 accepts either sign like the abs() of getZDistanceFrom.
+        # Either sign is the default until it has been measured on the rig.
+        self.disparity_sign = disparity_sign
 
     def getZDistanceFrom(self, p1, p2):
         disparity = abs(p2.x - p1.x)
@@ -25,6 +38,39 @@ class Calculate:
         y = (u_y * z) / self.focal_length_y
 
         return Point3D(x, y, z)
+
+    def triangulate(self, p1, p2):
+        """Vectorised, validated getCoordinatesFrom over (..., 2) pixel arrays.
+
+        Pairs with the wrong disparity sign or a depth outside [min_depth, max_depth] are rejected
+        instead of becoming inf or mirrored points. Returns (..., 3) points, NaN where rejected,
+        and the (...) mask of accepted pairs."""
+        p1 = np.asarray(p1, dtype=np.float64)
+        p2 = np.asarray(p2, dtype=np.float64)
+        disparity = p2[..., 0] - p1[..., 0]
+        if self.disparity_sign == 0:
+            disparity = np.abs(disparity)
+        else:
+            disparity = disparity * self.disparity_sign
+
+        # The depth range as a disparity range, so nothing is ever divided by zero
+        depth_scale = self.baseline_distance * self.focal_length_x
+        with np.errstate(invalid='ignore'):
+            valid = (disparity >= depth_scale / self.max_depth) & (disparity <= depth_scale / self.min_depth)
+        z = depth_scale / np.where(valid, disparity, np.nan)
+
+        u_x = (p1[..., 0] + p2[..., 0]) / 2 - self.c_x
+        u_y = (p1[..., 1] + p2[..., 1]) / 2 - self.c_y
+        x = (u_x * z) / self.focal_length_x
+        y = (u_y * z) / self.focal_length_y
+        return np.stack([x, y, z], axis=-1), valid
+
+    def getImagePointFrom(self, p):
+        disparity = (self.baseline_distance * self.focal_length_x) / p.z
+        u = (p.x * self.focal_length_x) / p.z + self.c_x
+        v = (p.y * self.focal_length_y) / p.z + self.c_y
+        return Point2D(u, v), disparity
+
     def getXYIntersection(self, p1, p2):
         if p2.z == p1.z:
             return Point2D(p1.x, p1.y)